@@ -0,0 +1,30 @@
+"""Runs main.py against the loopback stand-ins instead of the internet servers.
+
+    python -m benchmarks.hermetic_main '<endpoints json>' [main.py arguments]
+
+Settings are patched before any core module is imported, so every default that is
+bound at import time points at loopback.
+"""
+import json
+import os
+import runpy
+import sys
+from config import settings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if __name__ == "__main__":
+    endpoints = json.loads(sys.argv[1])
+    settings.DOWNLOAD_URLS = [endpoints["http_range"]]
+    # Without an iperf3 server, the iPerf3 transfers are refused at once and report no result
+    iperf_port = endpoints.get("iperf", endpoints["tcp_accept"])
+    settings.UPLOAD_SERVERS = [{"host": "127.0.0.1", "port": iperf_port, "upload_url": endpoints["http_upload"]}]
+    settings.LATENCY_TEST_HOSTS = ["127.0.0.1"]
+    settings.BUFFERBLOAT_TARGET = ("127.0.0.1", endpoints["tcp_accept"])
+    settings.UDP_REFLECTOR = ("127.0.0.1", endpoints["udp_reflector"])
+
+    import core.download
+    core.download.IPERF_PORT = iperf_port
+
+    sys.argv = [os.path.join(ROOT, "main.py")] + sys.argv[2:]
+    runpy.run_path(sys.argv[0], run_name="__main__")
@@ -0,0 +1,128 @@
+"""Local stand-in servers shared by the benchmarks and the loopback tests."""
+import re
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BLOCK = memoryview(bytes(256 * 1024))
+RANGE_RE = re.compile(r"bytes=(\d+)-(\d*)")
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    """Serves a virtual all-zero object of server.object_size bytes with byte-range support."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_body(self, length):
+        while length > 0:
+            chunk = BLOCK[:min(length, len(BLOCK))]
+            self.wfile.write(chunk)
+            length -= len(chunk)
+            if self.server.rate:
+                time.sleep(len(chunk) / self.server.rate)
+
+    def do_GET(self):
+        size = self.server.object_size
+        match = RANGE_RE.fullmatch(self.headers.get("Range", "")) if self.server.ranges else None
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)) if match.group(2) else size - 1, size - 1)
+            if start >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            length = end - start + 1
+        else:
+            self.send_response(200)
+            length = size
+        self.send_header("Content-Length", str(length))
+        self.end_headers()
+        self._send_body(length)
+
+def start_http_range_server(object_size, ranges=True, rate=None):
+    """Starts a threaded HTTP server on loopback, sending at most rate bytes/s per response
+    when given; returns (server, url)."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RangeRequestHandler)
+    server.daemon_threads = True
+    server.object_size = object_size
+    server.ranges = ranges
+    server.rate = rate
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/1GB.bin"
+
+class _SinkHandler(socketserver.BaseRequestHandler):
+    """Reads and discards everything a client sends, counting the bytes."""
+
+    def handle(self):
+        buffer = memoryview(bytearray(256 * 1024))
+        received = 0
+        while True:
+            n = self.request.recv_into(buffer)
+            if not n:
+                break
+            received += n
+        with self.server.lock:
+            self.server.received += received
+
+def start_tcp_sink():
+    """Starts a TCP discard server on loopback; returns (server, port)."""
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _SinkHandler)
+    server.daemon_threads = True
+    server.received = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, server.server_address[1]
+
+class UploadSinkHandler(BaseHTTPRequestHandler):
+    """Accepts POST/PUT bodies, discards them and reports the byte count."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        remaining = int(self.headers.get("Content-Length", 0))
+        buffer = memoryview(bytearray(256 * 1024))
+        while remaining > 0:
+            n = self.rfile.readinto(buffer[:min(remaining, len(buffer))])
+            if not n:
+                break
+            remaining -= n
+            with self.server.lock:
+                self.server.received += n
+        self.send_response(self.server.status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    do_PUT = do_POST
+
+def start_http_upload_sink(status=200):
+    """Starts an HTTP upload sink on loopback that answers with status; returns (server, url)."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), UploadSinkHandler)
+    server.daemon_threads = True
+    server.status = status
+    server.received = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/upload"
+
+class _AcceptCloseHandler(socketserver.BaseRequestHandler):
+    """Completes the handshake and hangs up, like a port probed by TCP connect pings."""
+
+    def handle(self):
+        pass
+
+def start_tcp_accept_close():
+    """Starts a TCP accept-and-close server on loopback; returns (server, port)."""
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _AcceptCloseHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, server.server_address[1]
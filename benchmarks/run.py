@@ -0,0 +1,250 @@
+"""Hermetic loopback benchmarks for the measurement engines.
+
+Stand-in servers (benchmarks.servers) run on loopback in a subprocess, and the real
+download, upload and latency code paths run against them in this process. Every
+metric is compared with a JSON baseline, so a change that slows the tool down shows
+up as a regression.
+
+    python -m benchmarks.run                   # run and compare with the baseline
+    python -m benchmarks.run --save-baseline   # run and record a new baseline
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from core.http_download import http_download
+from core.icmp import IcmpSocket
+from core.latency import tcp_ping
+from core.process_engine import process_http_download, process_tcp_upload
+from core.udp_probe import udp_probe_stream
+from core.upload_engine import tcp_upload, http_upload
+from utils.logger import logger, setup_logger, stop_logger
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_FILE = os.path.join(ROOT, "benchmarks", "baseline.json")
+TOLERANCE = 0.15                    # Relative change accepted before a metric counts as regressed
+TRANSFER_BYTES = 256 * 1024 * 1024  # Bytes moved per transfer run
+REPEATS = 3                         # Transfer runs per engine; the best run is kept
+PROBE_COUNT = 200                   # Probes per latency method
+LOG_CALLS = 5000                    # Log calls timed per level
+MAIN_TIMEOUT = 300                  # Longest a hermetic main.py run may take (seconds)
+
+def metric(value, unit, better):
+    """One benchmark figure; better is 'higher' or 'lower'."""
+    return {"value": value, "unit": unit, "better": better}
+
+def _cpu_seconds():
+    """CPU time of this process plus its finished child processes (transfer workers)."""
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+def _best_transfer(run, repeats):
+    """Runs a transfer repeats times; returns (best Mbps, lowest CPU seconds per GB)."""
+    mbps, cpu_per_gb = [], []
+    for _ in range(repeats):
+        cpu = _cpu_seconds()
+        result = run()
+        cpu = _cpu_seconds() - cpu
+        mbps.append(result["average_mbps"])
+        if result["bytes"]:
+            cpu_per_gb.append(cpu / (result["bytes"] / 1e9))
+    return max(mbps), min(cpu_per_gb) if cpu_per_gb else None
+
+def bench_transfers(endpoints, nbytes=TRANSFER_BYTES, repeats=REPEATS):
+    """Loopback throughput and CPU cost of every transfer engine."""
+    url, sink = endpoints["http_range"], endpoints["tcp_sink"]
+    runs = {
+        "download_threads": lambda: http_download(url, max_bytes=nbytes, early_stop=False),
+        "download_processes": lambda: process_http_download(url, max_bytes=nbytes, early_stop=False),
+        "upload_tcp_threads": lambda: tcp_upload("127.0.0.1", sink, total_bytes=nbytes, early_stop=False),
+        "upload_tcp_processes": lambda: process_tcp_upload("127.0.0.1", sink, total_bytes=nbytes,
+                                                           early_stop=False),
+        "upload_http_threads": lambda: http_upload(endpoints["http_upload"], nbytes, early_stop=False),
+    }
+    metrics = {}
+    for name, run in runs.items():
+        mbps, cpu_per_gb = _best_transfer(run, repeats)
+        cost = f"{cpu_per_gb:.2f} CPU s/GB" if cpu_per_gb is not None else "no data moved"
+        logger.info(f"🏁 {name}: {mbps:.0f} Mbps, {cost}")
+        metrics[f"{name}_mbps"] = metric(mbps, "Mbps", "higher")
+        metrics[f"{name}_cpu_per_gb"] = metric(cpu_per_gb, "CPU s/GB", "lower")
+    metrics["loopback_max_mbps"] = metric(
+        max(m["value"] for name, m in metrics.items() if name.endswith("_mbps")), "Mbps", "higher")
+    return metrics
+
+def bench_probes(endpoints, count=PROBE_COUNT):
+    """Median loopback round trip of each probe method; on loopback this is the tool's own overhead."""
+    metrics = {}
+    rtts = [tcp_ping("127.0.0.1", endpoints["tcp_accept"]) for _ in range(count)]
+    rtts = [r for r in rtts if r is not None]
+    if rtts:
+        metrics["probe_tcp_connect_us"] = metric(statistics.median(rtts) * 1000, "us", "lower")
+
+    stream = udp_probe_stream("127.0.0.1", endpoints["udp_reflector"], count=count, rate=1000)
+    if stream["median_latency"] is not None:
+        metrics["probe_udp_us"] = metric(stream["median_latency"] * 1000, "us", "lower")
+
+    try:
+        icmp = IcmpSocket()
+    except OSError as e:
+        logger.warning(f"⚠️ Skipping ICMP probe benchmark: {e}", protocol="ICMP")
+    else:
+        try:
+            rtts = [r for r in icmp.ping("127.0.0.1", count=count, interval=0.001) if r is not None]
+        finally:
+            icmp.close()
+        if rtts:
+            metrics["probe_icmp_us"] = metric(statistics.median(rtts) * 1000, "us", "lower")
+    for name, m in metrics.items():
+        logger.info(f"🏁 {name}: {m['value']:.1f} µs")
+    return metrics
+
+def bench_logging(calls=LOG_CALLS):
+    """Median time a log call holds up the calling (probe or transfer) thread.
+
+    The calls go to a throwaway logger with the same pipeline as the real one; debug is
+    disabled, as in a normal run, so its figure is the cost of a filtered call.
+    """
+    with tempfile.TemporaryDirectory(prefix="speedtest-bench-") as workdir, open(os.devnull, "w") as console:
+        bench_logger = setup_logger("speedtest_bench_logger", log_file=os.path.join(workdir, "bench.log"))
+        bench_logger.listener.handlers[1].setStream(console)
+        metrics = {}
+        for name, log in (("log_call_us", bench_logger.info), ("log_debug_call_us", bench_logger.debug)):
+            samples = []
+            for i in range(calls):
+                start = time.perf_counter_ns()
+                log(f"Probe {i}: 12.34 ms", protocol="TCP")
+                samples.append(time.perf_counter_ns() - start)
+            metrics[name] = metric(statistics.median(samples) / 1000, "us", "lower")
+        stop_logger(bench_logger)
+    for name, m in metrics.items():
+        logger.info(f"🏁 {name}: {m['value']:.2f} µs")
+    return metrics
+
+def bench_main(endpoints, budget="10s"):
+    """Wall time of a full main.py run against the stand-ins.
+
+    Without an iperf3 binary the iPerf3 transfers fail at once, so the figure is only
+    comparable with a baseline recorded the same way (see 'iperf3' under 'machine').
+
+    Returns:
+        (metrics, reason) where reason explains a skipped or failed run
+    """
+    if "iperf" not in endpoints:
+        logger.warning("⚠️ No iperf3 server: the main.py run times its iPerf3 transfers failing at once.")
+    env = dict(os.environ, PYTHONPATH=ROOT, MPLBACKEND="Agg")
+    with tempfile.TemporaryDirectory(prefix="speedtest-bench-") as workdir:
+        start = time.perf_counter()
+        try:
+            proc = subprocess.run([sys.executable, "-m", "benchmarks.hermetic_main", json.dumps(endpoints),
+                                   "--budget", budget, "--charts", "off"], cwd=workdir, env=env, timeout=MAIN_TIMEOUT,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        except subprocess.TimeoutExpired:
+            return {}, f"main.py did not finish within {MAIN_TIMEOUT}s"
+        elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        return {}, f"main.py exited with {proc.returncode}: {proc.stderr.strip().splitlines()[-1:]}"
+    logger.info(f"🏁 main_wall_seconds: {elapsed:.2f} s")
+    return {"main_wall_seconds": metric(elapsed, "s", "lower")}, None
+
+def start_stand_in_process():
+    """Starts benchmarks.servers in a subprocess; returns (process, endpoints)."""
+    proc = subprocess.Popen([sys.executable, "-m", "benchmarks.servers"], cwd=ROOT, stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE, text=True)
+    line = proc.stdout.readline()
+    if not line:
+        proc.wait()
+        raise RuntimeError("Stand-in servers failed to start")
+    return proc, json.loads(line)
+
+def compare(current, baseline, tolerance=TOLERANCE):
+    """Lists the metrics that got worse than the baseline by more than tolerance.
+
+    Returns:
+        List of (name, baseline value, current value, relative change) tuples
+    """
+    regressions = []
+    for name, m in current.items():
+        base = baseline.get(name)
+        if not base or base["value"] in (None, 0) or m["value"] is None:
+            continue
+        change = (m["value"] - base["value"]) / base["value"]
+        if (m["better"] == "higher" and change < -tolerance) or (m["better"] == "lower" and change > tolerance):
+            regressions.append((name, base["value"], m["value"], change))
+    return regressions
+
+def load_baseline(path=BASELINE_FILE):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def save_baseline(report, path=BASELINE_FILE):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=4)
+    logger.info(f"✅ Benchmark baseline saved to {path}")
+
+def run_suite(include_main=True, nbytes=TRANSFER_BYTES, repeats=REPEATS):
+    """Runs every benchmark against fresh stand-ins and returns the report."""
+    proc, endpoints = start_stand_in_process()
+    skipped = {}
+    try:
+        metrics = bench_transfers(endpoints, nbytes, repeats)
+        metrics.update(bench_probes(endpoints))
+        metrics.update(bench_logging())
+        if include_main:
+            main_metrics, reason = bench_main(endpoints)
+            metrics.update(main_metrics)
+            if reason:
+                skipped["main_wall_seconds"] = reason
+                logger.warning(f"⚠️ Skipping main.py wall time: {reason}")
+    finally:
+        proc.stdin.close()
+        proc.wait()
+    return {
+        "machine": {"platform": platform.platform(), "python": platform.python_version(),
+                    "cpus": os.cpu_count(), "iperf3": "iperf" in endpoints},
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "metrics": metrics,
+        "skipped": skipped,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Hermetic loopback benchmarks")
+    parser.add_argument("--save-baseline", action="store_true", help="record this run as the new baseline")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline JSON file")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="accepted relative change")
+    parser.add_argument("--output", help="also write this run's report to a JSON file")
+    parser.add_argument("--skip-main", action="store_true", help="do not time a full main.py run")
+    args = parser.parse_args()
+
+    report = run_suite(include_main=not args.skip_main)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+    if args.save_baseline:
+        save_baseline(report, args.baseline)
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    if baseline is None:
+        logger.warning(f"⚠️ No baseline at {args.baseline}; run with --save-baseline to record one.")
+        return 0
+    if baseline.get("machine") != report["machine"]:
+        logger.warning("⚠️ Baseline was recorded on a different machine; comparisons may not be meaningful.")
+    regressions = compare(report["metrics"], baseline["metrics"], args.tolerance)
+    for name, base, current, change in regressions:
+        logger.error(f"❌ Regression in {name}: {base:.2f} -> {current:.2f} ({change:+.0%})")
+    if not regressions:
+        logger.info(f"✅ No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
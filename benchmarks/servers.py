@@ -0,0 +1,63 @@
+"""Loopback stand-ins for the benchmark suite.
+
+Run as a subprocess (python -m benchmarks.servers) so the servers' CPU time is not
+charged to the client being measured. The endpoints are printed as one JSON line and
+served until stdin is closed.
+"""
+import json
+import shutil
+import socket
+import subprocess
+import sys
+from core.udp_probe import UdpReflector
+from benchmarks.local_servers import (start_http_range_server, start_tcp_sink, start_http_upload_sink,
+                                      start_tcp_accept_close)
+
+OBJECT_SIZE = 1024 ** 3  # Same size as the 1GB.bin download objects
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_stand_ins(object_size=OBJECT_SIZE, iperf=True):
+    """Starts every stand-in on loopback.
+
+    Returns:
+        (endpoints, stop) where endpoints maps 'http_range', 'http_upload', 'tcp_sink',
+        'tcp_accept', 'udp_reflector' and, when an iperf3 binary is installed, 'iperf'
+        to their URL or port, and stop() shuts them all down.
+    """
+    range_server, range_url = start_http_range_server(object_size)
+    sink, sink_port = start_tcp_sink()
+    upload_sink, upload_url = start_http_upload_sink()
+    accept, accept_port = start_tcp_accept_close()
+    reflector = UdpReflector("127.0.0.1", 0).start()
+    endpoints = {"http_range": range_url, "http_upload": upload_url, "tcp_sink": sink_port,
+                 "tcp_accept": accept_port, "udp_reflector": reflector.address[1]}
+    iperf_server = None
+    if iperf and shutil.which("iperf3"):
+        port = _free_port()
+        iperf_server = subprocess.Popen(["iperf3", "-s", "-B", "127.0.0.1", "-p", str(port)],
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        endpoints["iperf"] = port
+
+    def stop():
+        for server in (range_server, sink, upload_sink, accept):
+            server.shutdown()
+            server.server_close()
+        reflector.stop()
+        if iperf_server:
+            iperf_server.terminate()
+            iperf_server.wait()
+
+    return endpoints, stop
+
+if __name__ == "__main__":
+    endpoints, stop = start_stand_ins()
+    print(json.dumps(endpoints), flush=True)
+    try:
+        sys.stdin.read()
+    except KeyboardInterrupt:
+        pass
+    stop()
@@ -24,7 +24,8 @@ DOWNLOAD_URLS = [
     "http://grr.speedtest.clouvider.net/1GB.bin"   # Grand Rapids, MI
 ]
 
-# Upload Servers (replace with real iPerf3 servers)
+# Upload Servers (replace with real iPerf3 servers). A server may also carry an
+# "upload_url" (HTTP POST sink) to run TCP uploads through the zero-copy HTTP engine.
 UPLOAD_SERVERS = [
     {"host": "iperf.he.net", "port": 5201},           # Fremont, CA (Hurricane Electric)
     {"host": "iperf3.volia.net", "port": 5201},       # Kyiv, Ukraine (Volia)
@@ -33,9 +34,152 @@ UPLOAD_SERVERS = [
     {"host": "iperf.fr", "port": 5201}               # France
 ]
 
+# Server selection: all candidates are probed concurrently within a global deadline
+SELECTION_ATTEMPTS = 3            # TCP connects per server
+SELECTION_TIMEOUT = 2             # Per-connect timeout (seconds)
+SELECTION_DEADLINE = 5            # Budget for a whole selection round (seconds)
+SELECTION_EARLY_STOP_FACTOR = 2   # Stop once the rest are this many times slower than the best
+
+# Retries and circuit breakers: failed connects are retried with jittered exponential
+# backoff inside the caller's deadline, and a server that keeps failing (selection,
+# transfers) is skipped for a cool-down, then tried once (half-open)
+RETRY_TRIES = 3              # Attempts per call
+RETRY_DELAY = 0.2            # First wait between attempts (seconds)
+RETRY_MAX_DELAY = 2.0        # Longest wait between attempts (seconds)
+RETRY_JITTER = 1.0           # Share of each wait that is randomized (1 = full jitter)
+BREAKER_FAILURES = 3         # Consecutive failures that open an endpoint's breaker
+BREAKER_COOLDOWN = 600       # Time an open breaker skips its endpoint (seconds)
+
+# Server ranking cache: rankings are kept per network (default route and source address)
+# so tests start at once with the cached best server; set RANKING_CACHE = False to always probe
+RANKING_CACHE = True
+RANKING_CACHE_FILE = "results/server_ranking.json"
+RANKING_CACHE_TTL = 3600            # Rankings younger than this are used without re-probing (seconds)
+RANKING_CACHE_MAX_AGE = 7 * 86400   # Older rankings are still used, then re-probed after the test
+RANKING_CACHE_MAX_NETWORKS = 8      # Networks remembered (least recently used are evicted)
+
+# HTTP download engine
+DOWNLOAD_CONNECTIONS = 4                 # Parallel keep-alive connections
+DOWNLOAD_RANGE_SIZE = 8 * 1024 * 1024    # Bytes requested per range request
+DOWNLOAD_BUFFER_SIZE = 256 * 1024        # Preallocated receive buffer per connection
+
+# Upload payloads: one cached block is reused for every size in FILE_SIZES
+PAYLOAD_KIND = "random"                # 'random' (incompressible), 'text' (text-like) or 'zeros'
+PAYLOAD_BLOCK_SIZE = 4 * 1024 * 1024   # Size of the cached source block
+PAYLOAD_CHUNK_SIZE = 256 * 1024        # Size of each chunk handed to the transmit path
+
+# Upload engine: payload file is memory-mapped and sent with sendfile()
+UPLOAD_STREAMS = 4                       # Parallel upload connections
+UPLOAD_FILE_SIZE = 64 * 1024 * 1024      # Largest payload file; longer uploads wrap around it
+UPLOAD_SEND_CHUNK = 4 * 1024 * 1024      # Bytes per sendfile()/sendall() call
+
+# Transfer engine: 'threads' runs every stream in this process; 'processes' spreads
+# them over worker processes so multi-gigabit links are not capped by the GIL
+TRANSFER_ENGINE = "threads"
+PROCESS_WORKERS = None            # Worker processes (None = one per available CPU core)
+PROCESS_PIN_CPUS = True           # Pin each worker to its own core where supported
+PROCESS_PUBLISH_INTERVAL = 0.01   # How often workers publish their counters (seconds)
+PROCESS_START_TIMEOUT = 30        # Longest wait for workers to start (seconds)
+PROCESS_CPU_BOTTLENECK = 0.9      # Share of a core above which the client CPU is the bottleneck
+
+# Latency under load (bufferbloat): sampled at a high rate through every test phase
+BUFFERBLOAT_TARGET = ("1.1.1.1", 80)   # (host, port) probed while idle and under load
+BUFFERBLOAT_PROTOCOL = "tcp"           # 'tcp' connects or 'icmp' echoes
+BUFFERBLOAT_RATE = 20                  # Probes per second (10-100)
+BUFFERBLOAT_TIMEOUT = 1                # Per-probe timeout (seconds)
+BUFFERBLOAT_IDLE_SECONDS = 2           # Idle baseline taken before loading the link
+BUFFERBLOAT_GRADES = [(5, "A+"), (30, "A"), (60, "B"), (200, "C"), (400, "D")]  # (delta ms below, grade)
+
+# Streaming quantile sketches: every latency and throughput series is summarized in
+# fixed memory (log-bucketed histogram plus running moments) and merges across runs
+SKETCH_RELATIVE_ACCURACY = 0.01   # Quantiles are within 1% of the true value
+SKETCH_MIN_VALUE = 1e-3           # Smallest value resolved (ms or Mbps); smaller ones count as 0
+SKETCH_MAX_VALUE = 1e6            # Largest value resolved; larger ones share the top bucket
+
+# Interval throughput sampling for the transfer engines
+THROUGHPUT_INTERVAL = 0.1        # Sampling interval (seconds)
+THROUGHPUT_RING_SIZE = 600       # Intervals kept per transfer (60 s at 100 ms)
+THROUGHPUT_WINDOW = 10           # Intervals in the rolling stability window
+THROUGHPUT_TOLERANCE = 0.05      # Relative variation accepted as stable
+THROUGHPUT_MIN_DURATION = 2      # Never stop a transfer earlier than this (seconds)
+THROUGHPUT_RAMP_FRACTION = 0.8   # Ramp-up ends once throughput reaches this share of its peak
+THROUGHPUT_EARLY_STOP = True     # End transfers once the estimate is stable
+
+# Result storage: 'sqlite' appends every run to RESULTS_DB (time- and server-indexed);
+# 'json' writes one results/speedtest_results_<time>.json file per run
+RESULTS_BACKEND = "sqlite"
+RESULTS_DB = "results/speedtest.db"
+RESULTS_COMPACT_DAYS = 30   # Runs older than this lose their per-interval detail on compaction
+
+# Overhead profiling (python main.py --profile-overhead): per-phase client CPU, probe
+# send delay and GIL contention; results measured while the client looked saturated
+# are listed under 'suspect'
+PROFILE_OVERHEAD = False
+PROFILE_GIL_PROBE_INTERVAL = 0.005  # Watchdog sleep used to estimate GIL waits (seconds)
+PROFILE_CPU_SATURATION = 0.9        # Share of a core (one thread) or of all cores (process)
+PROFILE_MAX_SEND_DELAY = 5.0        # p90 lateness of scheduled probes (ms)
+PROFILE_MAX_GIL_WAIT = 5.0          # Mean GIL wait per watchdog wake-up (ms)
+
+# Logging: records are queued and written by a background thread; when this many are
+# waiting, new ones are dropped (and counted) rather than stalling a timed section
+LOG_QUEUE_SIZE = 10000
+
+# Charts: one multi-panel file per format, written next to the results with a
+# non-interactive backend. 'background' renders in a separate process after the
+# measurements; 'inline' renders before exiting; 'off' skips charts (and matplotlib).
+CHARTS = "background"
+CHART_FORMATS = ["png", "svg"]
+
+# OpenMetrics exporter (python main.py --daemon --metrics-port 9469): serves the latest
+# figures and cumulative latency histograms at /metrics; updated as each phase finishes
+EXPORTER_PORT = None                # Port to listen on; None leaves the exporter off
+EXPORTER_HOST = "127.0.0.1"         # Address to listen on ("0.0.0.0" for remote scrapers)
+EXPORTER_LATENCY_BUCKETS = [0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0]  # Histogram bounds (seconds)
+
+# History analytics (python -m core.history)
+HISTORY_DAYS = 30                 # Default look-back (days)
+HISTORY_ROLLING_WINDOW = 12       # Runs per rolling median (an hour at one run every 5 minutes)
+HISTORY_MIN_SEGMENT = 12          # Fewest runs on either side of a change point
+HISTORY_CHANGE_THRESHOLD = 5.0    # t statistic a level shift needs to count as a change point
+HISTORY_REGRESSION_CHANGE = 0.1   # Relative worsening reported as a regression
+
+# Daemon mode (python main.py --daemon): light latency-only checks often, full tests rarely,
+# with the server ranking, connections and probe sockets kept warm between runs
+DAEMON_LIGHT_INTERVAL = 300        # Time between latency-only checks (seconds)
+DAEMON_FULL_INTERVAL = 6 * 3600    # Time between full throughput tests (seconds)
+DAEMON_JITTER = 0.1                # Each wait is randomized by up to this share so probes do not align
+DAEMON_RANKING_TTL = 3600          # Re-rank servers once a ranking is this old (seconds)
+
+# Distributed mode: a coordinator (python -m core.coordinator) assigns each agent
+# (python main.py --coordinator URL) a time slot and servers that no other agent
+# loads in that slot, and stores the agents' compact results centrally
+COORDINATOR_HOST = "127.0.0.1"     # Address the coordinator listens on ("0.0.0.0" for remote agents)
+COORDINATOR_PORT = 8630
+COORDINATOR_SLOT = 90              # Length of one test slot (seconds)
+COORDINATOR_SLOT_OVERHEAD = 25     # Slot time kept for latency checks and server selection (seconds)
+COORDINATOR_LEAD = 5               # Earliest start of a plan after it is handed out (seconds)
+COORDINATOR_HORIZON = 1000         # Slots searched for free servers before giving up
+COORDINATOR_DB = "results/coordinator.db"
+AGENT_INTERVAL = DAEMON_FULL_INTERVAL  # Time between an agent's tests (seconds)
+AGENT_RETRY = 30                   # Wait after a failed request or test (seconds)
+AGENT_TIMEOUT = 10                 # Per-request timeout towards the coordinator (seconds)
+
 # File sizes in MB for testing
 FILE_SIZES = [1, 10, 25, 100, 500, 1024]  # Added larger files for thorough testing
 
+# Test plan: 'adaptive' probes the link and sizes each transfer to fit TEST_BUDGET;
+# 'fixed' runs the FILE_SIZES sweep above (python main.py --profile fixed)
+TEST_PROFILE = "adaptive"
+TEST_BUDGET = 60               # Total time budget of a full test; phases not started by then are skipped (seconds)
+ADAPTIVE_PROBE_MB = 2          # Probe transfer used to estimate link capacity
+ADAPTIVE_PROBE_SECONDS = 2     # Longest time the probe may take (seconds)
+ADAPTIVE_MIN_MB = 1            # Smallest sized transfer
+ADAPTIVE_MAX_MB = 1024         # Largest sized transfer (size of the download test objects)
+
+# Test-plan scheduler: phases that cannot affect each other's results (idle probes of
+# different hosts, server selection) overlap; transfers always run alone
+SCHEDULER_MAX_PARALLEL = 4     # Most phases running at once (1 runs the plan strictly in order)
+
 # Latency test servers (using IPs for consistency)
 LATENCY_TEST_HOSTS = [
     "8.8.8.8",   # Google DNS
@@ -46,5 +190,26 @@ LATENCY_TEST_HOSTS = [
 # Number of ping attempts
 LATENCY_ATTEMPTS = 5
 
+# Concurrent latency probing: every host/protocol stream runs at once
+LATENCY_TIMEOUT = 2      # Per-probe timeout (seconds)
+LATENCY_INTERVAL = 0.1   # Spacing between probes within one stream (seconds)
+LATENCY_DEADLINE = 5     # Budget for the whole latency phase (seconds)
+
+# UDP probe stream: needs a reflector (python -m core.udp_probe --reflect) on the far end.
+# Set UDP_REFLECTOR to (host, port) to fill the jitter_udp/packet_loss_udp results.
+UDP_REFLECTOR = None
+UDP_REFLECTOR_PORT = 8622
+UDP_PROBE_COUNT = 200    # Packets per stream
+UDP_PROBE_RATE = 200     # Packets per second
+UDP_PROBE_SIZE = 64      # Datagram size (bytes)
+
+# DNS resolution: every host is resolved once and cached for its DNS TTL, so probes
+# time only the network path. Connects race IPv6 and IPv4 addresses (Happy Eyeballs).
+RESOLVER_DEFAULT_TTL = 300   # Cache time when the record TTL cannot be learned (seconds)
+RESOLVER_MIN_TTL = 30        # Shortest cache time, also used for failed lookups (seconds)
+RESOLVER_MAX_TTL = 3600      # Longest cache time (seconds)
+RESOLVER_TTL_TIMEOUT = 0.5   # Wait for the nameserver's answer carrying the TTL (seconds)
+HAPPY_EYEBALLS_DELAY = 0.25  # Head start of each address before the next is tried (RFC 8305)
+
 # Protocol selection: support both 'http1' and 'http3'
 PROTOCOL = ["http1", "http3"]
\ No newline at end of file
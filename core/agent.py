@@ -0,0 +1,129 @@
+import json
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+from config.settings import AGENT_INTERVAL, AGENT_RETRY, AGENT_TIMEOUT
+from core.daemon import WarmState
+from core.server_selection import rank_servers, reachable
+from utils.logger import logger
+from utils.result_store import DETAIL_KEYS
+
+class CoordinatorClient:
+    """JSON over HTTP to a core.coordinator.CoordinatorServer."""
+
+    def __init__(self, url, timeout=AGENT_TIMEOUT):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def request(self, path, payload=None):
+        """POSTs payload (GETs without one); returns the decoded reply.
+
+        Raises:
+            urllib.error.HTTPError: The coordinator refused the request
+            OSError: The coordinator could not be reached
+        """
+        data = json.dumps(payload, separators=(",", ":")).encode("utf-8") if payload is not None else None
+        request = urllib.request.Request(self.url + path, data=data, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+def compact_results(results):
+    """Results without the bulky per-run detail, for sending to the coordinator.
+
+    Summary figures, servers and sketches are kept; of the bufferbloat report only
+    the idle and loaded medians, their delta and the grade.
+    """
+    compact = {key: value for key, value in results.items() if key not in DETAIL_KEYS}
+    bufferbloat = results.get("bufferbloat")
+    if bufferbloat:
+        compact["bufferbloat"] = {key: bufferbloat.get(key) for key in ("idle_median", "loaded_median", "delta",
+                                                                         "grade")}
+    return compact
+
+def assigned_rankings(plan):
+    """Rankings holding only the servers a plan assigns, for run_full_test(rankings=...)."""
+    return {"download": rank_servers([plan["download_server"]]),
+            "upload": rank_servers([plan["upload_server"]], default_port=5201)}
+
+def ranked_preferences(rankings):
+    """Server preferences for the coordinator from rankings ({'download': ranking, 'upload': ranking})."""
+    return {kind: [entry["server"] for entry in reachable(ranking)] for kind, ranking in rankings.items()}
+
+class Agent:
+    """Runs tests when and against what a coordinator says, and reports the results back.
+
+    The agent registers under name, then repeatedly asks for a plan, sleeps until the
+    plan's slot starts (corrected for the offset between its clock and the
+    coordinator's), calls run_test(plan, state) and sends compact_results() of what it
+    returns. When the coordinator cannot be reached or refuses a request, the agent
+    logs it and tries again after retry seconds; an unknown-agent reply (coordinator
+    restarted) makes it register again.
+
+    Usage:
+        agent = Agent(lambda plan, state: run_full_test(budget=plan["budget"], state=state,
+                                                        rankings=assigned_rankings(plan)),
+                      "http://coordinator:8630", name="site-a")
+        agent.run()  # until agent.stop()
+    """
+
+    def __init__(self, run_test, coordinator, name=None, interval=AGENT_INTERVAL, preferences=None,
+                 retry=AGENT_RETRY, state=None):
+        self.run_test = run_test
+        self.client = coordinator if isinstance(coordinator, CoordinatorClient) else CoordinatorClient(coordinator)
+        self.name = name or socket.gethostname()
+        self.interval = interval
+        self.preferences = preferences
+        self.retry = retry
+        self.state = state if state is not None else WarmState()
+        self.offset = None  # Coordinator clock minus ours (seconds)
+        self.runs = 0
+        self._stopping = threading.Event()
+
+    def stop(self):
+        """Ends run() at the next wait; a test in progress finishes first."""
+        self._stopping.set()
+
+    def register(self):
+        sent = time.time()
+        reply = self.client.request("/register", {"agent": self.name, "interval": self.interval})
+        received = time.time()
+        self.offset = reply["time"] - (sent + received) / 2
+        logger.info(f"🤝 Registered with {self.client.url} as {self.name} (clock offset {self.offset * 1000:.0f} ms)")
+
+    def run_once(self):
+        """Asks for a plan, waits for its slot, runs it and reports; returns the results (None if stopped)."""
+        if self.offset is None:
+            self.register()
+        preferences = self.preferences() if callable(self.preferences) else self.preferences
+        plan = self.client.request("/plan", {"agent": self.name, "preferences": preferences})
+        wait = plan["start"] - self.offset - time.time()
+        logger.info(f"📅 Plan {plan['id']}: slot {plan['slot']} in {max(wait, 0):.0f}s")
+        if wait > 0 and self._stopping.wait(wait):
+            return None
+        results = self.run_test(plan, self.state)
+        self.client.request("/results", {"agent": self.name, "plan": plan["id"], "results": compact_results(results)})
+        self.runs += 1
+        logger.info(f"✅ Plan {plan['id']} reported to the coordinator")
+        return results
+
+    def run(self, max_runs=None):
+        """Runs plans until stop() (or max_runs reported tests); releases the warm state on exit."""
+        try:
+            while not self._stopping.is_set() and (max_runs is None or self.runs < max_runs):
+                try:
+                    self.run_once()
+                    continue
+                except urllib.error.HTTPError as e:
+                    if e.code == 404:
+                        self.offset = None  # The coordinator forgot us: register again
+                    logger.error(f"❌ Coordinator refused the request: {e.code} {e.read().decode('utf-8', 'replace')}")
+                except Exception as e:
+                    logger.error(f"❌ Agent run failed: {e}")
+                self._stopping.wait(self.retry)
+        except KeyboardInterrupt:
+            logger.info("🛑 Agent interrupted.")
+        finally:
+            self.state.close()
+        logger.info(f"🛑 Agent {self.name} stopped after {self.runs} tests.")
@@ -0,0 +1,213 @@
+import asyncio
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from config.settings import (BUFFERBLOAT_TARGET, BUFFERBLOAT_RATE, BUFFERBLOAT_TIMEOUT, BUFFERBLOAT_PROTOCOL,
+                             BUFFERBLOAT_IDLE_SECONDS, BUFFERBLOAT_GRADES)
+from core.icmp import IcmpSocket, resolve as resolve_icmp
+from core.metrics import Sketch
+from core.profiler import record_send_delay
+from utils.logger import logger
+
+IDLE = "idle"
+LOAD_PHASES = ("download", "upload")
+
+def percentile_summary(samples):
+    """Median, p90 and p99 (ms) over the successful samples of one phase.
+
+    samples is a Sketch (lost probes counted as missing) or a list of RTTs with None for lost probes.
+    """
+    sketch = samples if isinstance(samples, Sketch) else Sketch().add_many(samples)
+    stats = sketch.summary()
+    return {"count": sketch.count + sketch.missing, "lost": sketch.missing,
+            "median": stats["p50"], "p90": stats["p90"], "p99": stats["p99"],
+            "mean": stats["mean"], "max": stats["max"], "sketch": sketch.to_dict()}
+
+def bufferbloat_grade(delta_ms):
+    """Grades the idle-to-loaded median latency increase (ms)."""
+    if delta_ms is None:
+        return None
+    for limit, grade in BUFFERBLOAT_GRADES:
+        if delta_ms < limit:
+            return grade
+    return "F"
+
+class LoadLatencySampler:
+    """Samples latency at a fixed high rate on its own event loop, labelling every
+    sample with the test phase (idle, download, upload) that was active when it was sent.
+
+    Each phase is summarized in a fixed-size Sketch, so memory does not grow with the
+    sampling rate or the test length. on_sample(phase, rtt) is called for every sample
+    for callers that need the raw values.
+
+    Usage:
+        sampler = LoadLatencySampler("1.1.1.1", 80).start()
+        with sampler.phase("download"):
+            run_download()
+        report = sampler.stop()
+    """
+
+    def __init__(self, host, port=80, rate=BUFFERBLOAT_RATE, protocol=BUFFERBLOAT_PROTOCOL,
+                 timeout=BUFFERBLOAT_TIMEOUT, on_sample=None):
+        self.host = host
+        self.port = port
+        self.rate = rate
+        self.protocol = protocol
+        self.timeout = timeout
+        self.on_sample = on_sample
+        self.sketches = {}  # phase -> Sketch of RTTs in ms (lost probes counted as missing)
+        self.current_phase = IDLE
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._stopping = None
+        self._address = None
+        self._icmp = None
+
+    def set_phase(self, phase):
+        self.current_phase = phase
+
+    @contextmanager
+    def phase(self, name):
+        """Labels samples taken inside the block with name, then returns to idle."""
+        previous = self.current_phase
+        self.set_phase(name)
+        try:
+            yield self
+        finally:
+            self.set_phase(previous)
+
+    def _record(self, phase, rtt):
+        with self._lock:
+            sketch = self.sketches.get(phase)
+            if sketch is None:
+                sketch = self.sketches[phase] = Sketch()
+            sketch.add(rtt)
+        if self.on_sample:
+            self.on_sample(phase, rtt)
+
+    async def _tcp_probe(self):
+        loop = asyncio.get_running_loop()
+        with socket.socket(self._address[0], socket.SOCK_STREAM) as sock:
+            sock.setblocking(False)
+            start = time.perf_counter_ns()
+            await loop.sock_connect(sock, (self._address[1], self.port))
+            return (time.perf_counter_ns() - start) / 1e6
+
+    async def _probe(self, phase):
+        try:
+            if self._icmp:
+                rtt = await asyncio.wait_for(self._icmp.echo(self._address[1]), self.timeout)
+            else:
+                rtt = await asyncio.wait_for(self._tcp_probe(), self.timeout)
+        except (OSError, asyncio.TimeoutError):
+            rtt = None
+        self._record(phase, rtt)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        if self.protocol == "icmp":
+            try:
+                self._icmp = IcmpSocket(self._address[0])
+                self._icmp.attach(loop)
+            except OSError as e:
+                logger.warning(f"⚠️ ICMP sampling unavailable ({e}); using TCP connects.")
+                self._icmp = None
+        interval_ns = int(1e9 / self.rate)
+        next_send = time.perf_counter_ns()
+        inflight = set()
+        try:
+            while not self._stopping.is_set():
+                record_send_delay(next_send, time.perf_counter_ns())
+                # The phase is read at send time, so a sample belongs to the phase it probed.
+                task = asyncio.ensure_future(self._probe(self.current_phase))
+                inflight.add(task)
+                task.add_done_callback(inflight.discard)
+                next_send += interval_ns
+                delay = (next_send - time.perf_counter_ns()) / 1e9
+                if delay > 0:
+                    try:
+                        await asyncio.wait_for(self._stopping.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+            if inflight:
+                await asyncio.wait(inflight, timeout=self.timeout)
+        finally:
+            if self._icmp:
+                self._icmp.detach(loop)
+                self._icmp.close()
+
+    def start(self):
+        """Resolves the target once and starts sampling in the idle phase."""
+        family, address = resolve_icmp(self.host)
+        self._address = (family, address)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_until_complete, args=(self._run(),),
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops sampling and returns the report."""
+        if self._thread:
+            while self._stopping is None:
+                time.sleep(0.001)
+            self._loop.call_soon_threadsafe(self._stopping.set)
+            self._thread.join()
+            self._loop.close()
+            self._thread = None
+        return self.report()
+
+    def phase_sketch(self, phase):
+        """A copy of the phase's Sketch (empty if the phase was never sampled)."""
+        with self._lock:
+            return Sketch().merge(self.sketches[phase]) if phase in self.sketches else Sketch()
+
+    def report(self):
+        """Per-phase median/p90/p99 plus the idle-to-loaded delta and its bufferbloat grade."""
+        with self._lock:
+            phases = {phase: percentile_summary(sketch) for phase, sketch in self.sketches.items()}
+        idle = phases.get(IDLE, {}).get("median")
+        loaded = [phases[p]["median"] for p in LOAD_PHASES if phases.get(p, {}).get("median") is not None]
+        loaded_median = max(loaded) if loaded else None
+        delta = loaded_median - idle if idle is not None and loaded_median is not None else None
+        return {
+            "target": f"{self.host}:{self.port}" if self.protocol == "tcp" else self.host,
+            "protocol": self.protocol,
+            "rate_hz": self.rate,
+            "phases": phases,
+            "idle_median": idle,
+            "loaded_median": loaded_median,
+            "delta": delta,
+            "grade": bufferbloat_grade(delta),
+        }
+
+def start_load_sampler(host=None, port=None, idle_seconds=BUFFERBLOAT_IDLE_SECONDS):
+    """Starts a sampler (BUFFERBLOAT_TARGET by default) and records an idle baseline first.
+
+    Returns None when the target cannot be resolved, so callers can run without it.
+    """
+    default_host, default_port = BUFFERBLOAT_TARGET
+    sampler = LoadLatencySampler(host or default_host, port or default_port)
+    try:
+        sampler.start()
+    except OSError as e:
+        logger.warning(f"⚠️ Latency-under-load sampling disabled: {e}")
+        return None
+    time.sleep(idle_seconds)
+    return sampler
+
+def print_phase_summary(report, phase):
+    """Prints one phase of a sampler report next to the idle baseline."""
+    stats = report["phases"].get(phase)
+    if not stats or stats["median"] is None:
+        logger.warning(f"⚠️ No latency data collected during {phase}.")
+        return
+    print(f"📉 Latency Under Load ({phase}): median {stats['median']:.2f} ms, "
+          f"p90 {stats['p90']:.2f} ms, p99 {stats['p99']:.2f} ms "
+          f"({stats['count']} samples, {stats['lost']} lost)")
+    if report["idle_median"] is not None:
+        print(f"   Idle baseline: {report['idle_median']:.2f} ms | "
+              f"Bufferbloat grade: {report['grade'] or 'N/A'}")
@@ -0,0 +1,268 @@
+import argparse
+import json
+import math
+import sqlite3
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config.settings import (COORDINATOR_HOST, COORDINATOR_PORT, COORDINATOR_SLOT, COORDINATOR_LEAD,
+                             COORDINATOR_SLOT_OVERHEAD, COORDINATOR_HORIZON, COORDINATOR_DB, AGENT_INTERVAL,
+                             DOWNLOAD_URLS, UPLOAD_SERVERS, TEST_BUDGET)
+from core.server_selection import server_address
+from core.test_plan import parse_duration
+from utils.logger import logger
+from utils.result_store import ResultStore, METRICS
+
+class CoordinatorError(Exception):
+    """A request the coordinator cannot serve; status is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def server_key(server, default_port):
+    """'host:port' naming a download URL or an iPerf3 server, so bookings compare servers, not spellings."""
+    host, port = server_address(server, default_port)
+    return f"{host}:{port}"
+
+class Coordinator:
+    """Hands out test plans so that no two agents load the same server at once.
+
+    Time is cut into slots of slot seconds from the coordinator's start. A plan books
+    one download and one upload server for one slot; a server is booked by at most
+    one agent per slot. Each agent gets the earliest slot at least lead seconds away
+    (and interval seconds after its previous plan) in which servers are free,
+    preferring the servers it ranked best. Results come back compact and are stored
+    in the result store under the agent's name, and summary() aggregates the latest
+    run of every agent.
+
+    Usage:
+        coordinator = Coordinator()
+        agent = coordinator.register("site-a")
+        plan = coordinator.plan("site-a")
+        coordinator.report("site-a", plan["id"], results)
+    """
+
+    def __init__(self, download_servers=DOWNLOAD_URLS, upload_servers=UPLOAD_SERVERS, slot=COORDINATOR_SLOT,
+                 lead=COORDINATOR_LEAD, budget=None, horizon=COORDINATOR_HORIZON, db=COORDINATOR_DB):
+        self.servers = {"download": list(download_servers), "upload": list(upload_servers)}
+        self.default_ports = {"download": 80, "upload": 5201}
+        self.slot = slot
+        self.lead = lead
+        self.budget = budget if budget is not None else max(1, min(TEST_BUDGET, slot - COORDINATOR_SLOT_OVERHEAD))
+        self.horizon = horizon
+        self.db = db
+        self.epoch = time.time()
+        self.agents = {}    # name -> {'interval', 'registered', 'last_seen', 'runs', 'plan', 'latest'}
+        self.plans = {}     # id -> plan
+        self.bookings = {}  # slot index -> {server key: agent}
+        self.usage = {}     # server key -> plans booked on it
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def _agent(self, name):
+        agent = self.agents.get(name)
+        if agent is None:
+            raise CoordinatorError(f"Unknown agent {name}; register first", 404)
+        agent["last_seen"] = time.time()
+        return agent
+
+    def register(self, name, interval=AGENT_INTERVAL):
+        """Adds (or re-adds) an agent; returns the coordinator's clock and slot length."""
+        if not name:
+            raise CoordinatorError("An agent needs a name")
+        with self._lock:
+            agent = self.agents.setdefault(name, {"registered": time.time(), "runs": 0, "plan": None,
+                                                  "latest": None})
+            agent["interval"] = interval
+            agent["last_seen"] = time.time()
+        logger.info(f"🤝 Agent {name} registered (one test every {interval:.0f}s)")
+        return {"agent": name, "time": time.time(), "slot": self.slot}
+
+    def _free(self, kind, slot, preferences):
+        """The servers of kind not booked in slot, the agent's preferred ones first, then the least used."""
+        booked = self.bookings.get(slot, {})
+        keys = {server_key(s, self.default_ports[kind]): s for s in self.servers[kind]}
+        order = [server_key(s, self.default_ports[kind]) for s in preferences or []]
+        rank = {key: i for i, key in enumerate(order) if key in keys}
+        free = [key for key in keys if key not in booked]
+        free.sort(key=lambda key: (rank.get(key, len(rank)), self.usage.get(key, 0)))
+        return [(key, keys[key]) for key in free]
+
+    def _slot_start(self, slot):
+        return self.epoch + slot * self.slot
+
+    def plan(self, name, preferences=None):
+        """The agent's next plan: slot start/end (coordinator clock), servers and transfer budget.
+
+        An agent asking again before its plan has ended gets the same plan back.
+        """
+        with self._lock:
+            agent = self._agent(name)
+            current = agent["plan"]
+            if current and current["status"] == "assigned" and current["end"] > time.time():
+                return current
+            not_before = time.time() + self.lead
+            if current:
+                not_before = max(not_before, current["start"] + agent["interval"])
+            first = max(0, math.ceil((not_before - self.epoch) / self.slot))
+            for slot in range(first, first + self.horizon):
+                download = self._free("download", slot, (preferences or {}).get("download"))
+                upload = self._free("upload", slot, (preferences or {}).get("upload"))
+                if download and upload:
+                    break
+            else:
+                raise CoordinatorError(f"No free servers in the next {self.horizon} slots", 503)
+            (download_key, download_server), (upload_key, upload_server) = download[0], upload[0]
+            self.bookings.setdefault(slot, {}).update({download_key: name, upload_key: name})
+            for key in (download_key, upload_key):
+                self.usage[key] = self.usage.get(key, 0) + 1
+            plan = {"id": self._next_id, "agent": name, "slot": slot, "start": self._slot_start(slot),
+                    "end": self._slot_start(slot + 1), "download_server": download_server,
+                    "upload_server": upload_server, "budget": self.budget, "status": "assigned"}
+            self._next_id += 1
+            self.plans[plan["id"]] = agent["plan"] = plan
+            # Bookings of slots that have ended are no longer needed to prevent overlaps
+            ongoing = math.floor((time.time() - self.epoch) / self.slot)
+            for old in [s for s in self.bookings if s < ongoing]:
+                del self.bookings[old]
+        logger.info(f"📅 Plan {plan['id']} for {name}: slot {slot}, download {download_key}, upload {upload_key}")
+        return plan
+
+    def report(self, name, plan_id, results):
+        """Stores the compact results of a plan; returns the row id in the result store."""
+        with self._lock:
+            agent = self._agent(name)
+            plan = self.plans.get(plan_id)
+            if plan is None or plan["agent"] != name:
+                raise CoordinatorError(f"Plan {plan_id} was not given to {name}", 404)
+            if plan["status"] == "done":
+                raise CoordinatorError(f"Plan {plan_id} was already reported", 409)
+            plan["status"] = "done"
+            finished = time.time()
+            results = dict(results, plan=plan_id, slot=plan["slot"])
+            if finished > plan["end"]:
+                # The next slot's agent may already be loading the same servers
+                results["overran"] = finished - plan["end"]
+                logger.warning(f"⚠️ Agent {name} overran slot {plan['slot']} by {results['overran']:.1f}s")
+            agent["runs"] += 1
+            agent["latest"] = dict(results, finished=finished)
+        try:
+            with ResultStore(self.db) as store:
+                return store.insert(results, ts=plan["start"], probe=name)
+        except (OSError, sqlite3.Error) as e:
+            logger.error(f"❌ Failed to store results of plan {plan_id}: {e}")
+            raise CoordinatorError(f"Results could not be stored: {e}", 500)
+
+    def summary(self):
+        """Agents, per-server runs and the spread of every metric over the agents' latest runs."""
+        with self._lock:
+            agents = {name: {"last_seen": agent["last_seen"], "runs": agent["runs"],
+                             "next_slot": agent["plan"]["start"] if agent["plan"] else None,
+                             "latest": {metric: agent["latest"].get(metric) for metric in METRICS}
+                                       if agent["latest"] else None}
+                      for name, agent in self.agents.items()}
+            latest = [agent["latest"] for agent in self.agents.values() if agent["latest"]]
+            servers = {}
+            for plan in self.plans.values():
+                if plan["status"] == "done":
+                    for kind in ("download", "upload"):
+                        key = server_key(plan[f"{kind}_server"], self.default_ports[kind])
+                        servers[key] = servers.get(key, 0) + 1
+        metrics = {}
+        for metric in METRICS:
+            values = [run[metric] for run in latest if isinstance(run.get(metric), (int, float))]
+            if values:
+                metrics[metric] = {"agents": len(values), "median": statistics.median(values),
+                                   "min": min(values), "max": max(values)}
+        return {"time": time.time(), "agents": agents, "servers": servers, "metrics": metrics}
+
+class _Handler(BaseHTTPRequestHandler):
+    def _reply(self, status, payload):
+        body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _serve(self, handle):
+        try:
+            self._reply(200, handle())
+        except CoordinatorError as e:
+            self._reply(e.status, {"error": str(e)})
+        except (ValueError, KeyError, TypeError) as e:
+            self._reply(400, {"error": f"Malformed request: {e}"})
+
+    def do_GET(self):
+        if self.path.split("?")[0] == "/summary":
+            self._serve(self.server.coordinator.summary)
+        else:
+            self._reply(404, {"error": f"No such endpoint: {self.path}"})
+
+    def do_POST(self):
+        coordinator = self.server.coordinator
+        routes = {
+            "/register": lambda body: coordinator.register(body["agent"], body.get("interval", AGENT_INTERVAL)),
+            "/plan": lambda body: coordinator.plan(body["agent"], body.get("preferences")),
+            "/results": lambda body: {"row": coordinator.report(body["agent"], body["plan"], body["results"])},
+        }
+        route = routes.get(self.path)
+        if route is None:
+            self._reply(404, {"error": f"No such endpoint: {self.path}"})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        self._serve(lambda: route(json.loads(self.rfile.read(length) or b"{}")))
+
+    def log_message(self, format, *args):
+        pass  # Requests are logged by the coordinator itself
+
+class CoordinatorServer:
+    """Serves a Coordinator over HTTP/JSON from a background thread (port 0 picks a free port).
+
+    Endpoints: POST /register, /plan and /results, GET /summary.
+    """
+
+    def __init__(self, coordinator=None, host=COORDINATOR_HOST, port=COORDINATOR_PORT):
+        self.coordinator = coordinator if coordinator is not None else Coordinator()
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        self._server = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self._server.daemon_threads = True
+        self._server.coordinator = self.coordinator
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="coordinator", daemon=True)
+        self._thread.start()
+        logger.info(f"🛰️ Coordinator listening at {self.url} ({self.coordinator.slot:.0f}s slots)")
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = self._thread = None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Coordinate speed test agents on many sites")
+    parser.add_argument("--host", default=COORDINATOR_HOST, help="address to listen on")
+    parser.add_argument("--port", type=int, default=COORDINATOR_PORT, help="port to listen on")
+    parser.add_argument("--slot", type=parse_duration, default=COORDINATOR_SLOT,
+                        help="length of one test slot, e.g. 90s; a server hosts one agent per slot")
+    parser.add_argument("--db", default=COORDINATOR_DB, help="SQLite result store for the agents' results")
+    args = parser.parse_args()
+
+    server = CoordinatorServer(Coordinator(slot=args.slot, db=args.db), args.host, args.port).start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
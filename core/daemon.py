@@ -0,0 +1,132 @@
+import random
+import threading
+import time
+from config.settings import DAEMON_LIGHT_INTERVAL, DAEMON_FULL_INTERVAL, DAEMON_JITTER, DAEMON_RANKING_TTL
+from core.http_download import ConnectionPool
+from core.latency import latency_test, PROTOCOLS
+from core.server_selection import reachable
+from utils.json_handler import save_results
+from utils.logger import logger
+
+LIGHT = "light"
+FULL = "full"
+
+def jittered(interval, jitter=DAEMON_JITTER, rng=random):
+    """interval randomized by up to +/- jitter (a share of it)."""
+    return interval * (1 + rng.uniform(-jitter, jitter))
+
+class WarmState:
+    """State a long-running process keeps between test runs.
+
+    Server rankings are reused until they are ranking_ttl seconds old (or no server in
+    them answers any more), HTTP download connections and object sizes stay in a
+    ConnectionPool, and ICMP echo sockets stay open.
+    """
+
+    def __init__(self, ranking_ttl=DAEMON_RANKING_TTL):
+        self.ranking_ttl = ranking_ttl
+        self.rankings = {}  # kind -> (monotonic time ranked, ranking)
+        self.pool = ConnectionPool()
+        self.icmp_sockets = {}
+
+    def ranking(self, kind, rank):
+        """The cached ranking for kind ('download' or 'upload'), re-ranked with rank() when stale."""
+        cached = self.rankings.get(kind)
+        if cached and time.monotonic() - cached[0] < self.ranking_ttl and reachable(cached[1]):
+            logger.debug(f"Reusing {kind} server ranking from {time.monotonic() - cached[0]:.0f}s ago")
+            return cached[1]
+        ranking = rank()
+        self.rankings[kind] = (time.monotonic(), ranking)
+        return ranking
+
+    def forget_rankings(self):
+        self.rankings.clear()
+
+    def close(self):
+        self.pool.close()
+        for icmp in self.icmp_sockets.values():
+            icmp.close()
+        self.icmp_sockets.clear()
+
+def light_check(state):
+    """Latency-only check: latency, jitter and loss per protocol, no transfers.
+
+    Returns:
+        Results dictionary with the same keys as a full run; throughput figures are None
+    """
+    latency_results = latency_test(icmp_sockets=state.icmp_sockets)
+    results = {key: None for key in ("download_tcp", "download_udp", "upload_tcp", "upload_udp",
+                                     "latency_under_load")}
+    for protocol in PROTOCOLS:
+        for metric in ("latency", "jitter", "packet_loss"):
+            results[f"{metric}_{protocol}"] = latency_results.get(f"{metric}_{protocol}")
+    results["kind"] = LIGHT
+    results["sketches"] = {"latency": latency_results.get("sketches")}
+    return results
+
+class Daemon:
+    """Runs light checks often and full tests rarely in one process, on a jittered schedule.
+
+    The first full test runs at start-up; after that each kind is rescheduled
+    jittered(interval) after it finishes. A full test includes the latency check, so it
+    also pushes the next light check back. Failures are logged and the schedule goes on.
+
+    Usage:
+        daemon = Daemon(lambda state: run_full_test(state=state))
+        daemon.run()  # until daemon.stop() is called, e.g. from a SIGTERM handler
+    """
+
+    def __init__(self, full_test, light_interval=DAEMON_LIGHT_INTERVAL, full_interval=DAEMON_FULL_INTERVAL,
+                 jitter=DAEMON_JITTER, state=None, light_test=light_check, save=save_results):
+        self.tests = {LIGHT: light_test, FULL: full_test}
+        self.intervals = {LIGHT: light_interval, FULL: full_interval}
+        self.jitter = jitter
+        self.state = state if state is not None else WarmState()
+        self.save = save
+        self.runs = {LIGHT: 0, FULL: 0}
+        self._stopping = threading.Event()
+
+    def stop(self):
+        """Ends run() once the test in progress (if any) has finished."""
+        self._stopping.set()
+
+    def run_once(self, kind):
+        """Runs one light or full test and saves its results; returns them (None on failure)."""
+        logger.info(f"⏰ Starting scheduled {kind} test...")
+        start = time.perf_counter()
+        try:
+            results = self.tests[kind](self.state)
+        except Exception as e:
+            logger.error(f"❌ Scheduled {kind} test failed: {e}")
+            self.state.forget_rankings()
+            return None
+        results.setdefault("kind", kind)
+        self.runs[kind] += 1
+        self.save(results)
+        logger.info(f"✅ Scheduled {kind} test finished in {time.perf_counter() - start:.1f}s")
+        return results
+
+    def run(self, max_runs=None):
+        """Runs the schedule until stop() (or max_runs tests); releases the warm state on exit."""
+        now = time.monotonic()
+        due = {FULL: now, LIGHT: now + jittered(self.intervals[LIGHT], self.jitter)}
+        runs = 0
+        try:
+            while not self._stopping.is_set():
+                kind = min(due, key=due.get)
+                wait = due[kind] - time.monotonic()
+                if wait > 0 and self._stopping.wait(wait):
+                    break
+                self.run_once(kind)
+                now = time.monotonic()
+                due[kind] = now + jittered(self.intervals[kind], self.jitter)
+                if kind == FULL:
+                    due[LIGHT] = max(due[LIGHT], now + jittered(self.intervals[LIGHT], self.jitter))
+                runs += 1
+                if max_runs is not None and runs >= max_runs:
+                    break
+        except KeyboardInterrupt:
+            logger.info("🛑 Daemon interrupted.")
+        finally:
+            self.state.close()
+        logger.info(f"🛑 Daemon stopped after {self.runs[FULL]} full and {self.runs[LIGHT]} light tests.")
@@ -1,61 +1,103 @@
-import iperf3
-import threading
 import statistics
-import socket
-import time
-from config.settings import DOWNLOAD_URLS, FILE_SIZES, PROTOCOL
+from contextlib import nullcontext
+from config.settings import DOWNLOAD_URLS, FILE_SIZES, TRANSFER_ENGINE, RANKING_CACHE
+from core.bufferbloat import start_load_sampler, print_phase_summary
+from core.metrics import Sketch
+from core.http_download import http_download
+from core.process_engine import process_http_download, print_cpu_report
+from core.ranking_cache import default_cache
+from core.server_selection import rank_servers, reachable, print_ranking, server_breaker
+from core.test_plan import TestPlan
+from core.throughput import print_interval_spread, iperf_transfer
 from utils.logger import logger
 
-PING_ATTEMPTS = 3  # Number of pings per server
+IPERF_PORT = 5201
 
 def safe_format(value, precision=2, suffix="ms"):
     """Safely format numerical values; return 'N/A' if None."""
     return f"{value:.{precision}f} {suffix}" if value is not None else "N/A"
 
-def ping_server(host):
-    """Ping a server to measure latency."""
-    latencies = []
-    for _ in range(PING_ATTEMPTS):
-        try:
-            start = time.time()
-            sock = socket.create_connection((host, 5201), timeout=2)
-            sock.close()
-            latency = (time.time() - start) * 1000  # ms
-            latencies.append(latency)
-        except Exception:
-            latencies.append(None)
-    successful_pings = [l for l in latencies if l is not None]
-    return statistics.mean(successful_pings) if successful_pings else float('inf')
-
-def select_best_download_server():
-    """Select the download server with the lowest latency."""
-    best_server = None
-    lowest_latency = float('inf')
-
-    print("🔍 Testing download servers for the best connection...")
-    for server in DOWNLOAD_URLS:
-        latency = ping_server(server['host'])
-        if latency != float('inf'):
-            print(f"✅ {server['host']} - {safe_format(latency)}")
-        else:
-            print(f"❌ {server['host']} - Unreachable")
+def rank_download_servers():
+    """Rank every download server, best first.
 
-        if latency < lowest_latency:
-            lowest_latency = latency
-            best_server = server
+    With RANKING_CACHE, a cached ranking for this network is returned at once (and
+    refreshed in the background when stale); servers are only probed on a cache miss.
+    """
+    def probe():
+        return rank_servers(DOWNLOAD_URLS)
+    ranking = default_cache().rank("download", DOWNLOAD_URLS, probe) if RANKING_CACHE else probe()
+    print_ranking(ranking, "download")
+    return ranking
 
+def select_best_download_server(ranking=None):
+    """Select the download server with the lowest latency."""
+    # Servers that keep failing transfers are passed over until their cool-down ends
+    candidates = reachable(ranking if ranking is not None else rank_download_servers())
+    best_server = next((s for s in candidates if server_breaker(s).allow()), None)
     if best_server:
-        print(f"\n🚀 Selected Download Server: {best_server['host']} with {safe_format(lowest_latency)} latency.")
+        print(f"\n🚀 Selected Download Server: {best_server['host']} with {safe_format(best_server['median_rtt'])} latency.")
         return best_server
     else:
         logger.error("⚠️ No download servers are reachable.")
         return None
 
-def run_iperf_download_test(server, protocol="tcp"):
-    """Run iPerf3 download test against the selected server."""
-    client = iperf3.Client()
+def run_http_download_test(server, file_size, protocol="tcp", transfers=None, duration=None,
+                           engine=TRANSFER_ENGINE, pool=None):
+    """Download file_size MB of the selected server's test object over parallel HTTP range requests.
+
+    The transfer also ends after duration seconds when given. With engine='processes'
+    the connections run in worker processes and the report says whether the client CPU
+    was the bottleneck. The full engine result, including its 100 ms interval series,
+    is appended to transfers. The thread engine takes warm connections from pool (a
+    ConnectionPool) when one is given.
+    """
+    try:
+        if engine == "processes":
+            result = process_http_download(server['server'], max_bytes=file_size * 1024 * 1024, duration=duration)
+        else:
+            result = http_download(server['server'], max_bytes=file_size * 1024 * 1024, duration=duration,
+                                   pool=pool)
+    except (OSError, ValueError) as e:
+        logger.error(f"❌ Download test failed: {e}", protocol=protocol)
+        return 0
+    if transfers is not None:
+        transfers.append(dict(result, file_size=file_size, protocol=protocol))
+
+    for i, conn in enumerate(result["connections"], 1):
+        logger.debug(f"Connection {i}: {conn['bytes']} bytes in {conn['requests']} requests "
+                     f"@ {conn['mbps']:.2f} Mbps", protocol=protocol)
+    early = " (stable, stopped early)" if result["throughput"]["stopped_early"] else ""
+    print(f"📊 Download Speed from {server['host']} over HTTP ({len(result['connections'])} connections): "
+          f"{safe_format(result['mbps'], suffix='Mbps')}{early}")
+    connects = [c["connect_ms"] for c in result["connections"] if c.get("connect_ms") is not None]
+    first_bytes = [c["first_byte_ms"] for c in result["connections"] if c.get("first_byte_ms") is not None]
+    print(f"⏱️ DNS: {safe_format(result.get('dns_ms'))} | TCP connect: "
+          f"{safe_format(statistics.median(connects) if connects else None)} | First byte: "
+          f"{safe_format(statistics.median(first_bytes) if first_bytes else None)}")
+    if "cpu" in result:
+        print_cpu_report(result["cpu"], "download")
+    return result["mbps"]
+
+def run_iperf_download_test(server, file_size=None, protocol="tcp", transfers=None, duration=None,
+                            engine=None, pool=None):
+    """Run iPerf3 download test against the selected server.
+
+    The HTTP mirrors do not expose iPerf3 on their HTTP port, so the default iPerf3 port is used.
+    iPerf3 runs are time-based; duration (whole seconds, at least 1) overrides its default.
+    The result is the steady-state rate of iPerf3's interval reports, whose series is
+    appended to transfers; iPerf3 runs cannot stop early. engine and pool are accepted
+    for symmetry with run_http_download_test; iPerf3 runs its own streams.
+    """
+    try:
+        import iperf3  # Imported on first use, so runs that never reach iPerf3 do not load it
+        client = iperf3.Client()
+    except (ImportError, OSError) as e:  # No python-iperf3 or no libiperf
+        logger.error(f"❌ Download test failed: iPerf3 is not available ({e})", protocol=protocol)
+        return 0
     client.server_hostname = server['host']
-    client.port = server['port']
+    client.port = IPERF_PORT
+    if duration:
+        client.duration = max(1, int(duration))
 
     if protocol == "udp":
         client.udp = True
@@ -64,59 +106,96 @@ def run_iperf_download_test(server, protocol="tcp"):
     if result.error:
         logger.error(f"❌ Download test failed: {result.error}", protocol=protocol)
         return 0
+    transfer = iperf_transfer(result.json)
+    if transfer is None:
+        speed_mbps = result.received_Mbps if protocol == "tcp" else result.Mbps
     else:
-        speed_mbps = result.received_Mbps
-        print(f"📊 Download Speed from {server['host']} over {protocol.upper()}: {safe_format(speed_mbps, suffix='Mbps')}")
-        return speed_mbps
-
-def measure_latency_under_load(server, duration=10):
-    """Measure latency during active downloads to detect bufferbloat."""
-    latencies = []
-
-    def ping_during_download():
-        end_time = time.time() + duration
-        while time.time() < end_time:
-            latency = ping_server(server['host'])
-            latencies.append(latency)
-            time.sleep(1)
-
-    ping_thread = threading.Thread(target=ping_during_download)
-    ping_thread.start()
-    return ping_thread, latencies
-
-def download_test(protocol="tcp"):
-    """Conducts download speed test using iPerf3 with protocol diversity and latency checks."""
-    best_server = select_best_download_server()
+        speed_mbps = transfer["mbps"]
+        if transfers is not None:
+            transfers.append(dict(transfer, file_size=file_size, protocol=protocol))
+    print(f"📊 Download Speed from {server['host']} over {protocol.upper()}: {safe_format(speed_mbps, suffix='Mbps')}")
+    return speed_mbps
+
+def download_test(protocol="tcp", ranking=None, sampler=None, transfers=None, plan=None,
+                  engine=TRANSFER_ENGINE, pool=None):
+    """Conducts download speed test with protocol diversity and latency checks.
+
+    TCP downloads fetch the selected DOWNLOAD_URLS object over parallel HTTP range
+    requests; UDP downloads use iPerf3. A ranking from rank_download_servers() can be
+    passed in so several tests share one selection round; servers further down the
+    ranking are used as fallbacks. Latency under load is recorded in the "download"
+    phase of sampler (a LoadLatencySampler); without one, a sampler against the
+    selected server is run for this test alone. Per-transfer details, including the
+    interval throughput series, are appended to transfers when a list is given. The
+    transfer sizes come from plan (a TestPlan, adaptive within TEST_BUDGET by default);
+    engine picks the thread or multi-process HTTP engine, and pool keeps HTTP connections
+    warm across calls.
+    """
+    if plan is None:
+        plan = TestPlan()
+    if ranking is None:
+        ranking = rank_download_servers()
+    best_server = select_best_download_server(ranking)
     if not best_server:
         logger.error("❌ No server available for download test.", protocol=protocol)
         return 0
+    fallbacks = [s for s in reachable(ranking) if s is not best_server]
+    run_download = run_iperf_download_test if protocol == "udp" else run_http_download_test
+    # iPerf3 runs have their own endpoint, so a mirror without iPerf3 keeps its HTTP circuit
+    # closed; selection has already consulted (and maybe taken the trial of) the HTTP one
+    breaker = server_breaker(best_server, port=IPERF_PORT if protocol == "udp" else None)
+    if protocol == "udp" and not breaker.allow():
+        logger.warning(f"⏭️ Skipping the {protocol.upper()} download from {best_server['host']}: "
+                       f"failing repeatedly (circuit open).", protocol=protocol)
+        return 0
 
-    threads, results = [], []
+    own_sampler = sampler is None
+    if own_sampler:
+        sampler = start_load_sampler(best_server['host'], best_server['port'])
 
-    for file_size in FILE_SIZES:
+    def run(file_size, duration):
         logger.info(f"📥 Starting {protocol.upper()} download test for file size {file_size} MB.", protocol=protocol)
+        with sampler.phase("download") if sampler else nullcontext():
+            return run_download(best_server, file_size, protocol=protocol, transfers=transfers,
+                                duration=duration, engine=engine, pool=pool)
 
-        ping_thread, latencies = measure_latency_under_load(best_server)
-
-        t = threading.Thread(target=lambda: results.append(run_iperf_download_test(best_server, protocol=protocol)))
-        t.start()
-        threads.append(t)
-
-        ping_thread.join()
+    results = plan.run_transfers(run, f"{protocol.upper()} download")
 
-        if latencies:
-            avg_latency = statistics.mean(latencies)
-            print(f"📉 Average Latency Under Load: {safe_format(avg_latency)}")
-        else:
-            logger.warning("⚠️ No latency data collected during load.", protocol=protocol)
+    if sampler:
+        print_phase_summary(sampler.stop() if own_sampler else sampler.report(), "download")
+    if not results:
+        return 0  # No time left to run it, which says nothing about the server
 
-    for t in threads:
-        t.join()
+    results = [r for r in results if r]
+    breaker.record(bool(results))
+    if protocol == "udp":
+        # UDP runs iPerf3 against the mirrors, which rarely serve it: a failure says
+        # nothing about their HTTP side, so the ranking and the fallbacks are left alone
+        fallbacks = []
+    elif not results and RANKING_CACHE:
+        default_cache().server_failed(best_server['server'])
+    while not results and fallbacks:
+        # Fallbacks stay within what is left of the budget; the fixed profile has none
+        duration = plan.remaining() if plan.profile == "adaptive" else None
+        if duration is not None and duration <= 0:
+            break
+        best_server = fallbacks.pop(0)
+        if not server_breaker(best_server).allow():
+            continue
+        logger.warning(f"⚠️ Falling back to download server {best_server['host']}.", protocol=protocol)
+        speed = run_download(best_server, FILE_SIZES[0], protocol=protocol, transfers=transfers,
+                             duration=duration, engine=engine, pool=pool)
+        server_breaker(best_server).record(bool(speed))
+        if speed:
+            results.append(speed)
+        elif RANKING_CACHE:
+            default_cache().server_failed(best_server['server'])
 
     if results:
-        avg_speed = statistics.mean(results)
+        avg_speed = Sketch().add_many(results).mean
         print(f"\n📊 **Average Download Speed ({protocol.upper()}):** {safe_format(avg_speed, suffix='Mbps')}\n")
+        print_interval_spread(transfers, "Download")
         return avg_speed
     else:
         logger.error(f"❌ Download test failed for all {protocol.upper()} attempts.", protocol=protocol)
-        return 0
\ No newline at end of file
+        return 0
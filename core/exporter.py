@@ -0,0 +1,224 @@
+import os
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config.settings import (EXPORTER_HOST, EXPORTER_PORT, EXPORTER_LATENCY_BUCKETS, BUFFERBLOAT_GRADES,
+                             RESULTS_DB)
+from core.metrics import Sketch
+from utils.logger import logger
+from utils.result_store import ResultStore
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+GRADES = [grade for _, grade in BUFFERBLOAT_GRADES] + ["F"]
+PROTOCOLS = ("tcp", "udp", "icmp")
+
+# Metric families in exposition order: name -> (type, help)
+FAMILIES = {
+    "speedtest_download_bits_per_second": ("gauge", "Latest download throughput"),
+    "speedtest_upload_bits_per_second": ("gauge", "Latest upload throughput"),
+    "speedtest_latency_seconds": ("gauge", "Latest round-trip latency"),
+    "speedtest_jitter_seconds": ("gauge", "Latest latency jitter"),
+    "speedtest_packet_loss_ratio": ("gauge", "Latest share of probes lost"),
+    "speedtest_latency_under_load_seconds": ("gauge", "Latest median latency while a transfer ran"),
+    "speedtest_bufferbloat_delta_seconds": ("gauge", "Latest loaded minus idle median latency"),
+    "speedtest_bufferbloat_grade": ("stateset", "Latest bufferbloat grade"),
+    "speedtest_probe_rtt_seconds": ("histogram", "Latency probe round trips since the exporter started"),
+    "speedtest_load_rtt_seconds": ("histogram", "Latency-under-load samples per phase since the exporter started"),
+    "speedtest_runs": ("counter", "Tests finished since the exporter started"),
+    "speedtest_last_run_timestamp_seconds": ("gauge", "When the latest test of each kind finished"),
+    "speedtest_last_update_timestamp_seconds": ("gauge", "When the latest phase result arrived"),
+}
+
+# Result key -> (family, labels, factor to the base unit)
+GAUGES = {}
+for _protocol in ("tcp", "udp"):
+    GAUGES[f"download_{_protocol}"] = ("speedtest_download_bits_per_second", {"protocol": _protocol}, 1e6)
+    GAUGES[f"upload_{_protocol}"] = ("speedtest_upload_bits_per_second", {"protocol": _protocol}, 1e6)
+for _protocol in PROTOCOLS:
+    GAUGES[f"latency_{_protocol}"] = ("speedtest_latency_seconds", {"protocol": _protocol}, 1e-3)
+    GAUGES[f"jitter_{_protocol}"] = ("speedtest_jitter_seconds", {"protocol": _protocol}, 1e-3)
+    GAUGES[f"packet_loss_{_protocol}"] = ("speedtest_packet_loss_ratio", {"protocol": _protocol}, 1e-2)
+GAUGES["latency_under_load"] = ("speedtest_latency_under_load_seconds", {}, 1e-3)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+def _number(value):
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+class MetricsState:
+    """The exporter's in-memory view of the latest results, kept as rendered text.
+
+    update() takes any part of a results dictionary as soon as a phase has produced
+    it: summary figures replace the previous ones, and the latency sketches under
+    'sketches' are merged into cumulative histograms. The exposition is rendered once
+    per update, so a scrape only reads a bytes object.
+
+    Usage:
+        state = MetricsState()
+        state.update({"download_tcp": 93.4})
+        state.run_finished("full")
+        state.body  # OpenMetrics text
+    """
+
+    def __init__(self, buckets=EXPORTER_LATENCY_BUCKETS):
+        self.buckets = sorted(buckets)
+        self.samples = {family: {} for family in FAMILIES}  # family -> {labels: value}
+        self.histograms = {}  # (family, labels) -> Sketch of milliseconds
+        self.runs = {}        # kind -> count
+        self._lock = threading.Lock()
+        self.body = self._render()
+
+    def _set(self, family, labels, value):
+        self.samples[family][tuple(sorted(labels.items()))] = value
+
+    def _set_figures(self, results):
+        for key, (family, labels, factor) in GAUGES.items():
+            value = results.get(key)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                self._set(family, labels, value * factor)
+        bufferbloat = results.get("bufferbloat")
+        if bufferbloat and bufferbloat.get("delta") is not None:
+            self._set("speedtest_bufferbloat_delta_seconds", {}, bufferbloat["delta"] * 1e-3)
+            for grade in GRADES:
+                self._set("speedtest_bufferbloat_grade", {"speedtest_bufferbloat_grade": grade},
+                          int(grade == bufferbloat["grade"]))
+
+    def _merge(self, family, label, sketches):
+        for name, data in (sketches or {}).items():
+            if not data:
+                continue
+            key = (family, ((label, name),))
+            sketch = Sketch.from_dict(data)
+            if key in self.histograms:
+                self.histograms[key].merge(sketch)
+            else:
+                self.histograms[key] = sketch
+
+    def update(self, results):
+        """Takes the figures and sketches a phase (or a whole run) produced."""
+        with self._lock:
+            self._set_figures(results)
+            sketches = results.get("sketches") or {}
+            self._merge("speedtest_probe_rtt_seconds", "protocol", sketches.get("latency"))
+            self._merge("speedtest_load_rtt_seconds", "phase", sketches.get("load_latency"))
+            self._set("speedtest_last_update_timestamp_seconds", {}, time.time())
+            self.body = self._render()
+
+    def run_finished(self, kind="full"):
+        """Counts a finished test of the given kind ('full' or 'light')."""
+        with self._lock:
+            self.runs[kind] = self.runs.get(kind, 0) + 1
+            self._set("speedtest_runs", {"kind": kind}, self.runs[kind])
+            self._set("speedtest_last_run_timestamp_seconds", {"kind": kind}, time.time())
+            self.body = self._render()
+
+    def seed(self, results, timestamp):
+        """Starts from a stored run: its figures, but no histogram or run counts."""
+        with self._lock:
+            self._set_figures(results)
+            self._set("speedtest_last_run_timestamp_seconds", {"kind": results.get("kind", "full")}, timestamp)
+            self.body = self._render()
+
+    def _histogram_lines(self, family, labels, sketch):
+        lines = []
+        counts = sketch.histogram.cumulative_counts([bound * 1e3 for bound in self.buckets])
+        for bound, count in zip(self.buckets, counts):
+            lines.append(f"{family}_bucket{_labels(labels + (('le', repr(float(bound))),))} {count}")
+        lines.append(f"{family}_bucket{_labels(labels + (('le', '+Inf'),))} {sketch.count}")
+        lines.append(f"{family}_count{_labels(labels)} {sketch.count}")
+        lines.append(f"{family}_sum{_labels(labels)} {_number(sketch.moments.mean * sketch.count * 1e-3)}")
+        return lines
+
+    def _render(self):
+        lines = []
+        for family, (kind, help_text) in FAMILIES.items():
+            if kind == "histogram":
+                series = sorted((labels, sketch) for (name, labels), sketch in self.histograms.items()
+                                if name == family)
+                body = [line for labels, sketch in series for line in self._histogram_lines(family, labels, sketch)]
+            else:
+                suffix = "_total" if kind == "counter" else ""
+                body = [f"{family}{suffix}{_labels(labels)} {_number(value)}"
+                        for labels, value in sorted(self.samples[family].items())]
+            if body:
+                lines += [f"# TYPE {family} {kind}", f"# HELP {family} {help_text}", *body]
+        lines.append("# EOF")
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+def latest_stored_run(db=RESULTS_DB):
+    """(results, timestamp) of the newest run in the result store, or None."""
+    if not os.path.exists(db):
+        return None
+    try:
+        with ResultStore(db) as store:
+            runs = store.query(full=True, limit=1)
+    except (OSError, sqlite3.Error) as e:
+        logger.warning(f"⚠️ Could not read the latest run from {db}: {e}")
+        return None
+    return (runs[0]["results"], runs[0]["ts"]) if runs else None
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.state.body
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes would flood the log
+
+class MetricsExporter:
+    """Serves a MetricsState at http://host:port/metrics from a background thread.
+
+    Scrapes only read the state; they never start a test. Port 0 picks a free port
+    (see .port).
+
+    Usage:
+        exporter = MetricsExporter(port=9469).start()
+        exporter.state.update(results)
+        exporter.stop()
+    """
+
+    def __init__(self, state=None, host=EXPORTER_HOST, port=EXPORTER_PORT):
+        self.state = state if state is not None else MetricsState()
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        self._server = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self._server.daemon_threads = True
+        self._server.state = self.state
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-exporter", daemon=True)
+        self._thread.start()
+        logger.info(f"📈 Serving OpenMetrics at http://{self.host}:{self.port}/metrics")
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = self._thread = None
+
+def start_exporter(port=EXPORTER_PORT, host=EXPORTER_HOST, db=RESULTS_DB):
+    """Starts an exporter seeded with the newest stored run, so it has figures before the first test."""
+    state = MetricsState()
+    latest = latest_stored_run(db)
+    if latest:
+        state.seed(*latest)
+    return MetricsExporter(state, host, port).start()
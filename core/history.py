@@ -0,0 +1,190 @@
+import argparse
+import time
+import warnings
+from datetime import datetime
+import numpy as np
+from config.settings import (RESULTS_DB, HISTORY_DAYS, HISTORY_ROLLING_WINDOW, HISTORY_MIN_SEGMENT,
+                             HISTORY_CHANGE_THRESHOLD, HISTORY_REGRESSION_CHANGE)
+from utils.result_store import ResultStore, METRICS
+
+# Metrics where a higher value is an improvement; for the rest (latency, jitter, loss) lower is better
+HIGHER_IS_BETTER = {"download_tcp", "download_udp", "upload_tcp", "upload_udp"}
+
+def load_history_arrays(store, metrics=METRICS, start=None, end=None, server=None):
+    """Loads stored runs once into columnar arrays.
+
+    Returns:
+        (ts, columns): float64 array of run times (Unix seconds, ascending) and a dict of
+        float64 arrays per metric, with NaN where a run had no value
+    """
+    data = store.columns(metrics, start=start, end=end, server=server)
+    ts = np.asarray(data["ts"], dtype=float)
+    return ts, {name: np.asarray(data[name], dtype=float) for name in metrics}
+
+def rolling_median(values, window=HISTORY_ROLLING_WINDOW):
+    """Median of each run and the window - 1 runs before it, ignoring NaN; NaN until the window fills."""
+    values = np.asarray(values, dtype=float)
+    out = np.full(values.shape, np.nan)
+    if len(values) < window:
+        return out
+    windows = np.lib.stride_tricks.sliding_window_view(values, window)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # All-NaN windows stay NaN
+        out[window - 1:] = np.nanmedian(windows, axis=1)
+    return out
+
+def percentiles(values, qs=(5, 50, 95)):
+    """NaN-aware percentiles; NaN for every q when no run has a value."""
+    values = np.asarray(values, dtype=float)
+    if np.isnan(values).all():
+        return np.full(len(qs), np.nan)
+    return np.nanpercentile(values, qs)
+
+def hourly_baseline(ts, values, utc_offset=None):
+    """Median and run count per local hour of day.
+
+    Args:
+        ts: Run times (Unix seconds)
+        values: Metric values (NaN for missing)
+        utc_offset: Seconds east of UTC (this machine's current offset if None)
+
+    Returns:
+        (medians, counts): arrays of 24 entries, NaN medians for hours without runs
+    """
+    if utc_offset is None:
+        utc_offset = datetime.now().astimezone().utcoffset().total_seconds()
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    hours = (((np.asarray(ts, dtype=float)[valid] + utc_offset) // 3600) % 24).astype(np.intp)
+    order = np.lexsort((values[valid], hours))
+    ordered = values[valid][order]
+    counts = np.bincount(hours, minlength=24)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    medians = np.full(24, np.nan)
+    has = counts > 0
+    low = starts[has] + (counts[has] - 1) // 2
+    high = starts[has] + counts[has] // 2
+    medians[has] = (ordered[low] + ordered[high]) / 2
+    return medians, counts
+
+def _best_split(x, min_size):
+    """Split index maximising the two-sample t statistic between x[:k] and x[k:]."""
+    n = len(x)
+    if n < 2 * min_size:
+        return None, 0.0
+    csum = np.cumsum(x)
+    csum2 = np.cumsum(x * x)
+    k = np.arange(min_size, n - min_size + 1)
+    left_mean = csum[k - 1] / k
+    right_mean = (csum[-1] - csum[k - 1]) / (n - k)
+    left_ss = csum2[k - 1] - k * left_mean ** 2
+    right_ss = (csum2[-1] - csum2[k - 1]) - (n - k) * right_mean ** 2
+    pooled = np.maximum((left_ss + right_ss) / max(n - 2, 1), 1e-12)
+    t = np.abs(left_mean - right_mean) / np.sqrt(pooled * (1 / k + 1 / (n - k)))
+    best = int(np.argmax(t))
+    return int(k[best]), float(t[best])
+
+def change_points(values, min_size=HISTORY_MIN_SEGMENT, threshold=HISTORY_CHANGE_THRESHOLD, max_points=10):
+    """Finds level shifts by binary segmentation; each scan over a segment is vectorised.
+
+    Returns:
+        Sorted indices into values (NaN runs included) where a new level starts
+    """
+    values = np.asarray(values, dtype=float)
+    index = np.flatnonzero(~np.isnan(values))
+    x = values[index]
+    found = []
+    segments = [(0, len(x))]
+    while segments and len(found) < max_points:
+        lo, hi = segments.pop()
+        split, t = _best_split(x[lo:hi], min_size)
+        if split is None or t < threshold:
+            continue
+        found.append(lo + split)
+        segments += [(lo, lo + split), (lo + split, hi)]
+    return sorted(int(index[i]) for i in found)
+
+def regressions(ts, values, metric, points=None, min_change=HISTORY_REGRESSION_CHANGE):
+    """Change points where the metric got worse by at least min_change (relative).
+
+    Returns:
+        List of dicts with 'ts', 'before' and 'after' (segment medians) and 'change'
+    """
+    values = np.asarray(values, dtype=float)
+    points = change_points(values) if points is None else points
+    bounds = [0, *points, len(values)]
+    found = []
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        medians = [np.nanmedian(values[a:b]) for a, b in zip(bounds, bounds[1:])]
+    for i, point in enumerate(points):
+        before, after = medians[i], medians[i + 1]
+        if not before or np.isnan(before) or np.isnan(after):
+            continue
+        change = (after - before) / abs(before)
+        worse = change < 0 if metric in HIGHER_IS_BETTER else change > 0
+        if worse and abs(change) >= min_change:
+            found.append({"ts": float(ts[point]), "before": float(before), "after": float(after),
+                          "change": float(change)})
+    return found
+
+def summarize(ts, columns, window=HISTORY_ROLLING_WINDOW, utc_offset=None):
+    """Per-metric distribution, current rolling median, hour-of-day baseline and regressions."""
+    summary = {"runs": int(len(ts)), "first": float(ts[0]) if len(ts) else None,
+               "last": float(ts[-1]) if len(ts) else None, "metrics": {}}
+    for name, values in columns.items():
+        valid = int(np.count_nonzero(~np.isnan(values)))
+        if not valid:
+            continue
+        p5, p50, p95 = percentiles(values)
+        hourly, _ = hourly_baseline(ts, values, utc_offset)
+        rolling = rolling_median(values, min(window, len(values)))
+        higher_better = name in HIGHER_IS_BETTER
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            worst = int(np.nanargmin(hourly) if higher_better else np.nanargmax(hourly))
+            best = int(np.nanargmax(hourly) if higher_better else np.nanargmin(hourly))
+        points = change_points(values)
+        summary["metrics"][name] = {
+            "count": valid,
+            "p5": float(p5), "median": float(p50), "p95": float(p95),
+            "mean": float(np.nanmean(values)),
+            "rolling_median": float(rolling[-1]) if not np.isnan(rolling[-1]) else None,
+            "hourly_median": [None if np.isnan(m) else float(m) for m in hourly],
+            "worst_hour": worst,
+            "best_hour": best,
+            "change_points": [float(ts[i]) for i in points],
+            "regressions": regressions(ts, values, name, points),
+        }
+    return summary
+
+def _when(ts):
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M")
+
+def print_summary(summary):
+    if not summary["runs"]:
+        print("📭 No stored runs in the selected range.")
+        return
+    print(f"\n📚 {summary['runs']} runs from {_when(summary['first'])} to {_when(summary['last'])}\n")
+    for name, stats in summary["metrics"].items():
+        rolling = f"{stats['rolling_median']:.2f}" if stats["rolling_median"] is not None else "N/A"
+        print(f"📈 {name}: median {stats['median']:.2f} (p5 {stats['p5']:.2f}, p95 {stats['p95']:.2f}), "
+              f"now {rolling} | worst hour {stats['worst_hour']:02d}:00, best {stats['best_hour']:02d}:00")
+        for regression in stats["regressions"]:
+            print(f"   ⚠️ Regression at {_when(regression['ts'])}: {regression['before']:.2f} -> "
+                  f"{regression['after']:.2f} ({regression['change']:+.0%})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize stored speed test history")
+    parser.add_argument("--db", default=RESULTS_DB, help="SQLite result store")
+    parser.add_argument("--days", type=float, default=HISTORY_DAYS, help="how far back to look")
+    parser.add_argument("--server", help="only runs against this server")
+    parser.add_argument("--metrics", nargs="+", default=list(METRICS), choices=METRICS)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    with ResultStore(args.db) as store:
+        ts, columns = load_history_arrays(store, args.metrics, start=time.time() - args.days * 86400,
+                                          server=args.server)
+    print_summary(summarize(ts, columns))
+    print(f"\n⏱️ Summarized in {time.perf_counter() - started:.3f}s")
@@ -0,0 +1,348 @@
+import select
+import ssl
+import threading
+import time
+from urllib.parse import urlsplit
+from config.settings import (DOWNLOAD_CONNECTIONS, DOWNLOAD_RANGE_SIZE, DOWNLOAD_BUFFER_SIZE,
+                             THROUGHPUT_EARLY_STOP)
+from core.resolver import connect, default_resolver
+from core.throughput import IntervalSampler, to_mbps
+from utils.logger import logger
+from utils.retry import retry_call
+
+HEADER_LIMIT = 64 * 1024  # Largest response header block we accept
+
+class HTTPDownloadError(ConnectionError):
+    """Raised when a server response cannot be used for a range download."""
+
+def _parse_url(url):
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError(f"Unsupported download URL: {url}")
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+    return parts.scheme, parts.hostname, port, path
+
+class RangeConnection:
+    """One keep-alive HTTP/1.1 connection that drains range responses into a fixed buffer.
+
+    Response bodies are read with recv_into() into a preallocated buffer and discarded,
+    so memory use does not depend on the size of the object being downloaded. Connect
+    retries stop at deadline (a time.perf_counter() value; None for no limit).
+    """
+
+    def __init__(self, url, buffer_size=DOWNLOAD_BUFFER_SIZE, timeout=10, stop_event=None, deadline=None):
+        self.url = url
+        self.scheme, self.host, self.port, self.path = _parse_url(url)
+        self.timeout = timeout
+        self.stop_event = stop_event
+        self.deadline = deadline
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        self.sock = None
+        self.connect_ms = None     # TCP handshake time of the current socket
+        self.first_byte_ms = None  # Request sent to first response byte, first request on the socket
+        self._sent = None
+        self.bytes = 0
+        self.requests = 0
+
+    def connect(self):
+        def attempt(remaining):
+            timeout = self.timeout if remaining is None else max(0.01, min(self.timeout, remaining))
+            return connect(self.host, self.port, timeout=timeout)
+
+        # Refused or reset connects are retried with jittered backoff within the deadline; timeouts are not
+        sock, self.connect_ms = retry_call(attempt, exceptions=(ConnectionError,), deadline=self.deadline)
+        self.first_byte_ms = None
+        if self.scheme == "https":
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=self.host)
+        self.sock = sock
+
+    def close(self):
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
+    def _request(self, method, start=None, end=None):
+        lines = [f"{method} {self.path} HTTP/1.1", f"Host: {self.host}",
+                 "User-Agent: custom-speed-test", "Accept-Encoding: identity",
+                 "Connection: keep-alive"]
+        if start is not None:
+            lines.append(f"Range: bytes={start}-{end}")
+        self.sock.sendall(("\r\n".join(lines) + "\r\n\r\n").encode("ascii"))
+
+    def _read_headers(self):
+        """Reads the status line and headers; returns (status, headers, body bytes already read)."""
+        filled = 0
+        while True:
+            n = self.sock.recv_into(self.view[filled:HEADER_LIMIT])
+            if not n:
+                raise HTTPDownloadError(f"{self.host} closed the connection before responding")
+            if self._sent is not None:
+                self.first_byte_ms = (time.perf_counter() - self._sent) * 1000
+                self._sent = None
+            filled += n
+            end = self.buffer.find(b"\r\n\r\n", 0, filled)
+            if end != -1:
+                break
+            if filled >= HEADER_LIMIT:
+                raise HTTPDownloadError(f"{self.host} sent an oversized response header")
+
+        head = bytes(self.view[:end]).decode("iso-8859-1").split("\r\n")
+        try:
+            status = int(head[0].split(" ", 2)[1])
+        except (IndexError, ValueError):
+            raise HTTPDownloadError(f"Malformed status line from {self.host}: {head[0]!r}")
+        headers = {}
+        for line in head[1:]:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return status, headers, filled - (end + 4)
+
+    def _drain(self, remaining):
+        """Reads and discards the rest of a response body.
+
+        If the stop event is set mid-body, the connection is dropped instead of finishing it.
+        """
+        view = self.view
+        size = len(view)
+        stop_event = self.stop_event
+        while remaining > 0:
+            if stop_event is not None and stop_event.is_set():
+                self.close()
+                return
+            n = self.sock.recv_into(view, min(remaining, size))
+            if not n:
+                raise HTTPDownloadError(f"{self.host} closed the connection mid-body")
+            remaining -= n
+            self.bytes += n
+
+    def fetch(self, method="GET", start=None, end=None):
+        """Issues one request on the kept-alive connection and drains its body.
+
+        A server that ignores the Range header is read only up to the requested
+        length; the connection is then dropped because the rest of the body is unread.
+
+        Returns:
+            (status, headers) of the response
+        """
+        if self.sock is None:
+            self.connect()
+        if self.first_byte_ms is None:
+            self._sent = time.perf_counter()
+        self._request(method, start, end)
+        status, headers, already_read = self._read_headers()
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            raise HTTPDownloadError(f"{self.host} answered with a chunked body; ranges need Content-Length")
+        length = 0 if method == "HEAD" else int(headers.get("content-length", 0))
+        wanted = length if start is None else min(length, end - start + 1)
+        self.bytes += min(already_read, wanted)
+        self._drain(wanted - already_read)
+        self.requests += 1
+        if self.sock and (wanted < length or headers.get("connection", "").lower() == "close"):
+            self.close()
+        return status, headers
+
+class ConnectionPool:
+    """Keeps keep-alive RangeConnections and object sizes between downloads.
+
+    A long-running process (the scheduler daemon) passes one pool to every http_download()
+    so later runs skip the TCP/TLS handshakes and the object size probe.
+    """
+
+    def __init__(self, max_idle=DOWNLOAD_CONNECTIONS * 2):
+        self.max_idle = max_idle
+        self.idle = []   # Connections parked between downloads, oldest first
+        self.sizes = {}  # url -> (size, ranged)
+        self.reused = 0
+        self.lock = threading.Lock()
+
+    def object_size(self, url, timeout=10):
+        if url not in self.sizes:
+            self.sizes[url] = probe_object_size(url, timeout=timeout)
+        return self.sizes[url]
+
+    @staticmethod
+    def _alive(conn):
+        """An idle keep-alive connection must have nothing to read: readable means the
+        server closed it (or sent stray bytes that would corrupt the next response)."""
+        try:
+            readable, _, _ = select.select([conn.sock], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        return not readable
+
+    def get(self, url, buffer_size=DOWNLOAD_BUFFER_SIZE, timeout=10, stop_event=None, deadline=None):
+        """An idle connection to url if one is still open, otherwise a new (unconnected) one."""
+        with self.lock:
+            for i, conn in enumerate(self.idle):
+                if conn.url == url and len(conn.buffer) == buffer_size:
+                    del self.idle[i]
+                    if self._alive(conn):
+                        conn.timeout, conn.stop_event, conn.deadline = timeout, stop_event, deadline
+                        conn.sock.settimeout(timeout)
+                        conn.bytes = conn.requests = 0
+                        conn.connect_ms = conn.first_byte_ms = None  # No handshake this time
+                        self.reused += 1
+                        return conn
+                    conn.close()
+                    break
+        return RangeConnection(url, buffer_size=buffer_size, timeout=timeout, stop_event=stop_event,
+                               deadline=deadline)
+
+    def put(self, conn):
+        """Parks a connection for reuse; closed or surplus connections are dropped."""
+        if conn.sock is None:
+            return
+        with self.lock:
+            self.idle.append(conn)
+            while len(self.idle) > self.max_idle:
+                self.idle.pop(0).close()
+
+    def close(self):
+        with self.lock:
+            for conn in self.idle:
+                conn.close()
+            self.idle = []
+
+def probe_object_size(url, timeout=10):
+    """Returns (size in bytes, whether the server honours byte ranges) for a download URL."""
+    conn = RangeConnection(url, buffer_size=HEADER_LIMIT, timeout=timeout)
+    try:
+        status, headers = conn.fetch("GET", 0, 0)
+    finally:
+        conn.close()
+    if status == 206 and "/" in headers.get("content-range", ""):
+        total = headers["content-range"].rsplit("/", 1)[1]
+        if total != "*":
+            return int(total), True
+    if status == 200 and "content-length" in headers:
+        return int(headers["content-length"]), False
+    raise HTTPDownloadError(f"Cannot determine object size for {url} (HTTP {status})")
+
+class _RangeQueue:
+    """Hands out consecutive byte ranges to connection threads."""
+
+    def __init__(self, total, range_size):
+        self.total = total
+        self.range_size = range_size
+        self.offset = 0
+        self.lock = threading.Lock()
+
+    def next(self):
+        with self.lock:
+            if self.offset >= self.total:
+                return None
+            start = self.offset
+            self.offset = min(start + self.range_size, self.total)
+            return start, self.offset - 1
+
+def connection_worker(conn, ranges, expected_status, deadline, stop_event, stats, pool=None):
+    """Fetches ranges from ranges.next() over conn until they run out, the deadline passes or
+    stop_event is set; 'elapsed' and any 'error' go into stats. Shared with the process engine."""
+    start = time.perf_counter()
+    try:
+        while not stop_event.is_set() and time.perf_counter() < deadline:
+            byte_range = ranges.next()
+            if byte_range is None:
+                break
+            status, _ = conn.fetch("GET", *byte_range)
+            if status != expected_status:
+                raise HTTPDownloadError(f"{conn.host} answered a range request with HTTP {status}")
+    except (OSError, HTTPDownloadError) as e:
+        stats["error"] = str(e)
+        logger.warning(f"⚠️ Download connection to {conn.host} failed: {e}")
+        conn.close()
+    finally:
+        stats["elapsed"] = time.perf_counter() - start
+        if pool is None:
+            conn.close()
+
+def http_download(url, connections=DOWNLOAD_CONNECTIONS, max_bytes=None, duration=None,
+                  range_size=DOWNLOAD_RANGE_SIZE, buffer_size=DOWNLOAD_BUFFER_SIZE, timeout=10,
+                  early_stop=THROUGHPUT_EARLY_STOP, pool=None):
+    """Downloads a URL over several parallel keep-alive connections using byte ranges.
+
+    Args:
+        url: HTTP(S) URL of the test object
+        connections: Number of parallel connections
+        max_bytes: Stop after this many bytes (whole object if None)
+        duration: Stop after this many seconds (no limit if None)
+        range_size: Bytes requested per range request
+        buffer_size: Receive buffer per connection
+        timeout: Socket timeout (in seconds)
+        early_stop: End the download once interval throughput is stable
+        pool: ConnectionPool to take warm connections from and return them to
+
+    Returns:
+        Dictionary with aggregate 'bytes', 'elapsed' and 'mbps' plus a per-connection
+        breakdown under 'connections'. 'mbps' is the steady-state rate with TCP ramp-up
+        trimmed ('average_mbps' keeps bytes over elapsed time); the 100 ms interval
+        series is under 'throughput'. 'dns_ms' is the (cached) lookup time of the host;
+        each connection reports its 'connect_ms' and 'first_byte_ms', which are None for
+        a pooled connection that needed no handshake.
+    """
+    size, ranged = pool.object_size(url, timeout) if pool else probe_object_size(url, timeout=timeout)
+    total = min(size, max_bytes) if max_bytes else size
+    if not ranged:
+        # Without range support every connection would fetch the same bytes.
+        logger.warning(f"⚠️ {url} ignores byte ranges; downloading over a single connection.")
+        connections, range_size = 1, total
+
+    ranges = _RangeQueue(total, range_size)
+    stop_event = threading.Event()
+    # The transfer deadline also bounds the connect retries
+    deadline = time.perf_counter() + duration if duration else None
+    if pool:
+        conns = [pool.get(url, buffer_size, timeout, stop_event, deadline) for _ in range(connections)]
+    else:
+        conns = [RangeConnection(url, buffer_size=buffer_size, timeout=timeout, stop_event=stop_event,
+                                 deadline=deadline)
+                 for _ in range(connections)]
+    stats = [{} for _ in conns]
+    sampler = IntervalSampler(early_stop=early_stop)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=connection_worker, args=(conn, ranges, 206 if ranged else 200,
+                                                                 deadline or float('inf'), stop_event, s, pool))
+               for conn, s in zip(conns, stats)]
+    sampler.start(lambda: sum(conn.bytes for conn in conns), stop_event)
+    # Range bodies in flight are cut off at the deadline, not drained to their end
+    timer = threading.Timer(duration, stop_event.set) if duration else None
+    if timer:
+        timer.start()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if timer:
+        timer.cancel()
+    elapsed = time.perf_counter() - start
+    throughput = sampler.stop()
+    if pool:
+        for conn in conns:
+            pool.put(conn)
+
+    per_connection = []
+    for conn, s in zip(conns, stats):
+        entry = {"bytes": conn.bytes, "requests": conn.requests, "elapsed": s["elapsed"],
+                 "mbps": to_mbps(conn.bytes, s["elapsed"]), "connect_ms": conn.connect_ms,
+                 "first_byte_ms": conn.first_byte_ms}
+        if "error" in s:
+            entry["error"] = s["error"]
+        per_connection.append(entry)
+
+    received = sum(conn.bytes for conn in conns)
+    return {
+        "url": url,
+        "object_size": size,
+        "dns_ms": default_resolver().resolve(conns[0].host).dns_ms,
+        "bytes": received,
+        "elapsed": elapsed,
+        "mbps": throughput["steady_mbps"] or to_mbps(received, elapsed),
+        "average_mbps": to_mbps(received, elapsed),
+        "connections": per_connection,
+        "throughput": throughput,
+    }
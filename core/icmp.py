@@ -0,0 +1,179 @@
+import asyncio
+import os
+import select
+import socket
+import struct
+import sys
+import threading
+import time
+from itertools import count
+from utils.logger import logger
+
+# Linux socket options for kernel receive timestamps (not exported by the socket module)
+SO_TIMESTAMPNS = 35 if sys.platform.startswith("linux") else None
+SCM_TIMESTAMPNS = SO_TIMESTAMPNS
+_TIMESPEC = struct.Struct("@ll")
+
+ICMP_ECHO = {socket.AF_INET: (8, 0), socket.AF_INET6: (128, 129)}  # (request, reply) types
+_HEADER = struct.Struct("!BBHHH")  # type, code, checksum, identifier, sequence
+_STAMP = struct.Struct("!Q")
+PAYLOAD_PAD = b"custom-speed-test-icmp-probe"
+
+def _checksum(data):
+    if len(data) % 2:
+        data += b"\0"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+def resolve(host, family=None):
+    """Resolves host to (family, address) once, preferring IPv4."""
+    infos = socket.getaddrinfo(host, None, family or socket.AF_UNSPEC, socket.SOCK_DGRAM)
+    infos.sort(key=lambda info: info[0] != socket.AF_INET)
+    return infos[0][0], infos[0][4][0]
+
+class IcmpSocket:
+    """A long-lived ICMP echo socket that matches replies to requests by sequence number.
+
+    Unprivileged ping sockets (SOCK_DGRAM/IPPROTO_ICMP) are used where the kernel allows
+    them (net.ipv4.ping_group_range), raw sockets otherwise. When SO_TIMESTAMPNS is
+    available, RTTs use the kernel's receive timestamp instead of the time Python got
+    around to reading the reply.
+    """
+
+    def __init__(self, family=socket.AF_INET):
+        proto = socket.IPPROTO_ICMP if family == socket.AF_INET else socket.IPPROTO_ICMPV6
+        try:
+            self.sock = socket.socket(family, socket.SOCK_DGRAM, proto)
+            self.raw = False
+        except PermissionError:
+            self.sock = socket.socket(family, socket.SOCK_RAW, proto)
+            self.raw = True
+        self.family = family
+        self.request_type, self.reply_type = ICMP_ECHO[family]
+        # Ping sockets rewrite the identifier to their local port; raw sockets keep ours.
+        self.ident = os.getpid() & 0xFFFF
+        self.kernel_timestamps = False
+        if SO_TIMESTAMPNS is not None:
+            try:
+                self.sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+                self.kernel_timestamps = True
+            except OSError:
+                pass
+        self._seq = count(1)
+        self._inflight = {}  # seq -> (address, send realtime ns, send monotonic ns)
+        self._waiters = {}   # seq -> future (asyncio mode)
+        self._lock = threading.Lock()
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def close(self):
+        self.sock.close()
+
+    def send(self, address):
+        """Sends one echo request to an IP address; returns its sequence number."""
+        seq = next(self._seq) & 0xFFFF
+        stamp = _STAMP.pack(time.perf_counter_ns())
+        body = stamp + PAYLOAD_PAD
+        header = _HEADER.pack(self.request_type, 0, 0, self.ident, seq)
+        if self.family == socket.AF_INET:
+            header = _HEADER.pack(self.request_type, 0, _checksum(header + body), self.ident, seq)
+        # ICMPv6 checksums cover a pseudo-header, so the kernel always fills them in.
+        with self._lock:
+            self._inflight[seq] = (address, time.time_ns(), time.perf_counter_ns())
+        self.sock.sendto(header + body, (address, 0))
+        return seq
+
+    def _parse(self, data, ancdata, sender):
+        """Returns (seq, rtt ms) for a matching echo reply, or None."""
+        if self.raw and self.family == socket.AF_INET:
+            data = data[(data[0] & 0x0F) * 4:]  # Raw IPv4 sockets include the IP header
+        if len(data) < _HEADER.size:
+            return None
+        msg_type, _, _, ident, seq = _HEADER.unpack_from(data)
+        if msg_type != self.reply_type or (self.raw and ident != self.ident):
+            return None
+        with self._lock:
+            sent = self._inflight.get(seq)
+            if sent is None or sent[0] != sender[0]:
+                return None
+            del self._inflight[seq]
+        for level, kind, value in ancdata:
+            if level == socket.SOL_SOCKET and kind == SCM_TIMESTAMPNS and len(value) >= _TIMESPEC.size:
+                sec, nsec = _TIMESPEC.unpack_from(value)
+                return seq, (sec * 1_000_000_000 + nsec - sent[1]) / 1e6
+        return seq, (time.perf_counter_ns() - sent[2]) / 1e6
+
+    def _recv(self):
+        ancsize = socket.CMSG_SPACE(_TIMESPEC.size) if self.kernel_timestamps else 0
+        data, ancdata, _, sender = self.sock.recvmsg(2048, ancsize)
+        return self._parse(data, ancdata, sender)
+
+    def forget(self, seq):
+        """Drops a request that will no longer be waited for."""
+        with self._lock:
+            self._inflight.pop(seq, None)
+
+    def ping(self, host, count=1, interval=0.0, timeout=2.0):
+        """Sends count echo requests on a fixed schedule and waits for their replies.
+
+        Returns:
+            List of RTTs in ms (None for requests without a reply), in send order
+        """
+        _, address = resolve(host, self.family)
+        rtts = {}
+        seqs = []
+        start = time.perf_counter()
+        end = start + (count - 1) * interval + timeout
+        while time.perf_counter() < end and len(rtts) < count:
+            now = time.perf_counter()
+            if len(seqs) < count and now >= start + len(seqs) * interval:
+                seqs.append(self.send(address))
+                continue
+            next_send = start + len(seqs) * interval if len(seqs) < count else end
+            ready, _, _ = select.select([self.sock], [], [], max(0.0, min(next_send, end) - now))
+            if ready:
+                reply = self._recv()
+                if reply and reply[0] in seqs:
+                    rtts[reply[0]] = reply[1]
+        for seq in seqs:
+            self.forget(seq)
+        return [rtts.get(seq) for seq in seqs] + [None] * (count - len(seqs))
+
+    # asyncio integration: one reader callback serves every outstanding echo.
+
+    def _on_readable(self):
+        while True:
+            try:
+                reply = self._recv()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                logger.debug(f"ICMP receive failed: {e}")
+                return
+            if reply:
+                future = self._waiters.pop(reply[0], None)
+                if future and not future.done():
+                    future.set_result(reply[1])
+
+    def attach(self, loop):
+        """Registers the socket with an event loop so echo() can be awaited."""
+        self.sock.setblocking(False)
+        loop.add_reader(self.sock.fileno(), self._on_readable)
+
+    def detach(self, loop):
+        loop.remove_reader(self.sock.fileno())
+        self.sock.setblocking(True)
+
+    async def echo(self, address):
+        """Sends one echo request to an IP address and awaits its RTT in ms."""
+        future = asyncio.get_running_loop().create_future()
+        seq = self.send(address)
+        self._waiters[seq] = future
+        try:
+            return await future
+        finally:
+            self._waiters.pop(seq, None)
+            self.forget(seq)
@@ -1,42 +1,60 @@
+import asyncio
 import socket
 import time
 import statistics
 import subprocess
 import threading
-from config.settings import LATENCY_TEST_HOSTS, LATENCY_ATTEMPTS
+from config.settings import (LATENCY_TEST_HOSTS, LATENCY_ATTEMPTS, LATENCY_TIMEOUT,
+                             LATENCY_INTERVAL, LATENCY_DEADLINE, UDP_REFLECTOR)
+from core.bufferbloat import LoadLatencySampler
+from core.icmp import IcmpSocket, resolve as resolve_icmp
+from core.metrics import Sketch, merge_sketches
+from core.profiler import record_send_delay
+from core.resolver import connect, async_connect
+from core.udp_probe import udp_probe_stream
 from utils.logger import logger
 
 PING_ATTEMPTS = LATENCY_ATTEMPTS
+PROTOCOLS = ["tcp", "udp", "icmp"]
 
 def safe_format(value, precision=2, suffix="ms"):
     """Safely format numerical values; return 'N/A' if None."""
     return f"{value:.{precision}f} {suffix}" if value is not None else "N/A"
 
 def tcp_ping(host, port=80):
-    """Ping a server over TCP."""
+    """Ping a server over TCP; the host is resolved once and cached, so only the handshake is timed."""
     try:
-        start = time.time()
-        sock = socket.create_connection((host, port), timeout=2)
+        sock, rtt = connect(host, port, timeout=LATENCY_TIMEOUT)
         sock.close()
-        return (time.time() - start) * 1000  # ms
+        return rtt  # ms
     except Exception:
         return None
 
 def udp_ping(host, port=33434):
     """Ping a server over UDP using traceroute-like behavior."""
     try:
-        start = time.time()
+        start = time.perf_counter_ns()
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.settimeout(2)
+        sock.settimeout(LATENCY_TIMEOUT)
         sock.sendto(b'', (host, port))
         sock.recvfrom(512)
         sock.close()
-        return (time.time() - start) * 1000  # ms
+        return (time.perf_counter_ns() - start) / 1e6  # ms
     except Exception:
         return None
 
-def icmp_ping(host):
-    """Ping a server using ICMP."""
+_icmp_sockets = {}
+_icmp_lock = threading.Lock()
+
+def open_icmp_socket(family=socket.AF_INET):
+    """Opens a native ICMP echo socket, or returns None when neither ping nor raw sockets are allowed."""
+    try:
+        return IcmpSocket(family)
+    except OSError as e:
+        logger.warning(f"⚠️ Native ICMP unavailable ({e}); falling back to the ping binary.", protocol="ICMP")
+        return None
+
+def _subprocess_ping(host):
     try:
         output = subprocess.run(["ping", "-c", "1", host],
                                 stdout=subprocess.PIPE,
@@ -51,64 +69,267 @@ def icmp_ping(host):
     except Exception:
         return None
 
-def measure_latency_under_load(host, protocol, duration=10):
-    """Measure latency during load to detect bufferbloat."""
+def icmp_ping(host, timeout=LATENCY_TIMEOUT):
+    """Ping a server using ICMP over a shared, long-lived echo socket."""
+    try:
+        family, _ = resolve_icmp(host)
+    except OSError:
+        return None
+    with _icmp_lock:
+        if family not in _icmp_sockets:
+            _icmp_sockets[family] = open_icmp_socket(family)
+        icmp = _icmp_sockets[family]
+        if icmp is None:
+            return _subprocess_ping(host)
+        try:
+            return icmp.ping(host, timeout=timeout)[0]
+        except OSError:
+            return None
+
+def measure_latency_under_load(host, protocol="tcp", duration=10, port=80, phase="load"):
+    """Measure latency during load to detect bufferbloat.
+
+    Runs a LoadLatencySampler against host for duration seconds. UDP has no universal
+    responder, so it is sampled with TCP connects like the default.
+
+    Returns:
+        (thread, latencies): join the thread, then latencies holds the successful samples in ms
+    """
     latencies = []
 
-    def ping_during_load():
-        end_time = time.time() + duration
-        while time.time() < end_time:
-            if protocol == "tcp":
-                latency = tcp_ping(host)
-            elif protocol == "udp":
-                latency = udp_ping(host)
-            else:
-                latency = icmp_ping(host)
-            if latency is not None:
-                latencies.append(latency)
-            time.sleep(1)
-
-    ping_thread = threading.Thread(target=ping_during_load)
+    def keep(sample_phase, rtt):
+        if sample_phase == phase and rtt is not None:
+            latencies.append(rtt)
+
+    sampler = LoadLatencySampler(host, port, protocol="icmp" if protocol == "icmp" else "tcp", on_sample=keep)
+
+    def sample_during_load():
+        try:
+            sampler.start()
+        except OSError as e:
+            logger.warning(f"⚠️ Cannot sample latency to {host}: {e}", protocol=protocol.upper())
+            return
+        with sampler.phase(phase):
+            time.sleep(duration)
+        sampler.stop()
+
+    ping_thread = threading.Thread(target=sample_during_load)
     ping_thread.start()
     return ping_thread, latencies
 
-def latency_test():
-    """Measures latency, jitter, and packet loss across multiple servers with protocol diversity."""
-    results = {}
+async def _tcp_probe(host, port=80):
+    """One non-blocking TCP connect (Happy Eyeballs over the cached addresses); returns the handshake time in ms."""
+    sock, rtt = await async_connect(host, port, timeout=LATENCY_TIMEOUT)
+    sock.close()
+    return rtt
 
-    for host in LATENCY_TEST_HOSTS:
-        protocols = ["tcp", "udp", "icmp"]
-        for protocol in protocols:
-            latencies = []
-            for attempt in range(PING_ATTEMPTS):
-                if protocol == "tcp":
-                    latency = tcp_ping(host)
-                elif protocol == "udp":
-                    latency = udp_ping(host)
-                else:
-                    latency = icmp_ping(host)
+async def _udp_probe(host, port=33434):
+    """One datagram round trip on a connected UDP socket; returns the RTT in ms."""
+    loop = asyncio.get_running_loop()
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    with socket.socket(family, socket.SOCK_DGRAM) as sock:
+        sock.setblocking(False)
+        sock.connect((host, port))
+        start = time.perf_counter_ns()
+        await loop.sock_sendall(sock, b'')
+        await loop.sock_recv(sock, 512)
+        return (time.perf_counter_ns() - start) / 1e6
+
+async def _subprocess_icmp_probe(host):
+    """One ICMP echo via the system ping binary, for when no ICMP socket can be opened."""
+    proc = await asyncio.create_subprocess_exec("ping", "-c", "1", host,
+                                                stdout=asyncio.subprocess.PIPE,
+                                                stderr=asyncio.subprocess.DEVNULL)
+    try:
+        stdout, _ = await proc.communicate()
+    except asyncio.CancelledError:
+        proc.kill()
+        await proc.wait()
+        raise
+    for line in stdout.decode(errors="replace").split("\n"):
+        if "time=" in line:
+            return float(line.split("time=")[-1].split(" ")[0])
+    raise ConnectionError(f"No ICMP reply from {host}")
+
+def _icmp_prober(hosts, loop, sockets, warm=None):
+    """Builds the ICMP probe for one run: one attached echo socket per address family.
+
+    Sockets found in warm (family -> IcmpSocket) are reused, and new ones are added to it.
+    """
+    addresses = {}
+    for host in hosts:
+        try:
+            addresses[host] = resolve_icmp(host)
+        except OSError:
+            pass
+    for family in {family for family, _ in addresses.values()}:
+        icmp = warm.get(family) if warm is not None else None
+        if icmp is None:
+            icmp = open_icmp_socket(family)
+        if icmp is None:
+            return _subprocess_icmp_probe
+        if warm is not None:
+            warm[family] = icmp
+        icmp.attach(loop)
+        sockets[family] = icmp
 
+    async def probe(host):
+        if host not in addresses:
+            raise ConnectionError(f"Cannot resolve {host}")
+        family, address = addresses[host]
+        return await sockets[family].echo(address)
+    return probe
+
+async def _timed_probe(probe, host, timeout, samples, attempt):
+    try:
+        samples[attempt] = await asyncio.wait_for(probe(host), timeout)
+    except (OSError, ConnectionError, asyncio.TimeoutError, ValueError):
+        samples[attempt] = None
+
+async def _probe_stream(host, probe, attempts, first_send_ns, interval_ns, timeout, samples):
+    """Runs one host/protocol stream on a fixed send schedule, filling samples in place.
+
+    Probes are launched on schedule without waiting for earlier replies, so an
+    unreachable host costs one timeout per stream rather than one per attempt.
+    """
+    inflight = []
+    for attempt in range(attempts):
+        planned_ns = first_send_ns + attempt * interval_ns
+        delay = (planned_ns - time.perf_counter_ns()) / 1e9
+        if delay > 0:
+            await asyncio.sleep(delay)
+        record_send_delay(planned_ns, time.perf_counter_ns())
+        inflight.append(asyncio.ensure_future(_timed_probe(probe, host, timeout, samples, attempt)))
+    try:
+        await asyncio.gather(*inflight)
+    finally:
+        for task in inflight:
+            task.cancel()
+
+async def _run_probes(hosts, protocols, attempts, interval, timeout, deadline, warm_icmp=None):
+    loop = asyncio.get_running_loop()
+    icmp_sockets = {}
+    probes = {"tcp": _tcp_probe, "udp": _udp_probe}
+    if "icmp" in protocols:
+        probes["icmp"] = _icmp_prober(hosts, loop, icmp_sockets, warm_icmp)
+
+    streams = [(host, protocol) for host in hosts for protocol in protocols]
+    samples = {stream: [None] * attempts for stream in streams}
+    interval_ns = int(interval * 1e9)
+    start_ns = time.perf_counter_ns()
+    # Streams are staggered across one interval so their probes do not go out in bursts.
+    tasks = [asyncio.ensure_future(_probe_stream(host, probes[protocol], attempts,
+                                                 start_ns + i * interval_ns // len(streams),
+                                                 interval_ns, timeout, samples[(host, protocol)]))
+             for i, (host, protocol) in enumerate(streams)]
+    try:
+        _, pending = await asyncio.wait(tasks, timeout=deadline)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+            logger.warning(f"⚠️ Latency test hit its {deadline}s deadline; unfinished probes count as lost.")
+    finally:
+        for icmp in icmp_sockets.values():
+            icmp.detach(loop)
+            if warm_icmp is None:
+                icmp.close()
+    return samples
+
+def _run_udp_stream(reflector, stream):
+    try:
+        stream.update(udp_probe_stream(*reflector))
+    except OSError as e:
+        logger.warning(f"⚠️ UDP probe stream to {reflector[0]} failed: {e}", protocol="UDP")
+
+def _protocol_summary(results, udp_stream):
+    """Averages the per-host results into the latency_/jitter_/packet_loss_{protocol} fields.
+
+    The per-host sketches are merged into one latency distribution per protocol under 'sketches'.
+    """
+    summary = {"sketches": {}}
+    for protocol in PROTOCOLS:
+        entries = [results[key] for key in results if key.endswith(f"_{protocol}")]
+        merged = merge_sketches(e["sketch"] for e in entries)
+        if merged is not None:
+            summary["sketches"][protocol] = merged.to_dict()
+        latencies = [e["avg_latency"] for e in entries if e["avg_latency"] is not None]
+        jitters = [e["jitter"] for e in entries if e["jitter"] is not None]
+        summary[f"latency_{protocol}"] = statistics.mean(latencies) if latencies else None
+        summary[f"jitter_{protocol}"] = statistics.mean(jitters) if jitters else None
+        summary[f"packet_loss_{protocol}"] = statistics.mean(e["packet_loss"] for e in entries) if entries else None
+    if udp_stream:
+        # A reflector answers every packet, so its stream is the real UDP measurement.
+        summary["latency_udp"] = udp_stream["avg_latency"]
+        summary["jitter_udp"] = udp_stream["jitter"]
+        summary["packet_loss_udp"] = udp_stream["packet_loss"]
+        summary["sketches"]["udp"] = udp_stream["sketch"]
+    return summary
+
+def latency_test(hosts=LATENCY_TEST_HOSTS, attempts=PING_ATTEMPTS, interval=LATENCY_INTERVAL,
+                 timeout=LATENCY_TIMEOUT, deadline=LATENCY_DEADLINE, udp_reflector=UDP_REFLECTOR,
+                 icmp_sockets=None):
+    """Measures latency, jitter, and packet loss across multiple servers with protocol diversity.
+
+    All host/protocol probe streams run concurrently on one event loop, each sending
+    on a fixed schedule, and the whole run is bounded by deadline (in seconds). When a
+    UDP reflector (host, port) is configured, a sequenced UDP probe stream runs alongside
+    and supplies the UDP latency, jitter and loss figures. A long-running caller can pass
+    an icmp_sockets dict (family -> IcmpSocket) that keeps the echo sockets open between runs.
+    """
+    udp_stream = {}
+    udp_thread = None
+    if udp_reflector:
+        udp_thread = threading.Thread(target=_run_udp_stream, args=(udp_reflector, udp_stream))
+        udp_thread.start()
+    samples = asyncio.run(_run_probes(hosts, PROTOCOLS, attempts, interval, timeout, deadline, icmp_sockets))
+    if udp_thread:
+        udp_thread.join()
+    results = {}
+
+    for host in hosts:
+        for protocol in PROTOCOLS:
+            latencies = samples[(host, protocol)]
+            # Probe logging happens after the timed section so it cannot skew samples.
+            for attempt, latency in enumerate(latencies):
                 if latency is not None:
-                    latencies.append(latency)
                     logger.debug(f"{protocol.upper()} Ping {attempt + 1} to {host}: {latency:.2f} ms")
                 else:
                     logger.warning(f"{protocol.upper()} Ping {attempt + 1} to {host} failed.")
-                time.sleep(0.1)
 
-            successful_pings = [l for l in latencies if l is not None]
-            packet_loss = ((PING_ATTEMPTS - len(successful_pings)) / PING_ATTEMPTS) * 100
-            avg_latency = statistics.mean(successful_pings) if successful_pings else None
-            jitter = statistics.stdev(successful_pings) if len(successful_pings) > 1 else None
+            sketch = Sketch().add_many(latencies)
+            stats = sketch.summary()
+            packet_loss = sketch.loss
+            avg_latency = stats["mean"]
+            jitter = stats["stdev"]
 
             results[f"{host}_{protocol}"] = {
                 "avg_latency": avg_latency,
                 "jitter": jitter,
-                "packet_loss": packet_loss
+                "packet_loss": packet_loss,
+                "p50": stats["p50"],
+                "p90": stats["p90"],
+                "p99": stats["p99"],
+                "max": stats["max"],
+                "sketch": sketch.to_dict(),
             }
 
             print(f"\n📡 **{host} ({protocol.upper()})**\n"
                   f"  - Avg Latency: {safe_format(avg_latency)}\n"
                   f"  - Jitter: {safe_format(jitter)}\n"
+                  f"  - p50/p90/p99: {safe_format(stats['p50'])} / {safe_format(stats['p90'])} / "
+                  f"{safe_format(stats['p99'])}\n"
                   f"  - Packet Loss: {safe_format(packet_loss, suffix='%')}\n")
 
-    return results
\ No newline at end of file
+    if udp_stream:
+        results["udp_stream"] = udp_stream
+        print(f"\n📡 **{udp_reflector[0]} (UDP stream, {udp_stream['sent']} packets)**\n"
+              f"  - Avg Latency: {safe_format(udp_stream['avg_latency'])}\n"
+              f"  - Jitter (RFC 3550): {safe_format(udp_stream['jitter'])}\n"
+              f"  - Packet Loss: {safe_format(udp_stream['packet_loss'], suffix='%')} "
+              f"(forward {safe_format(udp_stream['forward_loss'], suffix='%')}, "
+              f"return {safe_format(udp_stream['return_loss'], suffix='%')})\n"
+              f"  - Reordered: {udp_stream['reordered']} | Duplicates: {udp_stream['duplicates']}\n")
+
+    results.update(_protocol_summary(results, udp_stream))
+    return results
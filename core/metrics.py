@@ -0,0 +1,241 @@
+import math
+from array import array
+from config.settings import SKETCH_RELATIVE_ACCURACY, SKETCH_MIN_VALUE, SKETCH_MAX_VALUE
+
+class RunningMoments:
+    """Count, mean, variance (Welford), min and max of a stream in constant memory."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        """Folds other into self exactly (Chan et al. parallel update)."""
+        if not other.count:
+            return self
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self.m2 += other.m2 + delta * delta * self.count * other.count / total
+        self.count = total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def stdev(self):
+        """Sample standard deviation (as statistics.stdev), None below two values."""
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else None
+
+class LogHistogram:
+    """Fixed-size histogram with logarithmic buckets (HDR/DDSketch style).
+
+    Every value in [min_value, max_value] lands in a bucket whose representative is
+    within relative_accuracy of it, so quantiles carry that relative error at most.
+    Smaller values (including zero) share one underflow bucket; larger ones are
+    clamped into the top bucket. Histograms with the same settings merge exactly by
+    adding bucket counts.
+    """
+
+    def __init__(self, relative_accuracy=SKETCH_RELATIVE_ACCURACY, min_value=SKETCH_MIN_VALUE,
+                 max_value=SKETCH_MAX_VALUE):
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.max_value = max_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.offset = math.ceil(math.log(min_value) / self._log_gamma)
+        size = math.ceil(math.log(max_value) / self._log_gamma) - self.offset + 1
+        self.counts = array("Q", bytes(8 * size))
+        self.underflow = 0
+        self.count = 0
+
+    def _config(self):
+        return self.relative_accuracy, self.min_value, self.max_value
+
+    def add(self, value, count=1):
+        if value < self.min_value:
+            self.underflow += count
+        else:
+            index = math.ceil(math.log(value) / self._log_gamma) - self.offset
+            self.counts[min(index, len(self.counts) - 1)] += count
+        self.count += count
+
+    def merge(self, other):
+        if other._config() != self._config():
+            raise ValueError("Cannot merge histograms with different accuracy or range")
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.underflow += other.underflow
+        self.count += other.count
+        return self
+
+    def _value(self, index):
+        return 2 * self.gamma ** (index + self.offset) / (self.gamma + 1)
+
+    def quantile(self, q):
+        """Value at quantile q (0-1), or None when empty. Underflow reads as 0."""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.underflow
+        if rank < seen:
+            return 0.0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if rank < seen:
+                return self._value(index)
+        return self._value(len(self.counts) - 1)
+
+    def cumulative_counts(self, bounds):
+        """Number of values at or below each bound (ascending), to bucket resolution.
+
+        A bucket counts toward a bound once its upper edge is within it; underflow
+        counts toward every bound.
+        """
+        counts, seen, index = [], self.underflow, 0
+        for bound in bounds:
+            while index < len(self.counts) and self.gamma ** (index + self.offset) <= bound:
+                seen += self.counts[index]
+                index += 1
+            counts.append(seen)
+        return counts
+
+    def to_dict(self):
+        return {"relative_accuracy": self.relative_accuracy, "min_value": self.min_value,
+                "max_value": self.max_value, "underflow": self.underflow,
+                "buckets": [[index, count] for index, count in enumerate(self.counts) if count]}
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(data["relative_accuracy"], data["min_value"], data["max_value"])
+        for index, count in data["buckets"]:
+            histogram.counts[index] = count
+        histogram.underflow = data["underflow"]
+        histogram.count = histogram.underflow + sum(count for _, count in data["buckets"])
+        return histogram
+
+class Sketch:
+    """A mergeable, serializable summary of one metric series in constant memory.
+
+    Combines RunningMoments (exact count, mean, stdev, min, max) with a LogHistogram
+    (p50/p90/p99 within the relative accuracy). None values are counted as missing,
+    which is how lost probes are recorded.
+    """
+
+    def __init__(self, relative_accuracy=SKETCH_RELATIVE_ACCURACY, min_value=SKETCH_MIN_VALUE,
+                 max_value=SKETCH_MAX_VALUE):
+        self.moments = RunningMoments()
+        self.histogram = LogHistogram(relative_accuracy, min_value, max_value)
+        self.missing = 0
+
+    def add(self, value):
+        if value is None:
+            self.missing += 1
+            return
+        self.moments.add(value)
+        self.histogram.add(value)
+
+    def add_many(self, values):
+        for value in values:
+            self.add(value)
+        return self
+
+    def merge(self, other):
+        """Folds another sketch (same accuracy and range) into this one without loss."""
+        self.histogram.merge(other.histogram)
+        self.moments.merge(other.moments)
+        self.missing += other.missing
+        return self
+
+    @property
+    def count(self):
+        return self.moments.count
+
+    @property
+    def mean(self):
+        return self.moments.mean if self.moments.count else None
+
+    @property
+    def stdev(self):
+        return self.moments.stdev
+
+    @property
+    def loss(self):
+        """Share of missing values in percent, None for an empty sketch."""
+        total = self.count + self.missing
+        return self.missing / total * 100 if total else None
+
+    def quantile(self, q):
+        """Quantile q (0-1), clamped to the exact min and max (returned as is for q of 0 and 1)."""
+        value = self.histogram.quantile(q)
+        if value is None:
+            return None
+        if q <= 0:
+            return self.moments.min
+        if q >= 1:
+            return self.moments.max
+        return min(max(value, self.moments.min), self.moments.max)
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "missing": self.missing,
+            "mean": self.mean,
+            "stdev": self.stdev,
+            "min": self.moments.min if self.count else None,
+            "max": self.moments.max if self.count else None,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+        }
+
+    def to_dict(self):
+        """JSON-serializable form for result files; Sketch.from_dict() restores it."""
+        m = self.moments
+        return {"count": m.count, "mean": m.mean, "m2": m.m2,
+                "min": m.min if m.count else None, "max": m.max if m.count else None,
+                "missing": self.missing, "histogram": self.histogram.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = LogHistogram.from_dict(data["histogram"])
+        sketch = cls(histogram.relative_accuracy, histogram.min_value, histogram.max_value)
+        sketch.histogram = histogram
+        sketch.missing = data["missing"]
+        m = sketch.moments
+        m.count, m.mean, m.m2 = data["count"], data["mean"], data["m2"]
+        if m.count:
+            m.min, m.max = data["min"], data["max"]
+        return sketch
+
+def merge_sketches(sketches):
+    """Merges sketches (Sketch objects or their dicts) into a new Sketch; None if there are none."""
+    merged = None
+    for sketch in sketches:
+        if isinstance(sketch, dict):
+            sketch = Sketch.from_dict(sketch)
+        if merged is None:
+            merged = Sketch(*sketch.histogram._config())
+        merged.merge(sketch)
+    return merged
+
+def merge_sketch_trees(old, new):
+    """Merges two nested dicts of serialized sketches (like results['sketches']) key by key."""
+    if isinstance(old, dict) and isinstance(new, dict):
+        if "histogram" in old and "histogram" in new:
+            return merge_sketches([old, new]).to_dict()
+        return {key: merge_sketch_trees(old.get(key), new.get(key)) for key in old.keys() | new.keys()}
+    return new if new is not None else old
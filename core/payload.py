@@ -0,0 +1,78 @@
+import os
+import string
+import threading
+from config.settings import PAYLOAD_BLOCK_SIZE, PAYLOAD_CHUNK_SIZE, PAYLOAD_KIND
+
+PAYLOAD_KINDS = ("random", "text", "zeros")
+
+# Maps every byte value onto a printable alphabet, so random bytes become text-like
+# data that compresses roughly like real-world text instead of not at all.
+_TEXT_ALPHABET = (string.ascii_letters + string.digits + " \n!@#$%^&*()_+").encode("ascii")
+_TEXT_TABLE = bytes(_TEXT_ALPHABET[i % len(_TEXT_ALPHABET)] for i in range(256))
+
+_blocks = {}
+_blocks_lock = threading.Lock()
+
+def _generate_block(kind, size):
+    if kind == "random":
+        return os.urandom(size)
+    if kind == "text":
+        return os.urandom(size).translate(_TEXT_TABLE)
+    if kind == "zeros":
+        return bytes(size)
+    raise ValueError(f"Unknown payload kind: {kind} (expected one of {', '.join(PAYLOAD_KINDS)})")
+
+def payload_block(kind=PAYLOAD_KIND, size=PAYLOAD_BLOCK_SIZE):
+    """Returns a read-only view of the cached source block for a payload kind.
+
+    The block is generated once per (kind, size) and shared by every payload, so
+    building a payload of any length costs no extra memory or CPU.
+    """
+    key = (kind, size)
+    block = _blocks.get(key)
+    if block is None:
+        with _blocks_lock:
+            block = _blocks.get(key)
+            if block is None:
+                block = _blocks[key] = memoryview(_generate_block(kind, size))
+    return block
+
+def iter_payload(size, kind=PAYLOAD_KIND, chunk_size=PAYLOAD_CHUNK_SIZE):
+    """Yields memoryview chunks over the cached block until size bytes have been produced."""
+    block = payload_block(kind)
+    chunk_size = min(chunk_size, len(block))
+    offset = 0
+    while size > 0:
+        if offset + chunk_size > len(block):
+            offset = 0
+        n = min(chunk_size, size)
+        yield block[offset:offset + n]
+        offset += n
+        size -= n
+
+class Payload:
+    """A lazily produced upload body of a fixed size.
+
+    Iterating yields memoryview chunks, so it can be passed straight to socket.sendall()
+    loops or to HTTP clients that accept an iterable body, while memory use stays at one
+    cached block however large size is.
+    """
+
+    def __init__(self, size, kind=PAYLOAD_KIND, chunk_size=PAYLOAD_CHUNK_SIZE):
+        if kind not in PAYLOAD_KINDS:
+            raise ValueError(f"Unknown payload kind: {kind} (expected one of {', '.join(PAYLOAD_KINDS)})")
+        self.size = size
+        self.kind = kind
+        self.chunk_size = chunk_size
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return iter_payload(self.size, self.kind, self.chunk_size)
+
+    def write_to(self, fileobj):
+        """Writes the whole payload to a binary file object; returns bytes written."""
+        for chunk in self:
+            fileobj.write(chunk)
+        return self.size
@@ -0,0 +1,327 @@
+import multiprocessing
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+from config.settings import (DOWNLOAD_CONNECTIONS, DOWNLOAD_RANGE_SIZE, DOWNLOAD_BUFFER_SIZE, UPLOAD_STREAMS,
+                             UPLOAD_FILE_SIZE, PAYLOAD_KIND, THROUGHPUT_EARLY_STOP, PROCESS_WORKERS,
+                             PROCESS_PIN_CPUS, PROCESS_PUBLISH_INTERVAL, PROCESS_START_TIMEOUT,
+                             PROCESS_CPU_BOTTLENECK)
+from core.http_download import RangeConnection, probe_object_size, connection_worker
+from core.upload_engine import PayloadFile, split_shares, stream_worker
+from core.throughput import IntervalSampler, to_mbps
+from utils.logger import logger
+
+# Shared counter block: a header, then one slot of FIELDS counters per worker.
+# Every counter has a single writer, so no lock is needed to publish progress.
+CONTROL, NEXT_OFFSET, HEADER = 0, 1, 2
+BYTES, CPU_NS, STATE, FIELDS = 0, 1, 2, 3
+WAIT, GO, STOP = 0, 1, 2          # CONTROL values
+STARTING, READY, DONE = 0, 1, 2   # Worker STATE values
+
+def available_cores():
+    """CPU cores this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def _worker_count(workers, streams):
+    if workers is None:
+        workers = len(available_cores())
+    return max(1, min(workers, streams))
+
+class _SharedFlag:
+    """The stop_event the parent's IntervalSampler sets; workers poll it from shared memory."""
+
+    def __init__(self, counters):
+        self.counters = counters
+
+    def set(self):
+        self.counters[CONTROL] = STOP
+
+    def is_set(self):
+        return self.counters[CONTROL] == STOP
+
+class _SharedRangeQueue:
+    """Hands out consecutive byte ranges to connections in every worker process.
+
+    The lock is taken once per range request, never per received chunk.
+    """
+
+    def __init__(self, counters, lock, total, range_size):
+        self.counters = counters
+        self.lock = lock
+        self.total = total
+        self.range_size = range_size
+
+    def next(self):
+        with self.lock:
+            start = self.counters[NEXT_OFFSET]
+            if start >= self.total:
+                return None
+            end = min(start + self.range_size, self.total)
+            self.counters[NEXT_OFFSET] = end
+            return start, end - 1
+
+def _start_download(spec, counters, lock, stop_event, deadline, payload):
+    ranges = _SharedRangeQueue(counters, lock, spec["total"], spec["range_size"])
+    # The worker deadline also bounds the connect retries
+    conns = [RangeConnection(spec["url"], buffer_size=spec["buffer_size"], timeout=spec["timeout"],
+                             stop_event=stop_event, deadline=deadline if deadline != float('inf') else None)
+             for _ in range(spec["connections"])]
+    stats = [{} for _ in conns]
+    threads = [threading.Thread(target=connection_worker,
+                                args=(conn, ranges, spec["expected_status"], deadline, stop_event, s))
+               for conn, s in zip(conns, stats)]
+
+    def results():
+        entries = []
+        for conn, s in zip(conns, stats):
+            entry = {"bytes": conn.bytes, "requests": conn.requests, "elapsed": s["elapsed"],
+                     "connect_ms": conn.connect_ms, "first_byte_ms": conn.first_byte_ms}
+            if "error" in s:
+                entry["error"] = s["error"]
+            entries.append(entry)
+        return entries
+
+    return threads, lambda: sum(conn.bytes for conn in conns), results
+
+def _upload_payload(spec):
+    file_size = min(sum(spec["shares"]), UPLOAD_FILE_SIZE) if spec["total_bytes"] else UPLOAD_FILE_SIZE
+    return PayloadFile(max(file_size, 1), kind=spec["payload_kind"])
+
+def _start_upload(spec, counters, lock, stop_event, deadline, payload):
+    shares = spec["shares"]
+    stats = [{} for _ in shares]
+    live = []
+    threads = [threading.Thread(target=stream_worker,
+                                args=(spec["address"], payload, nbytes, deadline, stop_event,
+                                      spec["zero_copy"], spec["timeout"], spec["http"], s, live))
+               for nbytes, s in zip(shares, stats)]
+    return threads, lambda: sum(stream.bytes for stream in list(live)), lambda: stats
+
+_STARTERS = {"download": _start_download, "upload": _start_upload}
+
+def _worker(kind, spec, counters, lock, index, cpu, pipe):
+    """Runs one worker process's share of the streams and publishes progress in counters."""
+    slot = HEADER + index * FIELDS
+    result = {"index": index, "cpu": cpu, "streams": []}
+    payload = None
+    try:
+        if cpu is not None and hasattr(os, "sched_setaffinity"):
+            try:
+                os.sched_setaffinity(0, {cpu})
+            except OSError as e:
+                logger.debug(f"Could not pin worker {index} to CPU {cpu}: {e}")
+                result["cpu"] = None
+        # Payload preparation and interpreter start-up happen before the parent starts timing.
+        if kind == "upload":
+            payload = _upload_payload(spec)
+        counters[slot + STATE] = READY
+        while counters[CONTROL] == WAIT:
+            time.sleep(0.001)
+
+        stop_event = threading.Event()
+        deadline = time.perf_counter() + spec["duration"] if spec["duration"] else float('inf')
+        cpu_start = time.process_time_ns()
+        threads, read_bytes, results = _STARTERS[kind](spec, counters, lock, stop_event, deadline, payload)
+        for t in threads:
+            t.start()
+        while any(t.is_alive() for t in threads):
+            # Past the deadline, range bodies in flight are cut off rather than drained to their end
+            if counters[CONTROL] == STOP or time.perf_counter() >= deadline:
+                stop_event.set()
+            counters[slot + BYTES] = read_bytes()
+            counters[slot + CPU_NS] = time.process_time_ns() - cpu_start
+            threads[0].join(PROCESS_PUBLISH_INTERVAL)
+        for t in threads:
+            t.join()
+        counters[slot + BYTES] = read_bytes()
+        counters[slot + CPU_NS] = time.process_time_ns() - cpu_start
+        result["streams"] = results()
+    except (OSError, ValueError) as e:
+        result["error"] = str(e)
+        logger.warning(f"⚠️ Transfer worker {index} failed: {e}")
+    finally:
+        counters[slot + STATE] = DONE
+        if payload:
+            payload.close()
+        pipe.send(result)
+        pipe.close()
+
+def cpu_report(worker_cpu, parent_cpu, elapsed, nbytes, cores=None, threshold=PROCESS_CPU_BOTTLENECK):
+    """Decides whether the client CPU or the network limited a transfer.
+
+    Args:
+        worker_cpu: CPU seconds used by each worker process during the transfer
+        parent_cpu: CPU seconds used by the measuring process
+        elapsed: Transfer wall time (in seconds)
+        nbytes: Bytes moved
+        cores: Cores available to the client (detected if None)
+        threshold: Share of a core above which a process counts as saturated
+
+    Returns:
+        Dictionary with per-worker utilization (1.0 = one full core), CPU seconds per
+        GB moved and 'client_cpu_bound', set when any worker saturated its core or all
+        usable cores were busy together.
+    """
+    cores = cores or len(available_cores())
+    utilization = [cpu / elapsed if elapsed > 0 else 0.0 for cpu in worker_cpu]
+    total = sum(worker_cpu) + parent_cpu
+    load = total / elapsed / min(len(worker_cpu) + 1, cores) if elapsed > 0 else 0.0
+    busiest = max(utilization, default=0.0)
+    client_bound = busiest >= threshold or load >= threshold
+    return {
+        "cores": cores,
+        "worker_utilization": [round(u, 3) for u in utilization],
+        "parent_utilization": round(parent_cpu / elapsed, 3) if elapsed > 0 else 0.0,
+        "core_load": round(load, 3),
+        "cpu_seconds": total,
+        "cpu_seconds_per_gb": total / (nbytes / 1e9) if nbytes else None,
+        "client_cpu_bound": client_bound,
+        "bottleneck": "client CPU" if client_bound else "network",
+    }
+
+def print_cpu_report(report, direction):
+    """Prints whether the client CPU limited a multi-process transfer."""
+    busiest = max(report["worker_utilization"], default=0.0)
+    if report["client_cpu_bound"]:
+        print(f"🧠 {direction.capitalize()} was limited by the client CPU (busiest worker at {busiest:.0%} of a core, "
+              f"{report['core_load']:.0%} of usable cores); the link may be faster than measured.")
+    else:
+        print(f"🌐 {direction.capitalize()} was network-bound (busiest worker at {busiest:.0%} of a core).")
+
+def _run_workers(kind, specs, pin_cpus, early_stop):
+    ctx = multiprocessing.get_context("spawn")  # Forking a process with live sampler threads is unsafe
+    counters = ctx.RawArray("Q", HEADER + FIELDS * len(specs))
+    lock = ctx.Lock()
+    cores = available_cores()
+    procs, pipes = [], []
+    for i, spec in enumerate(specs):
+        receiver, sender = ctx.Pipe(duplex=False)
+        cpu = cores[i % len(cores)] if pin_cpus else None
+        proc = ctx.Process(target=_worker, args=(kind, spec, counters, lock, i, cpu, sender), daemon=True)
+        proc.start()
+        sender.close()
+        procs.append(proc)
+        pipes.append(receiver)
+
+    give_up = time.perf_counter() + PROCESS_START_TIMEOUT
+    while time.perf_counter() < give_up and any(
+            counters[HEADER + i * FIELDS + STATE] == STARTING and proc.is_alive() for i, proc in enumerate(procs)):
+        time.sleep(0.005)
+
+    sampler = IntervalSampler(early_stop=early_stop)
+    parent_cpu = time.process_time()
+    start = time.perf_counter()
+    counters[CONTROL] = GO
+    sampler.start(lambda: sum(counters[HEADER + BYTES::FIELDS]), _SharedFlag(counters))
+    results = []
+    for proc, pipe in zip(procs, pipes):
+        try:
+            results.append(pipe.recv())
+        except EOFError:
+            results.append({"index": len(results), "streams": [],
+                            "error": f"worker exited with code {proc.exitcode}"})
+        proc.join()
+    elapsed = time.perf_counter() - start
+    throughput = sampler.stop()
+    parent_cpu = time.process_time() - parent_cpu
+
+    moved = sum(counters[HEADER + BYTES::FIELDS])
+    worker_cpu = [ns / 1e9 for ns in counters[HEADER + CPU_NS::FIELDS]]
+    workers = []
+    for result, cpu_seconds in zip(results, worker_cpu):
+        entry = {"cpu": result.get("cpu"), "streams": len(result["streams"]),
+                 "bytes": sum(s["bytes"] for s in result["streams"]), "cpu_seconds": cpu_seconds}
+        if "error" in result:
+            entry["error"] = result["error"]
+        workers.append(entry)
+    return {
+        "bytes": moved,
+        "elapsed": elapsed,
+        "mbps": throughput["steady_mbps"] or to_mbps(moved, elapsed),
+        "average_mbps": to_mbps(moved, elapsed),
+        "per_stream": [s for result in results for s in result["streams"]],
+        "workers": workers,
+        "cpu": cpu_report(worker_cpu, parent_cpu, elapsed, moved),
+        "throughput": throughput,
+    }
+
+def process_http_download(url, connections=DOWNLOAD_CONNECTIONS, max_bytes=None, duration=None,
+                          range_size=DOWNLOAD_RANGE_SIZE, buffer_size=DOWNLOAD_BUFFER_SIZE, timeout=10,
+                          early_stop=THROUGHPUT_EARLY_STOP, workers=PROCESS_WORKERS, pin_cpus=PROCESS_PIN_CPUS):
+    """http_download() with its connections spread over worker processes.
+
+    Each worker owns its share of the connections and publishes its byte count and
+    CPU time in a shared-memory block; the parent samples that block for the aggregate
+    throughput without any per-chunk IPC. Byte ranges come from one shared queue, so
+    faster workers take on more of the object.
+
+    Args:
+        workers: Worker processes (one per available core if None, at most one per connection)
+        pin_cpus: Pin each worker to its own core where the platform supports it
+        (other arguments as for http_download)
+
+    Returns:
+        http_download()'s result plus 'workers' (per-process bytes and CPU seconds) and
+        'cpu', the report saying whether the client CPU was the bottleneck.
+    """
+    size, ranged = probe_object_size(url, timeout=timeout)
+    total = min(size, max_bytes) if max_bytes else size
+    if not ranged:
+        logger.warning(f"⚠️ {url} ignores byte ranges; downloading over a single connection.")
+        connections, range_size = 1, total
+    workers = _worker_count(workers, connections)
+    specs = [{"url": url, "total": total, "connections": share, "range_size": range_size,
+              "buffer_size": buffer_size, "timeout": timeout, "duration": duration,
+              "expected_status": 206 if ranged else 200}
+             for share in split_shares(connections, workers)]
+    result = _run_workers("download", specs, pin_cpus, early_stop)
+    per_connection = result.pop("per_stream")
+    for conn in per_connection:
+        conn["mbps"] = to_mbps(conn["bytes"], conn["elapsed"])
+    return dict(result, url=url, object_size=size, connections=per_connection)
+
+def _process_upload(address, streams, total_bytes, duration, payload_kind, zero_copy, timeout, early_stop,
+                    workers, pin_cpus, http=None):
+    if total_bytes is None and duration is None:
+        raise ValueError("An upload needs total_bytes, duration or both")
+    if http and total_bytes is None:
+        raise ValueError("HTTP uploads need total_bytes for their Content-Length")
+    shares = split_shares(total_bytes, streams)
+    specs = []
+    for count in split_shares(streams, _worker_count(workers, streams)):
+        specs.append({"address": address, "shares": shares[:count], "total_bytes": total_bytes,
+                      "duration": duration, "payload_kind": payload_kind, "zero_copy": zero_copy,
+                      "timeout": timeout, "http": http})
+        shares = shares[count:]
+    result = _run_workers("upload", specs, pin_cpus, early_stop)
+    per_stream = result.pop("per_stream")
+    for s in per_stream:
+        s["mbps"] = to_mbps(s["bytes"], s["elapsed"])
+        s["bytes_per_second"] = s["bytes"] / s["elapsed"] if s["elapsed"] > 0 else 0.0
+    return dict(result, streams=per_stream)
+
+def process_tcp_upload(host, port, total_bytes=None, duration=None, streams=UPLOAD_STREAMS,
+                       payload_kind=PAYLOAD_KIND, zero_copy=True, timeout=10, early_stop=THROUGHPUT_EARLY_STOP,
+                       workers=PROCESS_WORKERS, pin_cpus=PROCESS_PIN_CPUS):
+    """tcp_upload() with its streams spread over worker processes (see process_http_download)."""
+    return _process_upload((host, port), streams, total_bytes, duration, payload_kind, zero_copy, timeout,
+                           early_stop, workers, pin_cpus)
+
+def process_http_upload(url, total_bytes, method="POST", duration=None, streams=UPLOAD_STREAMS,
+                        payload_kind=PAYLOAD_KIND, zero_copy=True, timeout=10, early_stop=THROUGHPUT_EARLY_STOP,
+                        workers=PROCESS_WORKERS, pin_cpus=PROCESS_PIN_CPUS):
+    """http_upload() with its streams spread over worker processes (see process_http_download)."""
+    if method not in ("POST", "PUT"):
+        raise ValueError(f"Unsupported upload method: {method}")
+    parts = urlsplit(url)
+    if parts.scheme != "http" or not parts.hostname:
+        raise ValueError(f"Unsupported upload URL: {url}")
+    path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+    http = {"method": method, "host": parts.netloc, "path": path}
+    result = _process_upload((parts.hostname, parts.port or 80), streams, total_bytes, duration, payload_kind,
+                             zero_copy, timeout, early_stop, workers, pin_cpus, http=http)
+    result["url"] = url
+    return result
@@ -0,0 +1,276 @@
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from config.settings import (PROFILE_GIL_PROBE_INTERVAL, PROFILE_CPU_SATURATION, PROFILE_MAX_SEND_DELAY,
+                             PROFILE_MAX_GIL_WAIT)
+from core.metrics import Sketch
+
+IDLE = "idle"
+THREAD_SAMPLE_EVERY = 20  # Watchdog wake-ups between per-thread CPU samples
+
+# Result keys measured during each profiled phase
+PHASE_RESULTS = {
+    "latency": [f"{metric}_{protocol}" for metric in ("latency", "jitter", "packet_loss")
+                for protocol in ("tcp", "udp", "icmp")],
+    "download_tcp": ["download_tcp", "latency_under_load"],
+    "download_udp": ["download_udp", "latency_under_load"],
+    "upload_tcp": ["upload_tcp", "latency_under_load"],
+    "upload_udp": ["upload_udp", "latency_under_load"],
+}
+
+_active = None
+
+def safe_format(value, precision=2, suffix="ms"):
+    """Safely format numerical values; return 'N/A' if None."""
+    return f"{value:.{precision}f} {suffix}" if value is not None else "N/A"
+
+def record_send_delay(planned_ns, actual_ns):
+    """Hot-path hook for probe loops: how late a probe went out against its schedule.
+
+    A no-op unless an OverheadProfiler is running.
+    """
+    profiler = _active
+    if profiler is not None:
+        profiler.send_delay(planned_ns, actual_ns)
+
+def _thread_cpu():
+    """{thread ident: (name, CPU seconds)} for every live Python thread (ns resolution where supported)."""
+    usage = {}
+    for thread in threading.enumerate():
+        try:
+            usage[thread.ident] = thread.name, time.clock_gettime(time.pthread_getcpuclockid(thread.ident))
+        except (AttributeError, OSError, TypeError):
+            continue  # Platform without per-thread CPU clocks, or a thread that just ended
+    return usage
+
+def _run_queue_wait(native_id):
+    """Nanoseconds a thread spent runnable but not running (Linux schedstat), or None."""
+    if native_id is None:
+        return None
+    try:
+        with open(f"/proc/self/task/{native_id}/schedstat") as f:
+            return int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+
+def _syscalls():
+    """(read, write) system calls made by the process so far, from /proc/self/io, or None."""
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+        return int(fields["syscr"]), int(fields["syscw"])
+    except (OSError, ValueError, KeyError):
+        return None
+
+def _snapshot():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return {"wall": time.perf_counter(), "cpu": time.process_time(), "threads": _thread_cpu(),
+            "syscalls": _syscalls(), "voluntary": usage.ru_nvcsw, "involuntary": usage.ru_nivcsw}
+
+def _quantiles(sketch):
+    if not sketch.count:
+        return None
+    return {"count": sketch.count, "mean": sketch.mean, "p50": sketch.quantile(0.5),
+            "p90": sketch.quantile(0.9), "p99": sketch.quantile(0.99), "max": sketch.quantile(1)}
+
+class OverheadProfiler:
+    """Measures what the client itself costs while a test runs, phase by phase.
+
+    For each phase it records process and per-thread CPU time, how late probes were
+    sent against their schedule (record_send_delay()), an estimate of GIL contention,
+    read/write system calls and context switches. GIL contention is estimated with a
+    watchdog thread that sleeps for PROFILE_GIL_PROBE_INTERVAL at a time: how late it
+    wakes up, minus the time the OS kept it waiting in the run queue, is time spent
+    waiting for the interpreter lock. The watchdog also samples per-thread CPU time
+    every THREAD_SAMPLE_EVERY wake-ups, so threads that finish inside a phase (such
+    as transfer connections) are still accounted for. A phase is marked suspect when the client looks
+    saturated, because its figures may then describe the client rather than the link.
+
+    Usage:
+        profiler = OverheadProfiler().start()
+        with profiler.phase("download_tcp"):
+            download_test()
+        report = profiler.stop()
+    """
+
+    def __init__(self, gil_probe_interval=PROFILE_GIL_PROBE_INTERVAL, cpu_saturation=PROFILE_CPU_SATURATION,
+                 max_send_delay=PROFILE_MAX_SEND_DELAY, max_gil_wait=PROFILE_MAX_GIL_WAIT):
+        self.gil_probe_interval = gil_probe_interval
+        self.cpu_saturation = cpu_saturation
+        self.max_send_delay = max_send_delay
+        self.max_gil_wait = max_gil_wait
+        self.cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+        self.current_phase = IDLE
+        self.phases = {}  # name -> report
+        self._send_delays = {}  # phase -> Sketch of send delays (ms)
+        self._wakeups = {}      # phase -> Sketch of watchdog wake-up lateness (ms)
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._watchdog = None
+        self._watchdog_id = None
+        self._seen_threads = {}  # ident -> (name, CPU seconds) at the last sample
+
+    def _sketch(self, sketches, phase):
+        sketch = sketches.get(phase)
+        if sketch is None:
+            sketch = sketches[phase] = Sketch()
+        return sketch
+
+    def send_delay(self, planned_ns, actual_ns):
+        delay = max(0, actual_ns - planned_ns) / 1e6
+        with self._lock:
+            self._sketch(self._send_delays, self.current_phase).add(delay)
+
+    def _watch(self):
+        interval_ns = int(self.gil_probe_interval * 1e9)
+        wakeups = 0
+        while not self._stopping.is_set():
+            wakeups += 1
+            if wakeups % THREAD_SAMPLE_EVERY == 0:
+                threads = _thread_cpu()
+                with self._lock:
+                    self._seen_threads.update(threads)
+            start = time.perf_counter_ns()
+            time.sleep(self.gil_probe_interval)
+            late = max(0, time.perf_counter_ns() - start - interval_ns) / 1e6
+            with self._lock:
+                self._sketch(self._wakeups, self.current_phase).add(late)
+
+    def start(self):
+        global _active
+        self._watchdog = threading.Thread(target=self._watch, name="overhead-watchdog", daemon=True)
+        self._watchdog.start()
+        self._watchdog_id = self._watchdog.native_id
+        _active = self
+        return self
+
+    @contextmanager
+    def phase(self, name):
+        """Profiles the block as phase name; reentering a name replaces its report."""
+        previous = self.current_phase
+        with self._lock:
+            self.current_phase = name
+            self._send_delays.pop(name, None)
+            self._wakeups.pop(name, None)
+        begin, wait_begin = _snapshot(), _run_queue_wait(self._watchdog_id)
+        with self._lock:
+            # Forget threads that ended before the phase, so they are not counted in it
+            self._seen_threads = {ident: usage for ident, usage in self._seen_threads.items()
+                                  if ident in begin["threads"]}
+        try:
+            yield self
+        finally:
+            end, wait_end = _snapshot(), _run_queue_wait(self._watchdog_id)
+            with self._lock:
+                # Threads that ended during the phase count with their last sampled CPU time
+                finished = {ident: usage for ident, usage in self._seen_threads.items()
+                            if ident not in end["threads"]}
+                end["threads"].update(finished)
+                self._seen_threads = {ident: usage for ident, usage in self._seen_threads.items()
+                                      if ident not in finished}
+                self.current_phase = previous
+                send_delays = self._send_delays.get(name, Sketch())
+                wakeups = self._wakeups.get(name, Sketch())
+            run_queue_ms = (wait_end - wait_begin) / 1e6 if None not in (wait_begin, wait_end) else None
+            self.phases[name] = self._phase_report(begin, end, send_delays, wakeups, run_queue_ms)
+
+    def _phase_report(self, begin, end, send_delays, wakeups, run_queue_ms):
+        wall = end["wall"] - begin["wall"]
+        cpu = end["cpu"] - begin["cpu"]
+        threads = []
+        for ident, (name, seconds) in end["threads"].items():
+            used = seconds - begin["threads"].get(ident, (name, 0.0))[1]
+            if used > 0:
+                threads.append({"name": name, "cpu_s": used, "utilization": used / wall if wall > 0 else 0.0})
+        threads.sort(key=lambda thread: thread["cpu_s"], reverse=True)
+        # Lateness the OS scheduler does not explain is waiting for the GIL
+        gil_wait = None
+        if wakeups.count:
+            gil_wait = wakeups.mean
+            if run_queue_ms is not None:
+                gil_wait = max(0.0, gil_wait - run_queue_ms / wakeups.count)
+        syscalls = None
+        if begin["syscalls"] and end["syscalls"]:
+            syscalls = {"read": end["syscalls"][0] - begin["syscalls"][0],
+                        "write": end["syscalls"][1] - begin["syscalls"][1]}
+        report = {
+            "wall_s": wall,
+            "process_cpu_s": cpu,
+            "process_utilization": cpu / wall / self.cores if wall > 0 else 0.0,
+            "threads": threads,
+            "send_delay_ms": _quantiles(send_delays),
+            "gil": {"wakeup_lateness_ms": _quantiles(wakeups), "wait_ms": gil_wait,
+                    "switch_interval_ms": sys.getswitchinterval() * 1000},
+            "syscalls": syscalls,
+            "context_switches": {"voluntary": end["voluntary"] - begin["voluntary"],
+                                 "involuntary": end["involuntary"] - begin["involuntary"]},
+        }
+        report["reasons"] = self._saturation(report)
+        report["suspect"] = bool(report["reasons"])
+        return report
+
+    def _saturation(self, report):
+        """Why the client looks saturated during a phase (empty when it does not)."""
+        reasons = []
+        if report["process_utilization"] >= self.cpu_saturation:
+            reasons.append(f"process used {report['process_utilization']:.0%} of {self.cores} cores")
+        python = sum(thread["utilization"] for thread in report["threads"])
+        if self.cores > 1 and python >= self.cpu_saturation:
+            # Python threads share one interpreter lock, so together they get about one core
+            reasons.append(f"Python threads used {python:.0%} of a core, the most the GIL allows")
+        for thread in report["threads"]:
+            if thread["utilization"] >= self.cpu_saturation:
+                reasons.append(f"thread {thread['name']} used {thread['utilization']:.0%} of a core")
+        send_delay = report["send_delay_ms"]
+        if send_delay and send_delay["p90"] > self.max_send_delay:
+            reasons.append(f"probes went out {send_delay['p90']:.1f} ms late (p90)")
+        gil_wait = report["gil"]["wait_ms"]
+        if gil_wait is not None and gil_wait > self.max_gil_wait:
+            reasons.append(f"threads waited {gil_wait:.1f} ms for the GIL per wake-up")
+        return reasons
+
+    def stop(self):
+        """Stops the watchdog and returns the report: per-phase figures and the suspect phases."""
+        global _active
+        if _active is self:
+            _active = None
+        self._stopping.set()
+        if self._watchdog:
+            self._watchdog.join()
+            self._watchdog = None
+        return {
+            "cores": self.cores,
+            "thresholds": {"cpu_saturation": self.cpu_saturation, "max_send_delay_ms": self.max_send_delay,
+                           "max_gil_wait_ms": self.max_gil_wait},
+            "phases": self.phases,
+            "suspect_phases": [name for name, phase in self.phases.items() if phase["suspect"]],
+        }
+
+def suspect_results(report, transfers=None):
+    """Result keys measured while the client was saturated.
+
+    Besides the profiled phases, transfers (results['transfers']) whose multi-process
+    CPU report found the client CPU bound make their result suspect.
+    """
+    suspect = set()
+    for phase in report["suspect_phases"]:
+        suspect.update(PHASE_RESULTS.get(phase, [phase]))
+    for name, runs in (transfers or {}).items():
+        if any(run.get("cpu", {}).get("client_cpu_bound") for run in runs):
+            suspect.add(name)
+    return sorted(suspect)
+
+def print_profile(report):
+    """Prints one line per profiled phase and the reasons behind suspect ones."""
+    print(f"\n🔬 Measurement overhead ({report['cores']} cores):")
+    for name, phase in report["phases"].items():
+        send_delay = phase["send_delay_ms"]["p90"] if phase["send_delay_ms"] else None
+        gil_wait = phase["gil"]["wait_ms"]
+        print(f"   {'⚠️' if phase['suspect'] else '✅'} {name}: CPU {phase['process_cpu_s']:.2f}s "
+              f"({phase['process_utilization']:.0%} of the machine), send delay p90 "
+              f"{safe_format(send_delay)}, GIL wait {safe_format(gil_wait)}")
+        for reason in phase["reasons"]:
+            print(f"      ↳ {reason}")
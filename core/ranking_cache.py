@@ -0,0 +1,206 @@
+import json
+import os
+import socket
+import threading
+import time
+from config.settings import (RANKING_CACHE_FILE, RANKING_CACHE_TTL, RANKING_CACHE_MAX_AGE,
+                             RANKING_CACHE_MAX_NETWORKS)
+from core.server_selection import server_address, reachable, _rank_key
+from utils.logger import logger
+
+ROUTE_FILE = "/proc/net/route"
+
+def _default_route():
+    """(interface, gateway) of the IPv4 default route, from the kernel routing table where readable."""
+    try:
+        with open(ROUTE_FILE) as f:
+            next(f)
+            for line in f:
+                fields = line.split()
+                if len(fields) > 2 and fields[1] == "00000000":
+                    gateway = socket.inet_ntoa(int(fields[2], 16).to_bytes(4, "little"))
+                    return fields[0], gateway
+    except (OSError, ValueError, StopIteration):
+        pass
+    return None, None
+
+def _source_address():
+    """The local address outbound traffic leaves from (no packet is sent)."""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        try:
+            sock.connect(("192.0.2.1", 9))  # TEST-NET-1: routed like any remote address
+            return sock.getsockname()[0]
+        except OSError:
+            return None
+
+def network_identity():
+    """Identifies the network this machine is on: default route interface, gateway and source address.
+
+    Rankings measured on one network (home Wi-Fi, office, VPN) say nothing about another,
+    so the cache is keyed by this string.
+    """
+    interface, gateway = _default_route()
+    source = _source_address()
+    if not (interface or source):
+        return socket.gethostname()
+    return f"{interface or '?'}/{source or '?'}/gw {gateway or '?'}"
+
+def _server_key(server, default_port):
+    host, port = server_address(server, default_port)
+    return f"{host}:{port}"
+
+class RankingCache:
+    """Server rankings cached in memory and on disk, per network and per server.
+
+    A ranking younger than ttl is served as is. An older one (up to max_age) is still
+    served at once, so the test starts with the cached best server, and is marked for
+    re-probing by revalidate() once the transfers are done, so the probes never load
+    the link during a measurement. Unreachable servers are not kept past ttl, servers
+    reported as failed are dropped, and only the max_networks most recently used
+    networks are kept.
+
+    Usage:
+        cache = RankingCache()
+        ranking = cache.rank("download", DOWNLOAD_URLS, lambda: rank_servers(DOWNLOAD_URLS))
+        ...  # Transfers
+        cache.revalidate()
+    """
+
+    def __init__(self, path=RANKING_CACHE_FILE, ttl=RANKING_CACHE_TTL, max_age=RANKING_CACHE_MAX_AGE,
+                 max_networks=RANKING_CACHE_MAX_NETWORKS, identity=network_identity):
+        self.path = path
+        self.ttl = ttl
+        self.max_age = max_age
+        self.max_networks = max_networks
+        self.identity = identity
+        self.networks = {}  # identity -> {"last_used": ts, "servers": {"host:port": {"ranked_at", "entry"}}}
+        self.stale = {}  # kind -> (rank, network) of rankings served past their ttl
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                self.networks = json.load(f).get("networks", {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, AttributeError) as e:
+            logger.warning(f"⚠️ Ignoring unreadable server ranking cache {self.path}: {e}")
+
+    def _save(self):
+        """Writes the cache atomically, so a crash never leaves a half-written file."""
+        directory = os.path.dirname(self.path)
+        try:
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump({"networks": self.networks}, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning(f"⚠️ Could not save server ranking cache {self.path}: {e}")
+
+    def evict(self, now=None):
+        """Drops entries older than max_age, unreachable ones older than ttl, and surplus networks."""
+        now = time.time() if now is None else now
+        with self._lock:
+            for network in list(self.networks.values()):
+                servers = network["servers"]
+                for key, cached in list(servers.items()):
+                    age = now - cached["ranked_at"]
+                    if age > self.max_age or (not cached["entry"]["success_rate"] and age > self.ttl):
+                        del servers[key]
+            empty = [identity for identity, network in self.networks.items() if not network["servers"]]
+            for identity in empty:
+                del self.networks[identity]
+            by_use = sorted(self.networks, key=lambda identity: self.networks[identity]["last_used"])
+            for identity in by_use[:max(0, len(by_use) - self.max_networks)]:
+                del self.networks[identity]
+
+    def get(self, servers, default_port=80, network=None):
+        """The cached ranking of servers on this network and its age in seconds.
+
+        Returns:
+            (ranking, age), or (None, None) unless every server has a usable entry
+        """
+        self.evict()
+        network = network or self.identity()
+        with self._lock:
+            cached = self.networks.get(network, {}).get("servers", {})
+            found = [cached.get(_server_key(server, default_port)) for server in servers]
+            if not servers or None in found:
+                return None, None
+            self.networks[network]["last_used"] = time.time()
+        ranking = sorted((dict(c["entry"], server=server) for c, server in zip(found, servers)), key=_rank_key)
+        return ranking, time.time() - min(c["ranked_at"] for c in found)
+
+    def put(self, ranking, network=None):
+        """Stores a fresh ranking (entries from rank_servers) for this network."""
+        network = network or self.identity()
+        now = time.time()
+        with self._lock:
+            entry = self.networks.setdefault(network, {"last_used": now, "servers": {}})
+            entry["last_used"] = now
+            for server in ranking:
+                entry["servers"][f"{server['host']}:{server['port']}"] = {"ranked_at": now, "entry": server}
+        self.evict(now)
+        with self._lock:
+            self._save()
+
+    def server_failed(self, server, default_port=80):
+        """Forgets a server that failed a test, so the next ranking re-probes it."""
+        key = _server_key(server, default_port)
+        with self._lock:
+            for network in self.networks.values():
+                network["servers"].pop(key, None)
+            self._save()
+        logger.info(f"🗑️ Dropped {key} from the server ranking cache after a failed test.")
+
+    def revalidate(self):
+        """Re-probes the stale rankings served since the last call; call it once the link is idle.
+
+        Returns:
+            The kinds that were re-ranked
+        """
+        with self._lock:
+            stale, self.stale = self.stale, {}
+        for kind, (rank, network) in stale.items():
+            try:
+                self.put(rank(), network)
+                logger.debug(f"Revalidated cached {kind} server ranking")
+            except Exception as e:
+                logger.warning(f"⚠️ Revalidating the {kind} server ranking failed: {e}")
+        return list(stale)
+
+    def rank(self, kind, servers, rank, default_port=80):
+        """Returns a ranking of servers, probing with rank() only when the cache cannot answer.
+
+        Args:
+            kind: Name of the server list ('download' or 'upload'), for logs and revalidate()
+            servers: The candidate servers, as passed to rank_servers()
+            rank: Callable returning a fresh ranking from rank_servers()
+            default_port: Port used when a server does not name one
+        """
+        network = self.identity()
+        ranking, age = self.get(servers, default_port, network)
+        if ranking is not None and reachable(ranking):
+            if age > self.ttl:
+                with self._lock:
+                    self.stale[kind] = (rank, network)
+            logger.info(f"📦 Using cached {kind} server ranking from {age / 60:.0f} min ago"
+                        f"{' (refreshing after the test)' if age > self.ttl else ''}.")
+            return ranking
+        ranking = rank()
+        self.put(ranking, network)
+        return ranking
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+def default_cache():
+    """The process-wide cache backed by RANKING_CACHE_FILE."""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = RankingCache()
+        return _default_cache
@@ -0,0 +1,318 @@
+import asyncio
+import errno
+import ipaddress
+import os
+import selectors
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config.settings import (RESOLVER_DEFAULT_TTL, RESOLVER_MIN_TTL, RESOLVER_MAX_TTL, RESOLVER_TTL_TIMEOUT,
+                             HAPPY_EYEBALLS_DELAY)
+from utils.logger import logger
+
+RESOLV_CONF = "/etc/resolv.conf"
+# connect_ex() results of a non-blocking connect that is under way
+CONNECT_PENDING = {0, errno.EINPROGRESS, errno.EWOULDBLOCK, getattr(errno, "WSAEWOULDBLOCK", errno.EWOULDBLOCK)}
+HOSTS_FILE = "/etc/hosts"
+QTYPES = {socket.AF_INET: 1, socket.AF_INET6: 28}  # A, AAAA
+_HEADER = struct.Struct("!HHHHHH")
+
+class Resolution:
+    """The cached answer for one host name."""
+
+    def __init__(self, host, addresses, ttl, dns_ms, error=None):
+        self.host = host
+        self.addresses = addresses  # [(family, ip)] in Happy Eyeballs order
+        self.ttl = ttl
+        self.dns_ms = dns_ms        # Time getaddrinfo() took (0 for IP literals)
+        self.error = error
+        self.expires = time.monotonic() + ttl
+
+def _nameservers(path=RESOLV_CONF):
+    try:
+        with open(path) as f:
+            return [line.split()[1] for line in f if line.startswith("nameserver") and len(line.split()) > 1]
+    except OSError:
+        return []
+
+def _hosts_file_names(path=HOSTS_FILE):
+    names = set()
+    try:
+        with open(path) as f:
+            for line in f:
+                names.update(line.split("#", 1)[0].split()[1:])
+    except OSError:
+        pass
+    return names
+
+def _ip_literal(host):
+    try:
+        ip = ipaddress.ip_address(host.strip("[]"))
+    except ValueError:
+        return None
+    return socket.AF_INET6 if ip.version == 6 else socket.AF_INET, str(ip)
+
+def _dns_query(ident, host, qtype):
+    qname = b"".join(bytes([len(label)]) + label.encode("idna") for label in host.rstrip(".").split(".")) + b"\0"
+    return _HEADER.pack(ident, 0x0100, 1, 0, 0, 0) + qname + struct.pack("!HH", qtype, 1)
+
+def _skip_name(data, offset):
+    while True:
+        length = data[offset]
+        if length >= 0xC0:  # Compression pointer ends the name
+            return offset + 2
+        offset += 1 + length
+        if length == 0:
+            return offset
+
+def _answer_ttl(data):
+    """Smallest TTL among the answer records (CNAME chain and addresses), or None."""
+    _, flags, qdcount, ancount, _, _ = _HEADER.unpack_from(data)
+    if flags & 0x000F or not ancount:
+        return None
+    offset = _HEADER.size
+    for _ in range(qdcount):
+        offset = _skip_name(data, offset) + 4
+    ttls = []
+    for _ in range(ancount):
+        offset = _skip_name(data, offset)
+        _, _, ttl, length = struct.unpack_from("!HHIH", data, offset)
+        ttls.append(ttl)
+        offset += 10 + length
+    return min(ttls) if ttls else None
+
+def query_ttl(host, families, nameserver, timeout=RESOLVER_TTL_TIMEOUT):
+    """Asks the nameserver directly for host's records, only to learn their TTL.
+
+    getaddrinfo() does not expose TTLs. Returns the smallest answer TTL in seconds, or
+    None when the server does not answer in time.
+    """
+    family = socket.AF_INET6 if ":" in nameserver else socket.AF_INET
+    idents = {}
+    with socket.socket(family, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(timeout)
+        try:
+            sock.connect((nameserver, 53))
+            for fam in families:
+                ident = int.from_bytes(os.urandom(2), "big")
+                idents[ident] = fam
+                sock.send(_dns_query(ident, host, QTYPES[fam]))
+            deadline = time.monotonic() + timeout
+            ttls = []
+            while idents and time.monotonic() < deadline:
+                sock.settimeout(max(0.001, deadline - time.monotonic()))
+                data = sock.recv(4096)
+                if len(data) >= _HEADER.size and idents.pop(struct.unpack_from("!H", data)[0], None):
+                    ttl = _answer_ttl(data)
+                    if ttl is not None:
+                        ttls.append(ttl)
+            return min(ttls) if ttls else None
+        except (OSError, ValueError, IndexError, struct.error, UnicodeError):
+            return None
+
+def _happy_eyeballs_order(infos):
+    """Interleaves address families, IPv6 first (RFC 8305 section 4)."""
+    by_family = {}
+    for family, address in infos:
+        if address not in by_family.setdefault(family, []):
+            by_family[family].append(address)
+    v6, v4 = by_family.get(socket.AF_INET6, []), by_family.get(socket.AF_INET, [])
+    ordered = []
+    for i in range(max(len(v6), len(v4))):
+        ordered += [(socket.AF_INET6, a) for a in v6[i:i + 1]] + [(socket.AF_INET, a) for a in v4[i:i + 1]]
+    return ordered
+
+class Resolver:
+    """Resolves host names once and caches the answers for their DNS TTL.
+
+    Lookups go through getaddrinfo(), so /etc/hosts and the system resolver configuration
+    apply; the TTL comes from a direct query to the first nameserver, clamped to
+    [min_ttl, max_ttl], with default_ttl when it cannot be learned. Failed lookups are
+    cached for min_ttl so an unresolvable host does not stall every probe.
+    """
+
+    def __init__(self, default_ttl=RESOLVER_DEFAULT_TTL, min_ttl=RESOLVER_MIN_TTL, max_ttl=RESOLVER_MAX_TTL,
+                 nameservers=None):
+        self.default_ttl = default_ttl
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.nameservers = _nameservers() if nameservers is None else nameservers
+        self.static_names = _hosts_file_names()
+        self.cache = {}
+        self._lock = threading.Lock()
+
+    def _lookup(self, host):
+        literal = _ip_literal(host)
+        if literal:
+            return Resolution(host, [literal], self.max_ttl, 0.0)
+        start = time.perf_counter()
+        try:
+            infos = socket.getaddrinfo(host, None, type=socket.SOCK_STREAM)
+        except (OSError, UnicodeError) as e:
+            return Resolution(host, [], self.min_ttl, (time.perf_counter() - start) * 1000, error=str(e))
+        dns_ms = (time.perf_counter() - start) * 1000
+        addresses = _happy_eyeballs_order([(info[0], info[4][0]) for info in infos
+                                           if info[0] in (socket.AF_INET, socket.AF_INET6)])
+        ttl = None
+        if host not in self.static_names and self.nameservers:
+            ttl = query_ttl(host, {family for family, _ in addresses}, self.nameservers[0])
+        ttl = self.max_ttl if host in self.static_names else (ttl if ttl is not None else self.default_ttl)
+        return Resolution(host, addresses, min(max(ttl, self.min_ttl), self.max_ttl), dns_ms)
+
+    def cached(self, host):
+        """The cached Resolution for host while its TTL lasts, otherwise None; never looks up."""
+        with self._lock:
+            cached = self.cache.get(host)
+        return cached if cached and cached.expires > time.monotonic() else None
+
+    def resolve(self, host):
+        """The cached Resolution for host, looked up again once its TTL has passed."""
+        cached = self.cached(host)
+        if cached:
+            return cached
+        resolution = self._lookup(host)
+        with self._lock:
+            self.cache[host] = resolution
+        if resolution.error:
+            logger.warning(f"⚠️ Cannot resolve {host}: {resolution.error}")
+        elif resolution.dns_ms:  # IP literals need no lookup
+            logger.debug(f"Resolved {host} to {len(resolution.addresses)} addresses in "
+                         f"{resolution.dns_ms:.1f} ms (TTL {resolution.ttl}s)")
+        return resolution
+
+    def resolve_all(self, hosts, workers=16):
+        """Resolves many hosts concurrently; returns {host: Resolution}."""
+        hosts = list(dict.fromkeys(hosts))
+        if not hosts:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(workers, len(hosts))) as pool:
+            return dict(zip(hosts, pool.map(self.resolve, hosts)))
+
+_default_resolver = None
+_default_lock = threading.Lock()
+
+def default_resolver():
+    """The process-wide Resolver, so every probe and engine shares one cache."""
+    global _default_resolver
+    with _default_lock:
+        if _default_resolver is None:
+            _default_resolver = Resolver()
+        return _default_resolver
+
+def _checked(resolution):
+    if not resolution.addresses:
+        raise socket.gaierror(resolution.error or f"No addresses for {resolution.host}")
+    return resolution.addresses
+
+def _addresses(host, resolver):
+    return _checked((resolver or default_resolver()).resolve(host))
+
+async def _async_addresses(host, resolver):
+    resolver = resolver or default_resolver()
+    resolution = resolver.cached(host)
+    if resolution is None:
+        # A lookup blocks in getaddrinfo() and the TTL query, which would stall every other probe on the loop
+        resolution = await asyncio.get_running_loop().run_in_executor(None, resolver.resolve, host)
+    return _checked(resolution)
+
+def connect(host, port, timeout=10, delay=HAPPY_EYEBALLS_DELAY, resolver=None):
+    """Connects over TCP, racing the resolved addresses (Happy Eyeballs, RFC 8305).
+
+    A new attempt starts every delay seconds, or at once when the previous one fails;
+    the first to complete wins. DNS is served from the resolver cache, so it is not
+    part of the measured time.
+
+    Returns:
+        (socket, connect time of the winning handshake in ms)
+    """
+    addresses = list(_addresses(host, resolver))
+    selector = selectors.DefaultSelector()
+    attempts = {}
+    deadline = time.perf_counter() + timeout
+    next_start = time.perf_counter()
+    error = None
+    try:
+        while addresses or attempts:
+            now = time.perf_counter()
+            if now >= deadline:
+                raise socket.timeout(f"Connecting to {host}:{port} timed out")
+            if addresses and (now >= next_start or not attempts):
+                family, address = addresses.pop(0)
+                sock = socket.socket(family, socket.SOCK_STREAM)
+                sock.setblocking(False)
+                started = time.perf_counter()
+                code = sock.connect_ex((address, port))
+                if code not in CONNECT_PENDING:
+                    error = OSError(code, os.strerror(code))
+                    sock.close()
+                    continue
+                attempts[sock] = started
+                selector.register(sock, selectors.EVENT_WRITE)
+                next_start = started + delay
+            wake = min(deadline, next_start) if addresses else deadline
+            for key, _ in selector.select(max(0.0, wake - time.perf_counter())):
+                sock = key.fileobj
+                code = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                selector.unregister(sock)
+                started = attempts.pop(sock)
+                if code == 0:
+                    connect_ms = (time.perf_counter() - started) * 1000
+                    sock.setblocking(True)
+                    sock.settimeout(timeout)
+                    return sock, connect_ms
+                error = OSError(code, os.strerror(code))
+                sock.close()
+                next_start = time.perf_counter()
+        raise error or OSError(f"Cannot connect to {host}:{port}")
+    finally:
+        for sock in attempts:
+            sock.close()
+        selector.close()
+
+async def async_connect(host, port, timeout=10, delay=HAPPY_EYEBALLS_DELAY, resolver=None):
+    """asyncio counterpart of connect(): returns (non-blocking socket, connect time in ms).
+
+    A host missing from the resolver cache is looked up in a worker thread, so the lookup
+    does not hold up other coroutines on the loop.
+    """
+    loop = asyncio.get_running_loop()
+    addresses = list(await _async_addresses(host, resolver))
+
+    async def attempt(family, address):
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        try:
+            started = time.perf_counter()
+            await loop.sock_connect(sock, (address, port))
+            return sock, (time.perf_counter() - started) * 1000
+        except BaseException:
+            sock.close()
+            raise
+
+    tasks = set()
+    error = None
+    end = loop.time() + timeout
+    try:
+        while addresses or tasks:
+            if loop.time() >= end:
+                raise asyncio.TimeoutError(f"Connecting to {host}:{port} timed out")
+            if addresses:
+                tasks.add(asyncio.ensure_future(attempt(*addresses.pop(0))))
+            wait = min(delay, end - loop.time()) if addresses else end - loop.time()
+            done, tasks = await asyncio.wait(tasks, timeout=max(0.0, wait), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error or OSError(f"Cannot connect to {host}:{port}")
+    finally:
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                sock, _ = await task
+                sock.close()
+            except BaseException:
+                pass
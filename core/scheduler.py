@@ -0,0 +1,117 @@
+import queue
+import threading
+import time
+from config.settings import SCHEDULER_MAX_PARALLEL
+from utils.logger import logger
+
+LINK = "link"  # The access link: transfers load it, probes only need it quiet
+
+def host_resource(host):
+    """The resource a phase holds while it probes host, so two phases never probe one host at once."""
+    return f"host:{host}"
+
+class Phase:
+    """One node of a test plan.
+
+    Args:
+        name: Unique phase name; its return value is stored under it
+        run: Called with the outputs of the phases finished so far ({name: output})
+        after: Names of phases that must finish first (declared earlier in the plan)
+        exclusive: Resources no other running phase may use, e.g. LINK for a transfer
+        shared: Resources other phases may also share, but not hold exclusively, e.g.
+            LINK for an idle latency probe
+    """
+
+    def __init__(self, name, run, after=(), exclusive=(), shared=()):
+        self.name = name
+        self.run = run
+        self.after = tuple(after)
+        self.exclusive = frozenset(exclusive)
+        self.shared = frozenset(shared) - self.exclusive
+
+    def conflicts(self, other):
+        """Whether running alongside other could change either phase's result."""
+        return bool(self.exclusive & (other.exclusive | other.shared) or other.exclusive & self.shared)
+
+class Scheduler:
+    """Runs a DAG of phases, overlapping those that do not conflict, within a time budget.
+
+    A phase starts once everything it runs after has finished and no running phase
+    conflicts with it. Ready phases start in the order they were declared, and one
+    that waits on a conflict also holds back later phases that would conflict with
+    it, so a transfer is not starved by a stream of probes. Phases that have not
+    started when the budget runs out are skipped, as are the dependents of a skipped
+    or failed phase; a running phase is never interrupted.
+    """
+
+    def __init__(self, phases, budget=None, max_parallel=SCHEDULER_MAX_PARALLEL):
+        self.phases = list(phases)
+        self.budget = budget
+        self.max_parallel = max(1, max_parallel)
+        seen = set()
+        for phase in self.phases:
+            if phase.name in seen:
+                raise ValueError(f"Duplicate phase: {phase.name}")
+            unknown = [name for name in phase.after if name not in seen]
+            if unknown:
+                raise ValueError(f"Phase {phase.name} runs after undeclared phases: {', '.join(unknown)}")
+            seen.add(phase.name)
+        self.outputs = {}
+        self.skipped = {}  # name -> reason
+        self.failed = {}   # name -> exception
+        self.timings = {}  # name -> (start, end) in seconds since the run started
+
+    def _run_phase(self, phase, done, started):
+        begin = time.perf_counter() - started
+        try:
+            output, error = phase.run(dict(self.outputs)), None
+        except Exception as e:  # A failed phase only skips its dependents
+            output, error = None, e
+        done.put((phase, output, error, begin, time.perf_counter() - started))
+
+    def run(self):
+        """Runs every phase and returns {name: output} for the ones that finished."""
+        started = time.perf_counter()
+        deadline = started + self.budget if self.budget is not None else None
+        pending = list(self.phases)
+        running = {}
+        done = queue.Queue()
+        while pending or running:
+            waiting = []
+            for phase in list(pending):
+                missed = [name for name in phase.after if name in self.skipped or name in self.failed]
+                if missed:
+                    reason = f"needs {', '.join(missed)}"
+                elif deadline is not None and time.perf_counter() >= deadline:
+                    reason = "time budget spent"
+                else:
+                    reason = None
+                if reason:
+                    pending.remove(phase)
+                    self.skipped[phase.name] = reason
+                    logger.warning(f"⏭️ Skipping phase {phase.name}: {reason}")
+                    continue
+                if not all(name in self.outputs for name in phase.after):
+                    continue
+                if (len(running) >= self.max_parallel
+                        or any(phase.conflicts(other) for other in list(running.values()) + waiting)):
+                    waiting.append(phase)
+                    continue
+                pending.remove(phase)
+                running[phase.name] = phase
+                logger.debug(f"Phase {phase.name} started at {time.perf_counter() - started:.2f}s")
+                threading.Thread(target=self._run_phase, args=(phase, done, started), name=f"phase-{phase.name}",
+                                 daemon=True).start()
+            if not running:
+                break
+            phase, output, error, begin, end = done.get()
+            del running[phase.name]
+            self.timings[phase.name] = (begin, end)
+            if error is not None:
+                self.failed[phase.name] = error
+                logger.error(f"❌ Phase {phase.name} failed: {error}")
+            else:
+                self.outputs[phase.name] = output
+        logger.info(f"🗓️ Test plan finished in {time.perf_counter() - started:.1f}s "
+                    f"({len(self.outputs)} phases run, {len(self.skipped)} skipped, {len(self.failed)} failed)")
+        return self.outputs
@@ -0,0 +1,188 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+from config.settings import (SELECTION_ATTEMPTS, SELECTION_TIMEOUT, SELECTION_DEADLINE,
+                             SELECTION_EARLY_STOP_FACTOR)
+from core.resolver import default_resolver, async_connect
+from utils.logger import logger
+from utils.retry import default_breakers, breaker_key, HALF_OPEN
+
+def server_address(server, default_port=80):
+    """Returns (host, port) for a download URL or an iPerf3 {'host', 'port'} dict."""
+    if isinstance(server, dict):
+        return server['host'], server.get('port', default_port)
+    parts = urlsplit(server)
+    if parts.hostname:
+        default = 443 if parts.scheme == "https" else default_port
+        return parts.hostname, parts.port or default
+    return server, default_port
+
+class _Candidate:
+    """Live probe state for one server while the selection round is running."""
+
+    def __init__(self, server, host, port, attempts=SELECTION_ATTEMPTS):
+        self.server = server
+        self.host = host
+        self.port = port
+        self.attempts = attempts
+        self.dns_ms = None
+        self.rtts = []
+        self.attempt_started = None
+        self.done = False
+        self.breaker = None
+        self.circuit_open = False
+
+    def successes(self):
+        return [rtt for rtt in self.rtts if rtt is not None]
+
+    def entry(self):
+        successes = self.successes()
+        return {
+            "server": self.server,
+            "host": self.host,
+            "port": self.port,
+            "dns_ms": self.dns_ms,
+            "rtts": list(self.rtts),
+            "median_rtt": statistics.median(successes) if successes else None,
+            "success_rate": len(successes) / self.attempts,
+            "completed": self.done,
+            "circuit_open": self.circuit_open,
+        }
+
+async def _connect_once(host, port, timeout, resolver=None):
+    """Opens and closes one TCP connection; returns the connect time in ms or None.
+
+    The host is resolved from the resolver cache, so only the handshake is timed.
+    """
+    try:
+        sock, rtt = await async_connect(host, port, timeout, resolver=resolver)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    sock.close()
+    return rtt
+
+async def _probe_candidate(candidate, timeout, deadline, resolver):
+    for _ in range(candidate.attempts):
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            break
+        candidate.attempt_started = time.perf_counter()
+        candidate.rtts.append(await _connect_once(candidate.host, candidate.port, min(timeout, remaining),
+                                                   resolver))
+    candidate.done = True
+
+def _clear_winner(candidates, factor):
+    """Returns True once no unfinished candidate can still beat the best finished one."""
+    finished = [c for c in candidates if c.done and len(c.successes()) == c.attempts]
+    if not finished:
+        return False
+    best = min(statistics.median(c.successes()) for c in finished)
+    bound = best * factor
+    now = time.perf_counter()
+    for c in candidates:
+        if c.done:
+            continue
+        successes = c.successes()
+        if successes and min(successes) <= bound:
+            return False
+        if not successes and (c.attempt_started is None or (now - c.attempt_started) * 1000 <= bound):
+            return False
+    return True
+
+def _rank_key(entry):
+    if not entry["success_rate"]:
+        return (1, float('inf'))
+    # A lossy server is penalised in proportion to its failed connects.
+    return (0, entry["median_rtt"] / entry["success_rate"])
+
+async def _rank(candidates, timeout, deadline, factor, resolver):
+    start = time.perf_counter()
+    end = start + deadline
+    tasks = {asyncio.ensure_future(_probe_candidate(c, timeout, end, resolver)) for c in candidates if not c.done}
+    pending = tasks
+    while pending:
+        remaining = end - time.perf_counter()
+        if remaining <= 0:
+            break
+        # Wake up periodically so slow in-flight connects can be ruled out early.
+        _, pending = await asyncio.wait(pending, timeout=min(remaining, 0.05),
+                                        return_when=asyncio.FIRST_COMPLETED)
+        if factor and _clear_winner(candidates, factor):
+            break
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+    elapsed = (time.perf_counter() - start) * 1000
+    logger.debug(f"Server selection probed {len(candidates)} servers in {elapsed:.0f} ms")
+
+def rank_servers(servers, default_port=80, attempts=SELECTION_ATTEMPTS, timeout=SELECTION_TIMEOUT,
+                 deadline=SELECTION_DEADLINE, early_stop_factor=SELECTION_EARLY_STOP_FACTOR, resolver=None,
+                 breakers=None):
+    """Probes all servers concurrently and ranks them by median connect RTT and success rate.
+
+    Args:
+        servers: Download URLs or iPerf3 {'host', 'port'} dicts
+        default_port: Port used when a server does not name one
+        attempts: TCP connects per server
+        timeout: Per-connect timeout (in seconds)
+        deadline: Global budget for the whole selection round (in seconds)
+        early_stop_factor: Stop once every unfinished server is this many times slower
+            than the best finished one (0 disables early stopping)
+        resolver: Resolver used to look every host up once, concurrently, before probing
+        breakers: Breakers (default_breakers() if None); a server whose breaker is open is
+            not probed, and one in its half-open trial gets a single connect
+
+    Returns:
+        List of ranking entries, best first. Each entry keeps the original server plus
+        'host', 'port', 'dns_ms', 'rtts', 'median_rtt', 'success_rate', 'completed' and
+        'circuit_open'. 'rtts' are TCP connect times only; DNS lookup time is reported in 'dns_ms'.
+    """
+    candidates = [_Candidate(server, *server_address(server, default_port), attempts) for server in servers]
+    if not candidates:
+        return []
+    breakers = breakers or default_breakers()
+    for c in candidates:
+        c.breaker = breakers.get(breaker_key("tcp", c.host, c.port))
+        if not c.breaker.allow():
+            c.circuit_open = c.done = True
+        elif c.breaker.state == HALF_OPEN:
+            c.attempts = 1
+    probed = [c for c in candidates if not c.circuit_open]
+    if len(probed) < len(candidates):
+        logger.info(f"⏭️ Skipping {len(candidates) - len(probed)} servers that keep failing (circuit open)")
+    resolver = resolver or default_resolver()
+    resolutions = resolver.resolve_all(c.host for c in probed)
+    for c in probed:
+        c.dns_ms = resolutions[c.host].dns_ms
+    asyncio.run(_rank(candidates, timeout, deadline, early_stop_factor, resolver))
+    for c in probed:
+        # Servers cut short by the deadline or early stop get no verdict
+        c.breaker.record(True if c.successes() else (False if c.done else None))
+    return sorted((c.entry() for c in candidates), key=_rank_key)
+
+def reachable(ranking):
+    """Filters a ranking down to servers that answered at least one probe."""
+    return [entry for entry in ranking if entry["success_rate"]]
+
+def server_breaker(entry, breakers=None, port=None):
+    """The circuit breaker shared by selection and transfers for a ranking entry's server.
+
+    port names another endpoint on the same host, such as the iPerf3 port of an HTTP mirror,
+    whose failures must not open the circuit of the ranked one.
+    """
+    return (breakers or default_breakers()).get(breaker_key("tcp", entry["host"], port or entry["port"]))
+
+def print_ranking(ranking, kind):
+    """Prints a ranking in the same style as the original per-server checks."""
+    print(f"🔍 Testing {kind} servers for the best connection...")
+    for entry in ranking:
+        if entry.get("circuit_open"):
+            print(f"⏭️ {entry['host']} - Skipped (failing repeatedly, retried after a cool-down)")
+        elif entry["median_rtt"] is not None:
+            print(f"✅ {entry['host']} - {entry['median_rtt']:.2f} ms ({entry['success_rate'] * 100:.0f}% ok)")
+        elif entry["completed"]:
+            print(f"❌ {entry['host']} - Unreachable")
+        else:
+            print(f"⏭️ {entry['host']} - Skipped (selection stopped early)")
@@ -0,0 +1,76 @@
+import re
+import time
+from config.settings import (FILE_SIZES, TEST_PROFILE, TEST_BUDGET, ADAPTIVE_PROBE_MB, ADAPTIVE_PROBE_SECONDS,
+                             ADAPTIVE_MIN_MB, ADAPTIVE_MAX_MB)
+from utils.logger import logger
+
+PROFILES = ("adaptive", "fixed")
+_DURATION_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(ms|s|m|h)?\s*$")
+_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, None: 1}
+
+def parse_duration(value):
+    """Parses '30s', '2m', '1.5h', '500ms' or a bare number of seconds."""
+    match = _DURATION_RE.match(str(value))
+    if not match:
+        raise ValueError(f"Invalid duration: {value!r} (expected e.g. 30s, 2m)")
+    return float(match.group(1)) * _UNITS[match.group(2)]
+
+class TestPlan:
+    """Decides how much data each transfer phase moves.
+
+    The 'fixed' profile is the original FILE_SIZES sweep. The 'adaptive' profile
+    splits the remaining time budget across the phases still to run; each phase
+    sends a short probe to estimate link capacity, then one transfer sized to fill
+    the rest of its share.
+    """
+
+    __test__ = False  # Not a test case, despite the name
+
+    def __init__(self, profile=TEST_PROFILE, budget=TEST_BUDGET, phases=1):
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown test profile: {profile} (expected one of {', '.join(PROFILES)})")
+        self.profile = profile
+        self.budget = budget
+        self.phases = phases
+        self.claimed = 0
+        self.started = time.perf_counter()
+
+    def remaining(self):
+        return max(0.0, self.budget - (time.perf_counter() - self.started))
+
+    def claim_phase(self):
+        """Returns the seconds available to the next phase and marks it as started."""
+        share = self.remaining() / max(1, self.phases - self.claimed)
+        self.claimed += 1
+        return share
+
+    def run_transfers(self, run, label="transfer"):
+        """Runs one phase's transfers through run(size_mb, duration) -> Mbps.
+
+        Returns:
+            List of Mbps figures that make up the phase result; empty when the budget
+            is spent, since the engines take a duration of 0 as no limit at all
+        """
+        if self.profile == "fixed":
+            return [run(size, None) for size in FILE_SIZES]
+
+        budget = self.claim_phase()
+        if budget <= 0:
+            logger.warning(f"⏭️ {label}: time budget spent, not started")
+            return []
+        start = time.perf_counter()
+        probe_seconds = min(ADAPTIVE_PROBE_SECONDS, budget / 4)
+        probe = run(ADAPTIVE_PROBE_MB, probe_seconds)
+        if not probe:
+            return [probe]
+
+        remaining = budget - (time.perf_counter() - start)
+        if remaining < probe_seconds:
+            return [probe]
+        # Size the transfer so it would run for the rest of the budget at the probed rate,
+        # with headroom because the probe still includes TCP ramp-up.
+        size_mb = probe * remaining / 8 * 1.25
+        size_mb = int(min(max(size_mb, ADAPTIVE_MIN_MB), ADAPTIVE_MAX_MB))
+        logger.info(f"📐 {label}: probe {probe:.2f} Mbps -> {size_mb} MB within {remaining:.1f}s")
+        speed = run(size_mb, remaining)
+        return [speed] if speed else [probe]
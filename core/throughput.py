@@ -0,0 +1,168 @@
+import statistics
+import threading
+import time
+from array import array
+from config.settings import (THROUGHPUT_INTERVAL, THROUGHPUT_RING_SIZE, THROUGHPUT_WINDOW,
+                             THROUGHPUT_TOLERANCE, THROUGHPUT_MIN_DURATION, THROUGHPUT_RAMP_FRACTION)
+from core.metrics import Sketch, merge_sketches
+
+def to_mbps(nbytes, seconds):
+    """Converts a byte count over seconds to megabits per second."""
+    return (nbytes * 8 / 1_000_000) / seconds if seconds > 0 else 0.0
+
+def ramp_up_end(rates, window=THROUGHPUT_WINDOW, fraction=THROUGHPUT_RAMP_FRACTION):
+    """Index of the first interval past TCP ramp-up.
+
+    Ramp-up ends at the first interval whose short rolling mean reaches fraction of the
+    best rolling mean of the transfer.
+    """
+    span = max(1, min(window // 3, len(rates)))
+    if len(rates) <= span:
+        return 0
+    means = [statistics.fmean(rates[i:i + span]) for i in range(len(rates) - span + 1)]
+    target = max(means) * fraction
+    for i, mean in enumerate(means):
+        if mean >= target:
+            return i
+    return 0
+
+def is_stable(rates, window=THROUGHPUT_WINDOW, tolerance=THROUGHPUT_TOLERANCE):
+    """True once the last window of interval rates varies, and has grown, by less than tolerance."""
+    if len(rates) < 2 * window:
+        return False
+    recent = rates[-window:]
+    mean = statistics.fmean(recent)
+    if mean <= 0:
+        return False
+    previous = statistics.fmean(rates[-2 * window:-window])
+    return statistics.pstdev(recent) / mean <= tolerance and previous >= mean * (1 - tolerance)
+
+class IntervalSampler:
+    """Records a transfer's byte counter every interval into a fixed-size ring buffer.
+
+    The sampler thread turns byte counts into per-interval throughput. With early_stop,
+    it sets the engine's stop_event once the rolling estimate has been stable within
+    tolerance, so transfers on steady links end after a few seconds.
+    """
+
+    def __init__(self, interval=THROUGHPUT_INTERVAL, capacity=THROUGHPUT_RING_SIZE,
+                 window=THROUGHPUT_WINDOW, tolerance=THROUGHPUT_TOLERANCE,
+                 min_duration=THROUGHPUT_MIN_DURATION, early_stop=True):
+        self.interval = interval
+        self.window = window
+        self.tolerance = tolerance
+        self.min_duration = min_duration
+        self.early_stop = early_stop
+        self.ring = array("d", bytes(8 * capacity))  # Mbps per interval
+        self.count = 0
+        self.stopped_early = False
+        self._read_bytes = None
+        self._stop_event = None
+        self._done = threading.Event()
+        self._thread = None
+
+    def rates(self):
+        """The retained interval rates, oldest first."""
+        capacity = len(self.ring)
+        if self.count <= capacity:
+            return self.ring[:self.count].tolist()
+        head = self.count % capacity
+        return (self.ring[head:] + self.ring[:head]).tolist()
+
+    @classmethod
+    def from_series(cls, rates, interval):
+        """A stopped sampler holding a series measured elsewhere, such as iperf3's interval reports.
+
+        The stability window keeps the same length in seconds as for THROUGHPUT_INTERVAL samples.
+        """
+        window = max(1, round(THROUGHPUT_WINDOW * THROUGHPUT_INTERVAL / interval)) if interval > 0 else 1
+        sampler = cls(interval=interval, window=window, early_stop=False)
+        for rate in rates:
+            sampler._record(rate)
+        return sampler
+
+    def _record(self, rate):
+        self.ring[self.count % len(self.ring)] = rate
+        self.count += 1
+
+    def _run(self):
+        start = last_time = time.perf_counter()
+        last_bytes = self._read_bytes()
+        next_tick = start + self.interval
+        while not self._done.wait(max(0.0, next_tick - time.perf_counter())):
+            now = time.perf_counter()
+            total = self._read_bytes()
+            self._record(to_mbps(total - last_bytes, now - last_time))
+            last_bytes, last_time = total, now
+            next_tick += self.interval
+            if (self.early_stop and self._stop_event is not None and now - start >= self.min_duration
+                    and is_stable(self.rates()[-2 * self.window:], self.window, self.tolerance)):
+                self.stopped_early = True
+                self._stop_event.set()
+                return
+
+    def start(self, read_bytes, stop_event=None):
+        """Starts sampling read_bytes(); stop_event is set when the estimate is stable."""
+        self._read_bytes = read_bytes
+        self._stop_event = stop_event
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._done.set()
+        if self._thread:
+            self._thread.join()
+        return self.summary()
+
+    def summary(self):
+        """Interval series plus the steady-state throughput with ramp-up trimmed off.
+
+        The steady intervals are also summarized in a Sketch (p50/p90/p99 of the interval
+        rates), which merges across streams and runs.
+        """
+        rates = self.rates()
+        trimmed = ramp_up_end(rates, self.window)
+        sketch = Sketch().add_many(rates[trimmed:])
+        stats = sketch.summary()
+        return {
+            "interval": self.interval,
+            "intervals_mbps": [round(rate, 3) for rate in rates],
+            "ramp_up_intervals": trimmed,
+            "steady_mbps": stats["mean"],
+            "steady_p50": stats["p50"],
+            "steady_p90": stats["p90"],
+            "steady_p99": stats["p99"],
+            "sketch": sketch.to_dict(),
+            "stopped_early": self.stopped_early,
+        }
+
+def iperf_transfer(report):
+    """A transfer record like the HTTP engines' from an iperf3 JSON report.
+
+    The interval series is iperf3's own per-interval report (one second by default),
+    with omitted intervals left out; ramp-up is trimmed the same way. iperf3 runs for
+    a fixed time, so its transfers cannot stop early.
+
+    Returns:
+        Dictionary with 'bytes', 'elapsed', 'mbps' (steady state), 'average_mbps' and
+        'throughput', or None when the report has no intervals
+    """
+    sums = [entry["sum"] for entry in (report or {}).get("intervals", []) if not entry["sum"].get("omitted")]
+    if not sums:
+        return None
+    interval = statistics.median(entry["seconds"] for entry in sums)
+    throughput = IntervalSampler.from_series([entry["bits_per_second"] / 1_000_000 for entry in sums],
+                                             interval).summary()
+    sent = sum(entry["bytes"] for entry in sums)
+    elapsed = sum(entry["seconds"] for entry in sums)
+    return {"bytes": sent, "elapsed": elapsed, "mbps": throughput["steady_mbps"] or to_mbps(sent, elapsed),
+            "average_mbps": to_mbps(sent, elapsed), "engine": "iperf3", "throughput": throughput}
+
+def print_interval_spread(transfers, direction):
+    """Prints p50/p90/p99 of the 100 ms interval rates, merged across every recorded transfer."""
+    intervals = merge_sketches(t["throughput"]["sketch"] for t in transfers or [] if "throughput" in t)
+    if intervals is None or not intervals.count:
+        return
+    print(f"   {direction} interval rates: p50 {intervals.quantile(0.5):.2f}, p90 {intervals.quantile(0.9):.2f}, "
+          f"p99 {intervals.quantile(0.99):.2f} Mbps over {intervals.count} intervals")
@@ -0,0 +1,203 @@
+import argparse
+import select
+import socket
+import struct
+import threading
+import time
+from collections import OrderedDict
+from config.settings import UDP_PROBE_COUNT, UDP_PROBE_RATE, UDP_PROBE_SIZE, UDP_REFLECTOR_PORT
+from core.metrics import Sketch
+from core.profiler import record_send_delay
+from utils.logger import logger
+
+# magic, sequence, client send time (ns), reflector receive time (ns), reflector packet count
+_PACKET = struct.Struct("!4sIQQI")
+MAGIC = b"CSTU"
+MAX_SESSIONS = 1024
+
+class UdpReflector:
+    """Echoes probe packets back to their sender, stamping its receive time and count.
+
+    The count of packets received from each client address lets the client split
+    round-trip loss into forward and return loss. Run it on a test node with
+    `python -m core.udp_probe --reflect`, or start() it in-process on localhost.
+    """
+
+    def __init__(self, host="0.0.0.0", port=UDP_REFLECTOR_PORT):
+        family = socket.AF_INET6 if ":" in host else socket.AF_INET
+        self.sock = socket.socket(family, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.address = self.sock.getsockname()
+        self.sessions = OrderedDict()  # client address -> packets received
+        self._stop = threading.Event()
+        self._thread = None
+
+    def serve(self):
+        """Reflects packets until stop() is called."""
+        buffer = bytearray(65535)
+        self.sock.settimeout(0.2)
+        while not self._stop.is_set():
+            try:
+                n, sender = self.sock.recvfrom_into(buffer)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            if n < _PACKET.size or buffer[:4] != MAGIC:
+                continue
+            received = self.sessions.pop(sender, 0) + 1
+            self.sessions[sender] = received
+            if len(self.sessions) > MAX_SESSIONS:
+                self.sessions.popitem(last=False)
+            _, seq, sent_ns, _, _ = _PACKET.unpack_from(buffer)
+            _PACKET.pack_into(buffer, 0, MAGIC, seq, sent_ns, time.perf_counter_ns(), received)
+            try:
+                self.sock.sendto(memoryview(buffer)[:n], sender)
+            except OSError as e:
+                logger.debug(f"Reflector send to {sender} failed: {e}")
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.sock.close()
+
+def rfc3550_jitter(transits):
+    """Interarrival jitter (RFC 3550, section 6.4.1) over transit times in arrival order."""
+    jitter = 0.0
+    for previous, current in zip(transits, transits[1:]):
+        jitter += (abs(current - previous) - jitter) / 16
+    return jitter
+
+def udp_probe_stream(host, port=UDP_REFLECTOR_PORT, count=UDP_PROBE_COUNT, rate=UDP_PROBE_RATE,
+                     size=UDP_PROBE_SIZE, timeout=1.0):
+    """Sends a paced stream of sequenced, timestamped packets to a reflector.
+
+    Args:
+        host: Reflector host
+        port: Reflector port
+        count: Packets to send
+        rate: Packets per second
+        size: Datagram size in bytes (at least the probe header)
+        timeout: How long to wait for stragglers after the last send (in seconds)
+
+    Returns:
+        Dictionary with RTT statistics, RFC 3550 jitter (round trip, forward and return),
+        round-trip/forward/return loss, duplicates and reordered packets. Times in ms,
+        loss in percent.
+    """
+    family, _, _, _, address = socket.getaddrinfo(host, port, 0, socket.SOCK_DGRAM)[0]
+    size = max(size, _PACKET.size)
+    packet = bytearray(size)
+    buffer = bytearray(65535)
+    interval_ns = int(1e9 / rate)
+    replies = []  # (seq, client send ns, reflector rx ns, reflector count, client rx ns)
+    seen = bytearray(count)
+    duplicates, reordered, highest = 0, 0, -1
+
+    with socket.socket(family, socket.SOCK_DGRAM) as sock:
+        sock.connect(address)
+        sock.setblocking(False)
+        start_ns = time.perf_counter_ns()
+        end_ns = start_ns + (count - 1) * interval_ns + int(timeout * 1e9)
+        sent = 0
+        while True:
+            now = time.perf_counter_ns()
+            if sent < count and now >= start_ns + sent * interval_ns:
+                record_send_delay(start_ns + sent * interval_ns, now)
+                _PACKET.pack_into(packet, 0, MAGIC, sent, time.perf_counter_ns(), 0, 0)
+                try:
+                    sock.send(packet)
+                except (BlockingIOError, ConnectionRefusedError):
+                    pass  # Counted as lost; a refused port shows up as 100% loss
+                sent += 1
+                continue
+            if now >= end_ns or (sent == count and len(replies) >= count):
+                break
+            wake = start_ns + sent * interval_ns if sent < count else end_ns
+            ready, _, _ = select.select([sock], [], [], max(0, min(wake, end_ns) - now) / 1e9)
+            while ready:
+                try:
+                    n = sock.recv_into(buffer)
+                except (BlockingIOError, ConnectionRefusedError):
+                    break
+                received_ns = time.perf_counter_ns()
+                if n < _PACKET.size or buffer[:4] != MAGIC:
+                    continue
+                _, seq, sent_ns, reflected_ns, reflector_count = _PACKET.unpack_from(buffer)
+                if seq >= count:
+                    continue
+                if seen[seq]:
+                    duplicates += 1
+                    continue
+                seen[seq] = 1
+                if seq < highest:
+                    reordered += 1
+                highest = max(highest, seq)
+                replies.append((seq, sent_ns, reflected_ns, reflector_count, received_ns))
+
+    return _summarize(count, replies, duplicates, reordered)
+
+def _summarize(sent, replies, duplicates, reordered):
+    received = len(replies)
+    rtts = [(rx - tx) / 1e6 for _, tx, _, _, rx in replies]
+    sketch = Sketch().add_many(rtts)
+    sketch.missing = sent - received
+    result = {
+        "sent": sent,
+        "received": received,
+        "duplicates": duplicates,
+        "reordered": reordered,
+        "packet_loss": (sent - received) / sent * 100 if sent else None,
+        "forward_loss": None,
+        "return_loss": None,
+        "avg_latency": sketch.mean,
+        "median_latency": sketch.quantile(0.5),
+        "p90_latency": sketch.quantile(0.9),
+        "p99_latency": sketch.quantile(0.99),
+        "min_latency": min(rtts) if rtts else None,
+        "jitter": rfc3550_jitter(rtts) if len(rtts) > 1 else None,
+        "forward_jitter": None,
+        "return_jitter": None,
+        "sketch": sketch.to_dict(),
+    }
+    if not replies:
+        return result
+
+    # The reflector's count at the highest echoed sequence number tells how many of the
+    # packets up to that point made it there; the rest were lost on the forward path.
+    last = max(replies, key=lambda r: r[0])
+    forward_rate = min(1.0, last[3] / (last[0] + 1))
+    round_trip_rate = received / sent
+    result["forward_loss"] = (1 - forward_rate) * 100
+    result["return_loss"] = (1 - min(1.0, round_trip_rate / forward_rate)) * 100
+
+    # Clock offsets between client and reflector cancel out in transit differences.
+    by_reflector = sorted(replies, key=lambda r: r[2])
+    result["forward_jitter"] = rfc3550_jitter([(r[2] - r[1]) / 1e6 for r in by_reflector])
+    result["return_jitter"] = rfc3550_jitter([(r[4] - r[2]) / 1e6 for r in replies])
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="UDP probe reflector and client")
+    parser.add_argument("--reflect", action="store_true", help="run a reflector instead of a client")
+    parser.add_argument("--host", default="0.0.0.0", help="bind address (reflector) or reflector host (client)")
+    parser.add_argument("--port", type=int, default=UDP_REFLECTOR_PORT)
+    parser.add_argument("--count", type=int, default=UDP_PROBE_COUNT)
+    parser.add_argument("--rate", type=float, default=UDP_PROBE_RATE)
+    args = parser.parse_args()
+
+    if args.reflect:
+        reflector = UdpReflector(args.host, args.port)
+        logger.info(f"🔁 UDP reflector listening on {reflector.address[0]}:{reflector.address[1]}", protocol="UDP")
+        try:
+            reflector.serve()
+        except KeyboardInterrupt:
+            reflector.stop()
+    else:
+        print(udp_probe_stream(args.host, args.port, count=args.count, rate=args.rate))
@@ -1,60 +1,85 @@
-import iperf3
-import threading
-import statistics
-import socket
-import random
-import string
-import time
-from config.settings import UPLOAD_SERVERS, FILE_SIZES, PROTOCOL
+from contextlib import nullcontext
+from config.settings import UPLOAD_SERVERS, TRANSFER_ENGINE, RANKING_CACHE
+from core.bufferbloat import start_load_sampler, print_phase_summary
+from core.metrics import Sketch
+from core.upload_engine import http_upload
+from core.process_engine import process_http_upload, print_cpu_report
+from core.ranking_cache import default_cache
+from core.server_selection import rank_servers, reachable, print_ranking, server_breaker
+from core.test_plan import TestPlan
+from core.throughput import print_interval_spread, iperf_transfer
 from utils.logger import logger
 
-PING_ATTEMPTS = 3  # Number of pings for server selection
-
-def ping_server(host):
-    """Ping a server to measure latency."""
-    latencies = []
-    for _ in range(PING_ATTEMPTS):
-        try:
-            start = time.time()
-            sock = socket.create_connection((host, 5201), timeout=2)
-            sock.close()
-            latency = (time.time() - start) * 1000  # ms
-            latencies.append(latency)
-        except Exception:
-            latencies.append(None)
-    successful_pings = [l for l in latencies if l is not None]
-    return statistics.mean(successful_pings) if successful_pings else float('inf')
-
-def select_best_upload_server():
-    """Select the upload server with the lowest latency."""
-    best_server = None
-    lowest_latency = float('inf')
-
-    print("🔍 Testing upload servers for the best connection...")
-    for server in UPLOAD_SERVERS:
-        latency = ping_server(server['host'])
-        if latency != float('inf'):
-            print(f"✅ {server['host']} - {latency:.2f} ms")
-        else:
-            print(f"❌ {server['host']} - Unreachable")
+def rank_upload_servers():
+    """Rank every upload server, best first.
 
-        if latency < lowest_latency:
-            lowest_latency = latency
-            best_server = server
+    With RANKING_CACHE, a cached ranking for this network is returned at once (and
+    refreshed in the background when stale); servers are only probed on a cache miss.
+    """
+    def probe():
+        return rank_servers(UPLOAD_SERVERS, default_port=5201)
+    ranking = default_cache().rank("upload", UPLOAD_SERVERS, probe, default_port=5201) if RANKING_CACHE else probe()
+    print_ranking(ranking, "upload")
+    return ranking
 
+def select_best_upload_server(ranking=None):
+    """Select the upload server with the lowest latency."""
+    # Servers that keep failing transfers are passed over until their cool-down ends
+    candidates = reachable(ranking if ranking is not None else rank_upload_servers())
+    best_server = next((s for s in candidates if server_breaker(s).allow()), None)
     if best_server:
-        print(f"\n🚀 Selected Upload Server: {best_server['host']} with {lowest_latency:.2f} ms latency.")
+        print(f"\n🚀 Selected Upload Server: {best_server['host']} with {best_server['median_rtt']:.2f} ms latency.")
         return best_server
     else:
         logger.error("⚠️ No upload servers are reachable.")
         return None
 
-def run_iperf_upload_test(server, protocol="tcp"):
-    """Run iPerf3 upload test against the selected server with TCP/UDP."""
-    client = iperf3.Client()
+def run_http_upload_test(server, file_size, protocol="tcp", transfers=None, duration=None,
+                         engine=TRANSFER_ENGINE):
+    """Upload file_size MB to the server's 'upload_url' over parallel zero-copy HTTP POST streams.
+
+    The upload also ends after duration seconds when given. With engine='processes'
+    the streams run in worker processes and the report says whether the client CPU
+    was the bottleneck. The full engine result, including its 100 ms interval series,
+    is appended to transfers.
+    """
+    upload = process_http_upload if engine == "processes" else http_upload
+    try:
+        result = upload(server['server']['upload_url'], file_size * 1024 * 1024, duration=duration)
+    except (OSError, ValueError) as e:
+        logger.error(f"❌ Upload test failed: {e}")
+        return 0
+    if transfers is not None:
+        transfers.append(dict(result, file_size=file_size, protocol=protocol))
+
+    for i, stream in enumerate(result["streams"], 1):
+        logger.debug(f"Stream {i}: {stream['bytes']} bytes via {stream['method']} "
+                     f"@ {stream['bytes_per_second'] / 1_000_000:.2f} MB/s")
+    print(f"📊 Upload Speed to {server['host']} over HTTP ({len(result['streams'])} streams): {result['mbps']:.2f} Mbps")
+    if "cpu" in result:
+        print_cpu_report(result["cpu"], "upload")
+    return result["mbps"]
+
+def run_iperf_upload_test(server, file_size=None, protocol="tcp", transfers=None, duration=None,
+                          engine=None):
+    """Run iPerf3 upload test against the selected server with TCP/UDP.
+
+    iPerf3 runs are time-based; duration (whole seconds, at least 1) overrides its default.
+    The result is the steady-state rate of iPerf3's interval reports, whose series is
+    appended to transfers; iPerf3 runs cannot stop early. engine is accepted for
+    symmetry with run_http_upload_test; iPerf3 runs its own streams.
+    """
+    try:
+        import iperf3  # Imported on first use, so runs that never reach iPerf3 do not load it
+        client = iperf3.Client()
+    except (ImportError, OSError) as e:  # No python-iperf3 or no libiperf
+        logger.error(f"❌ Upload test failed: iPerf3 is not available ({e})")
+        return 0
     client.server_hostname = server['host']
     client.port = server['port']
     client.reverse = True  # Upload test
+    if duration:
+        client.duration = max(1, int(duration))
 
     if protocol == "udp":
         client.udp = True
@@ -63,61 +88,86 @@ def run_iperf_upload_test(server, protocol="tcp"):
     if result.error:
         logger.error(f"❌ Upload test failed: {result.error}")
         return 0
+    transfer = iperf_transfer(result.json)
+    if transfer is None:
+        speed_mbps = result.sent_Mbps if protocol == "tcp" else result.Mbps
     else:
-        speed_mbps = result.sent_Mbps
-        print(f"📊 Upload Speed to {server['host']} over {protocol.upper()}: {speed_mbps:.2f} Mbps")
-        return speed_mbps
-
-def generate_realistic_data(size_mb):
-    """Simulate real-world file uploads with mixed data types."""
-    types = [string.ascii_letters, string.digits, '!@#$%^&*()_+']
-    data = ''.join(random.choices(''.join(types), k=size_mb * 1024 * 1024)).encode('utf-8')
-    return data
-
-def measure_latency_under_load(server, duration=10):
-    """Measure latency during an active upload to detect bufferbloat."""
-    latencies = []
-
-    def ping_during_upload():
-        end_time = time.time() + duration
-        while time.time() < end_time:
-            latency = ping_server(server['host'])
-            latencies.append(latency)
-            time.sleep(1)
-
-    ping_thread = threading.Thread(target=ping_during_upload)
-    ping_thread.start()
-    return ping_thread, latencies
-
-def upload_test():
-    """Conducts upload speed test with iPerf3 and measures latency under load."""
-    best_server = select_best_upload_server()
+        speed_mbps = transfer["mbps"]
+        if transfers is not None:
+            transfers.append(dict(transfer, file_size=file_size, protocol=protocol))
+    print(f"📊 Upload Speed to {server['host']} over {protocol.upper()}: {speed_mbps:.2f} Mbps")
+    return speed_mbps
+
+def upload_test(protocol=None, ranking=None, sampler=None, transfers=None, plan=None, engine=TRANSFER_ENGINE):
+    """Conducts upload speed test with iPerf3 and measures latency under load.
+
+    Only protocol ('tcp' or 'udp') is tested when given, otherwise TCP and then UDP.
+    A ranking from rank_upload_servers() can be passed in so several tests share one
+    selection round; servers further down the ranking are used as fallbacks. Latency
+    under load is recorded in the "upload" phase of sampler (a LoadLatencySampler);
+    without one, a sampler against the selected server is run for this test alone.
+    Per-transfer details, including the interval throughput series, are appended to
+    transfers when a list is given. The transfer sizes come from plan (a TestPlan,
+    adaptive within TEST_BUDGET by default); engine picks the thread or multi-process
+    HTTP engine.
+    """
+    if plan is None:
+        plan = TestPlan(phases=1 if protocol else 2)
+    if ranking is None:
+        ranking = rank_upload_servers()
+    best_server = select_best_upload_server(ranking)
     if not best_server:
         logger.error("❌ No server available for upload test.")
         return 0
+    fallbacks = [s for s in reachable(ranking) if s is not best_server]
 
-    threads, results = [], []
+    own_sampler = sampler is None
+    if own_sampler:
+        sampler = start_load_sampler(best_server['host'], best_server['port'])
 
-    for protocol in ["tcp", "udp"]:
-        for file_size in FILE_SIZES:
-            data = generate_realistic_data(file_size)
-            ping_thread, latencies = measure_latency_under_load(best_server)
+    results = []
 
-            t = threading.Thread(target=lambda: results.append(run_iperf_upload_test(best_server, protocol=protocol)))
-            t.start()
-            threads.append(t)
-
-            ping_thread.join()
-
-            print(f"📉 Average Latency Under Load: {statistics.mean(latencies):.2f} ms")
-
-    for t in threads:
-        t.join()
+    for current in [protocol] if protocol else ["tcp", "udp"]:
+        # Servers with an HTTP upload endpoint take TCP uploads through the zero-copy engine
+        if current == "tcp" and best_server['server'].get('upload_url'):
+            run_upload = run_http_upload_test
+        else:
+            run_upload = run_iperf_upload_test
+
+        def run(file_size, duration):
+            with sampler.phase("upload") if sampler else nullcontext():
+                return run_upload(best_server, file_size, protocol=current, transfers=transfers,
+                                  duration=duration, engine=engine)
+
+        results.extend(plan.run_transfers(run, f"{current.upper()} upload"))
+
+    if sampler:
+        print_phase_summary(sampler.stop() if own_sampler else sampler.report(), "upload")
+    if not results:
+        return 0  # No time left to run it, which says nothing about the server
+
+    results = [r for r in results if r]
+    server_breaker(best_server).record(bool(results))
+    if not results and RANKING_CACHE:
+        default_cache().server_failed(best_server['server'], default_port=5201)
+    while not results and fallbacks:
+        best_server = fallbacks.pop(0)
+        if not server_breaker(best_server).allow():
+            continue
+        logger.warning(f"⚠️ Falling back to upload server {best_server['host']}.")
+        speed = run_iperf_upload_test(best_server, protocol=protocol or "tcp", transfers=transfers)
+        server_breaker(best_server).record(bool(speed))
+        if speed:
+            results.append(speed)
+        elif RANKING_CACHE:
+            default_cache().server_failed(best_server['server'], default_port=5201)
 
     if results:
-        avg_speed = statistics.mean(results)
-        print(f"\n📊 **Average Upload Speed:** {avg_speed:.2f} Mbps\n")
+        avg_speed = Sketch().add_many(results).mean
+        label = f" ({protocol.upper()})" if protocol else ""
+        print(f"\n📊 **Average Upload Speed{label}:** {avg_speed:.2f} Mbps\n")
+        print_interval_spread(transfers, "Upload")
         return avg_speed
     else:
         logger.error("❌ Upload test failed for all attempts.")
-        return 0
\ No newline at end of file
+        return 0
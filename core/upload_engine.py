@@ -0,0 +1,251 @@
+import mmap
+import os
+import selectors
+import socket
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+from config.settings import (UPLOAD_STREAMS, UPLOAD_FILE_SIZE, UPLOAD_SEND_CHUNK, PAYLOAD_KIND,
+                             THROUGHPUT_EARLY_STOP)
+from core.payload import Payload
+from core.resolver import connect
+from core.throughput import IntervalSampler, to_mbps
+from utils.logger import logger
+from utils.retry import retry_call
+
+HAS_SENDFILE = hasattr(os, "sendfile")
+
+class PayloadFile:
+    """A payload written once to a temporary file and kept memory-mapped.
+
+    The file is the source for os.sendfile(), which moves the bytes from the page
+    cache to the socket without copying them through Python; the mapping backs the
+    memoryview/sendall() fallback. Transfers longer than the file wrap around it.
+    """
+
+    def __init__(self, size=UPLOAD_FILE_SIZE, kind=PAYLOAD_KIND):
+        self.size = size
+        self.kind = kind
+        self.file = tempfile.TemporaryFile(prefix="speedtest-payload-")
+        Payload(size, kind=kind).write_to(self.file)
+        self.file.flush()
+        self.mmap = mmap.mmap(self.file.fileno(), size, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.mmap)
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.view.release()
+        self.mmap.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class _Stream:
+    """Transmit state for one upload connection."""
+
+    def __init__(self, sock, payload, zero_copy):
+        self.sock = sock
+        self.payload = payload
+        self.zero_copy = zero_copy and HAS_SENDFILE
+        self.selector = selectors.DefaultSelector() if self.zero_copy else None
+        self.offset = 0
+        self.bytes = 0
+
+    @property
+    def method(self):
+        return "sendfile" if self.zero_copy else "sendall"
+
+    def _sendfile(self, count):
+        # os.sendfile() takes an explicit offset, so streams can share one payload file
+        # without seeking it. Sockets with a timeout are non-blocking underneath.
+        while True:
+            try:
+                return os.sendfile(self.sock.fileno(), self.payload.fileno(), self.offset, count)
+            except BlockingIOError:
+                if self.selector.get_map().get(self.sock.fileno()) is None:
+                    self.selector.register(self.sock, selectors.EVENT_WRITE)
+                if not self.selector.select(self.sock.gettimeout()):
+                    raise TimeoutError("Timed out waiting for the upload socket to drain")
+
+    def _send_chunk(self, count):
+        if self.zero_copy:
+            try:
+                return self._sendfile(count)
+            except OSError as e:
+                if self.bytes or isinstance(e, (TimeoutError, ConnectionError)):
+                    raise
+                logger.debug(f"sendfile unavailable ({e}); falling back to sendall")
+                self.zero_copy = False
+        self.sock.sendall(self.payload.view[self.offset:self.offset + count])
+        return count
+
+    def close(self):
+        if self.selector:
+            self.selector.close()
+
+    def send(self, nbytes=None, deadline=float('inf'), stop_event=None, chunk=UPLOAD_SEND_CHUNK):
+        """Sends nbytes (or until the deadline) from the payload file, wrapping at its end."""
+        while nbytes is None or self.bytes < nbytes:
+            if (stop_event is not None and stop_event.is_set()) or time.perf_counter() >= deadline:
+                break
+            count = min(chunk, self.payload.size - self.offset)
+            if nbytes is not None:
+                count = min(count, nbytes - self.bytes)
+            sent = self._send_chunk(count)
+            if not sent:
+                raise ConnectionError("Peer stopped accepting upload data")
+            self.bytes += sent
+            self.offset = (self.offset + sent) % self.payload.size
+
+def split_shares(total, streams):
+    """Splits total into streams near-equal shares (all None when total is None)."""
+    if total is None:
+        return [None] * streams
+    share, extra = divmod(total, streams)
+    return [share + (1 if i < extra else 0) for i in range(streams)]
+
+def _http_request_head(method, host, path, length):
+    return (f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nUser-Agent: custom-speed-test\r\n"
+            f"Content-Type: application/octet-stream\r\nContent-Length: {length}\r\n"
+            f"Connection: close\r\n\r\n").encode("ascii")
+
+def _read_status(sock):
+    """Reads just enough of an HTTP response to return its status code."""
+    head = b""
+    while b"\r\n" not in head:
+        data = sock.recv(1024)
+        if not data:
+            break
+        head += data
+    try:
+        return int(head.split(b" ", 2)[1])
+    except (IndexError, ValueError):
+        raise ConnectionError(f"Malformed HTTP response: {head[:80]!r}")
+
+def stream_worker(address, payload, nbytes, deadline, stop_event, zero_copy, timeout, http, stats, live):
+    """Sends nbytes of payload (until the deadline or stop_event when None) over one connection;
+    the stream is added to live while it runs and its figures go into stats. Shared with the
+    process engine."""
+    start = time.perf_counter()
+    stream = None
+    try:
+        def attempt(remaining):
+            return connect(*address, timeout=timeout if remaining is None else max(0.01, min(timeout, remaining)))
+
+        # Refused or reset connects are retried with jittered backoff while the upload may run
+        sock, stats["connect_ms"] = retry_call(attempt, exceptions=(ConnectionError,),
+                                               deadline=deadline if deadline != float('inf') else None)
+        with sock:
+            stream = _Stream(sock, payload, zero_copy)
+            live.append(stream)
+            if http:
+                sock.sendall(_http_request_head(http["method"], http["host"], http["path"], nbytes))
+            stream.send(nbytes, deadline, stop_event)
+            if http and stream.bytes == nbytes:
+                # A sink that rejects the body has not received it, whatever the send rate was
+                stats["status"] = _read_status(sock)
+                if not 200 <= stats["status"] < 300:
+                    raise ConnectionError(f"Upload rejected with HTTP {stats['status']}")
+            else:
+                sock.shutdown(socket.SHUT_WR)
+    except (OSError, ConnectionError) as e:
+        stats["error"] = str(e)
+        logger.warning(f"⚠️ Upload stream to {address[0]} failed: {e}")
+    finally:
+        if stream:
+            stream.close()
+        stats["elapsed"] = time.perf_counter() - start
+        stats["bytes"] = stream.bytes if stream else 0
+        stats["method"] = stream.method if stream else None
+
+def _run_streams(address, streams, total_bytes, duration, payload_kind, zero_copy, timeout, early_stop,
+                 http=None):
+    if total_bytes is None and duration is None:
+        raise ValueError("An upload needs total_bytes, duration or both")
+    if http and total_bytes is None:
+        raise ValueError("HTTP uploads need total_bytes for their Content-Length")
+    file_size = min(total_bytes, UPLOAD_FILE_SIZE) if total_bytes else UPLOAD_FILE_SIZE
+    stop_event = threading.Event()
+    stats = [{} for _ in range(streams)]
+    live = []  # Streams register here once connected so their counters can be sampled
+    sampler = IntervalSampler(early_stop=early_stop)
+
+    with PayloadFile(max(file_size, 1), kind=payload_kind) as payload:
+        start = time.perf_counter()
+        deadline = start + duration if duration else float('inf')
+        threads = [threading.Thread(target=stream_worker,
+                                    args=(address, payload, nbytes, deadline, stop_event,
+                                          zero_copy, timeout, http, s, live))
+                   for nbytes, s in zip(split_shares(total_bytes, streams), stats)]
+        sampler.start(lambda: sum(stream.bytes for stream in list(live)), stop_event)
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+        throughput = sampler.stop()
+
+    for s in stats:
+        s["mbps"] = to_mbps(s["bytes"], s["elapsed"])
+        s["bytes_per_second"] = s["bytes"] / s["elapsed"] if s["elapsed"] > 0 else 0.0
+
+    sent = sum(s["bytes"] for s in stats)
+    return {"bytes": sent, "elapsed": elapsed, "mbps": throughput["steady_mbps"] or to_mbps(sent, elapsed),
+            "average_mbps": to_mbps(sent, elapsed), "streams": stats, "throughput": throughput}
+
+def tcp_upload(host, port, total_bytes=None, duration=None, streams=UPLOAD_STREAMS,
+               payload_kind=PAYLOAD_KIND, zero_copy=True, timeout=10, early_stop=THROUGHPUT_EARLY_STOP):
+    """Pushes payload bytes over several parallel plain TCP connections.
+
+    Args:
+        host: Sink host
+        port: Sink port
+        total_bytes: Bytes to send across all streams (unbounded if None)
+        duration: Stop after this many seconds (no limit if None)
+        streams: Number of parallel connections
+        payload_kind: Payload compressibility (see core.payload)
+        zero_copy: Use sendfile() when the platform supports it
+        timeout: Socket timeout (in seconds)
+        early_stop: End the upload once interval throughput is stable
+
+    Returns:
+        Dictionary with aggregate 'bytes', 'elapsed' and 'mbps' plus a per-stream
+        breakdown (bytes, bytes_per_second, mbps, transmit method, connect_ms) under 'streams'.
+        'mbps' is the steady-state rate with TCP ramp-up trimmed ('average_mbps' keeps
+        bytes over elapsed time); the 100 ms interval series is under 'throughput'.
+    """
+    return _run_streams((host, port), streams, total_bytes, duration, payload_kind, zero_copy, timeout,
+                        early_stop)
+
+def http_upload(url, total_bytes, method="POST", duration=None, streams=UPLOAD_STREAMS,
+                payload_kind=PAYLOAD_KIND, zero_copy=True, timeout=10, early_stop=THROUGHPUT_EARLY_STOP):
+    """Uploads total_bytes as parallel HTTP POST/PUT request bodies.
+
+    Each stream sends one request whose body is its share of total_bytes. Streams
+    cut short by duration or an early stop are closed without waiting for a response;
+    completed ones read the response status.
+
+    Raises:
+        ConnectionError: A completed stream was answered with a non-2xx status
+    """
+    if method not in ("POST", "PUT"):
+        raise ValueError(f"Unsupported upload method: {method}")
+    parts = urlsplit(url)
+    if parts.scheme != "http" or not parts.hostname:
+        raise ValueError(f"Unsupported upload URL: {url}")
+    path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+    http = {"method": method, "host": parts.netloc, "path": path}
+    result = _run_streams((parts.hostname, parts.port or 80), streams, total_bytes, duration,
+                          payload_kind, zero_copy, timeout, early_stop, http=http)
+    rejected = [s["status"] for s in result["streams"] if s.get("status") and not 200 <= s["status"] < 300]
+    if rejected:
+        raise ConnectionError(f"Upload to {url} rejected with HTTP {rejected[0]}")
+    result["url"] = url
+    return result
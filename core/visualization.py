@@ -1,64 +1,92 @@
-import matplotlib.pyplot as plt
+import json
+import os
+import subprocess
+import sys
+from datetime import datetime
+from config.settings import CHART_FORMATS
+from utils.logger import logger
 
-def plot_results(results):
-    """Generates bar charts for the speed test results across multiple protocols."""
+def chart_path(result_path=None, timestamp=None):
+    """Base path (without extension) for the chart of a run, next to its result file.
 
-    # Extract download/upload speeds for TCP and UDP
-    download_tcp = results.get("download_tcp", 0)
-    download_udp = results.get("download_udp", 0)
-    upload_tcp = results.get("upload_tcp", 0)
-    upload_udp = results.get("upload_udp", 0)
+    A JSON result file gets its chart beside it under the same name; runs stored in the
+    SQLite database get a timestamped chart in the database's directory.
+    """
+    name = os.path.basename(result_path or "")
+    if ".json" in name:
+        return os.path.join(os.path.dirname(result_path), name.split(".json")[0] + "_chart")
+    timestamp = timestamp or datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    directory = os.path.dirname(result_path) if result_path else "results"
+    return os.path.join(directory, f"speedtest_chart_{timestamp}")
 
-    # Extract latency, jitter, and packet loss for each protocol
-    latency_tcp = results.get("latency_tcp", 0)
-    latency_udp = results.get("latency_udp", 0)
-    latency_icmp = results.get("latency_icmp", 0)
-    jitter_tcp = results.get("jitter_tcp", 0)
-    jitter_udp = results.get("jitter_udp", 0)
-    jitter_icmp = results.get("jitter_icmp", 0)
-    packet_loss_tcp = results.get("packet_loss_tcp", 0)
-    packet_loss_udp = results.get("packet_loss_udp", 0)
-    packet_loss_icmp = results.get("packet_loss_icmp", 0)
+def _bar_panel(ax, labels, values, colors, ylabel, title):
+    # Missing measurements (None) are drawn as empty bars rather than failing the chart
+    ax.bar(labels, [value or 0 for value in values], color=colors)
+    ax.set_ylabel(ylabel)
+    ax.set_title(title)
 
-    # Latency under load (Bufferbloat)
-    latency_under_load = results.get("latency_under_load", 0)
+def plot_results(results, path, formats=CHART_FORMATS):
+    """Renders the speed test results as one multi-panel chart file per format.
 
-    # Bar chart for Download/Upload Speeds
-    labels_speed = ["Download TCP", "Download UDP", "Upload TCP", "Upload UDP"]
-    values_speed = [download_tcp, download_udp, upload_tcp, upload_udp]
+    matplotlib is imported here, with the non-interactive Agg backend, so runs that
+    never draw a chart do not pay for it and no window ever blocks the process.
 
-    plt.figure(figsize=(10, 6))
-    plt.bar(labels_speed, values_speed, color=["blue", "cyan", "green", "lightgreen"])
-    plt.ylabel("Speed (Mbps)")
-    plt.title("Download and Upload Speeds (TCP/UDP)")
-    plt.show()
+    Args:
+        results: Dictionary of speed test results
+        path: Output path without extension (see chart_path())
+        formats: File formats to write, e.g. ["png", "svg"]
 
-    # Bar chart for Latency across protocols
-    labels_latency = ["TCP", "UDP", "ICMP", "Under Load"]
-    values_latency = [latency_tcp, latency_udp, latency_icmp, latency_under_load]
+    Returns:
+        List of the files written
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
 
-    plt.figure(figsize=(10, 6))
-    plt.bar(labels_latency, values_latency, color=["orange", "purple", "gray", "red"])
-    plt.ylabel("Latency (ms)")
-    plt.title("Latency Across Protocols and Under Load")
-    plt.show()
+    fig, axes = plt.subplots(2, 2, figsize=(14, 10))
+    _bar_panel(axes[0][0], ["Download TCP", "Download UDP", "Upload TCP", "Upload UDP"],
+               [results.get("download_tcp"), results.get("download_udp"),
+                results.get("upload_tcp"), results.get("upload_udp")],
+               ["blue", "cyan", "green", "lightgreen"], "Speed (Mbps)", "Download and Upload Speeds (TCP/UDP)")
+    _bar_panel(axes[0][1], ["TCP", "UDP", "ICMP", "Under Load"],
+               [results.get("latency_tcp"), results.get("latency_udp"), results.get("latency_icmp"),
+                results.get("latency_under_load")],
+               ["orange", "purple", "gray", "red"], "Latency (ms)", "Latency Across Protocols and Under Load")
+    _bar_panel(axes[1][0], ["TCP", "UDP", "ICMP"],
+               [results.get("jitter_tcp"), results.get("jitter_udp"), results.get("jitter_icmp")],
+               ["yellow", "pink", "brown"], "Jitter (ms)", "Jitter Across Protocols")
+    _bar_panel(axes[1][1], ["TCP", "UDP", "ICMP"],
+               [results.get("packet_loss_tcp"), results.get("packet_loss_udp"), results.get("packet_loss_icmp")],
+               ["magenta", "lime", "navy"], "Packet Loss (%)", "Packet Loss Across Protocols")
+    fig.tight_layout()
 
-    # Bar chart for Jitter across protocols
-    labels_jitter = ["TCP", "UDP", "ICMP"]
-    values_jitter = [jitter_tcp, jitter_udp, jitter_icmp]
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    written = []
+    for fmt in formats:
+        fig.savefig(f"{path}.{fmt}", format=fmt)
+        written.append(f"{path}.{fmt}")
+    plt.close(fig)
+    logger.info(f"🖼️ Chart saved to {', '.join(written)}")
+    return written
 
-    plt.figure(figsize=(10, 6))
-    plt.bar(labels_jitter, values_jitter, color=["yellow", "pink", "brown"])
-    plt.ylabel("Jitter (ms)")
-    plt.title("Jitter Across Protocols")
-    plt.show()
+def plot_in_background(results, path, formats=CHART_FORMATS):
+    """Renders the chart in a separate process, so the caller can exit right away.
 
-    # Bar chart for Packet Loss across protocols
-    labels_packet_loss = ["TCP", "UDP", "ICMP"]
-    values_packet_loss = [packet_loss_tcp, packet_loss_udp, packet_loss_icmp]
+    The results are handed over on stdin; the child keeps running after this process ends.
 
-    plt.figure(figsize=(10, 6))
-    plt.bar(labels_packet_loss, values_packet_loss, color=["magenta", "lime", "navy"])
-    plt.ylabel("Packet Loss (%)")
-    plt.title("Packet Loss Across Protocols")
-    plt.show()
\ No newline at end of file
+    Returns:
+        The child's subprocess.Popen handle
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    child = subprocess.Popen([sys.executable, "-m", "core.visualization", os.path.abspath(path), *formats],
+                             stdin=subprocess.PIPE, cwd=root, start_new_session=True)
+    child.stdin.write(json.dumps(results, default=str).encode("utf-8"))
+    child.stdin.close()
+    return child
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit("Usage: python -m core.visualization OUTPUT_PATH [FORMAT ...] < results.json")
+    plot_results(json.load(sys.stdin), sys.argv[1], sys.argv[2:] or CHART_FORMATS)
@@ -1,24 +1,124 @@
-from core.download import download_test
-from core.upload import upload_test
-from core.latency import latency_test
+from core.download import download_test, rank_download_servers
+from core.upload import upload_test, rank_upload_servers
+from core.latency import latency_test, safe_format
+from core.bufferbloat import start_load_sampler
+from core.daemon import Daemon, light_check
+from core.exporter import start_exporter
+from core.agent import Agent, assigned_rankings, ranked_preferences
+from core.server_selection import reachable, server_address
+from core.metrics import merge_sketches
+from core.profiler import OverheadProfiler, suspect_results, print_profile
+from core.test_plan import TestPlan, PROFILES, parse_duration
+from core.scheduler import Phase, Scheduler, LINK, host_resource
+from core.http_download import ConnectionPool
+from core.resolver import default_resolver
+from core.ranking_cache import default_cache
 from utils.logger import logger
-from core.visualization import plot_results
+from utils.json_handler import save_results
+from core.visualization import plot_results, plot_in_background, chart_path
+from config.settings import (TEST_PROFILE, TEST_BUDGET, TRANSFER_ENGINE, DAEMON_LIGHT_INTERVAL,
+                             DAEMON_FULL_INTERVAL, CHARTS, PROFILE_OVERHEAD, EXPORTER_PORT, EXPORTER_HOST,
+                             AGENT_INTERVAL, RANKING_CACHE, DOWNLOAD_URLS, UPLOAD_SERVERS, LATENCY_TEST_HOSTS,
+                             BUFFERBLOAT_TARGET)
+from contextlib import nullcontext
+import argparse
+import signal
 
-if __name__ == "__main__":
-    logger.info("⚡ Starting Robust Internet Speed Test with Protocol Diversity...\n")
+def _ranking(kind, rank, state, rankings):
+    if rankings and kind in rankings:
+        return rankings[kind]
+    return state.ranking(kind, rank) if state else rank()
+
+def _test_phases(engine, state, phase, publish, rankings, plan, transfers, pool):
+    """The phases of a full test as a DAG for core.scheduler.
+
+    Server selection and the latency test only send light probes, so they overlap unless
+    they probe the same host. The idle latency baseline conflicts with both rankings and
+    the latency test, so none of their probes land in it; each transfer holds the link
+    alone. Every transfer reuses its direction's ranking and the resolver cache.
+    """
+    download_hosts = [server_address(server)[0] for server in DOWNLOAD_URLS]
+    upload_hosts = [server_address(server, 5201)[0] for server in UPLOAD_SERVERS]
+
+    def resolve(outputs):
+        # Every later phase finds its hosts in the resolver cache, so no probe times a DNS lookup
+        return default_resolver().resolve_all(LATENCY_TEST_HOSTS + download_hosts + upload_hosts +
+                                              [BUFFERBLOAT_TARGET[0]])
+
+    def latency(outputs):
+        with phase("latency"):
+            latency_results = latency_test(icmp_sockets=state.icmp_sockets if state else None)
+        publish(dict(latency_results, sketches={"latency": latency_results.get("sketches")}))
+        return latency_results
+
+    def download(protocol):
+        def run(outputs):
+            with phase(f"download_{protocol}"):
+                speed = download_test(protocol=protocol, ranking=outputs["download_ranking"],
+                                      sampler=outputs["sampler"], transfers=transfers[f"download_{protocol}"],
+                                      plan=plan, engine=engine, pool=pool)
+            publish({f"download_{protocol}": speed})
+            return speed
+        return run
+
+    def upload(protocol):
+        def run(outputs):
+            with phase(f"upload_{protocol}"):
+                speed = upload_test(protocol=protocol, ranking=outputs["upload_ranking"], sampler=outputs["sampler"],
+                                    transfers=transfers[f"upload_{protocol}"], plan=plan, engine=engine)
+            publish({f"upload_{protocol}": speed})
+            return speed
+        return run
 
-    # Run Latency Tests for TCP, UDP, ICMP
-    latency_results = latency_test()
-    
-    # Run Download Tests for TCP and UDP
-    logger.info("🔽 Starting Download Tests...\n")
-    download_tcp = download_test(protocol="tcp")
-    download_udp = download_test(protocol="udp")
+    return [
+        Phase("resolve", resolve, shared=[LINK]),
+        Phase("latency", latency, after=["resolve"], shared=[LINK],
+              exclusive=[host_resource(host) for host in LATENCY_TEST_HOSTS]),
+        Phase("download_ranking", lambda outputs: _ranking("download", rank_download_servers, state, rankings),
+              after=["resolve"], shared=[LINK], exclusive=[host_resource(host) for host in download_hosts]),
+        Phase("upload_ranking", lambda outputs: _ranking("upload", rank_upload_servers, state, rankings),
+              after=["resolve"], shared=[LINK], exclusive=[host_resource(host) for host in upload_hosts]),
+        # Sample latency through every transfer. Holding the ranked and latency hosts as well keeps
+        # their probes out of the idle baseline; being declared last, it is taken after them
+        Phase("sampler", lambda outputs: start_load_sampler(), after=["resolve"], shared=[LINK],
+              exclusive=[host_resource(host) for host in
+                         [BUFFERBLOAT_TARGET[0]] + LATENCY_TEST_HOSTS + download_hosts + upload_hosts]),
+        Phase("download_tcp", download("tcp"), after=["sampler", "download_ranking"], exclusive=[LINK]),
+        Phase("download_udp", download("udp"), after=["sampler", "download_ranking"], exclusive=[LINK]),
+        Phase("upload_tcp", upload("tcp"), after=["sampler", "upload_ranking"], exclusive=[LINK]),
+        Phase("upload_udp", upload("udp"), after=["sampler", "upload_ranking"], exclusive=[LINK]),
+    ]
 
-    # Run Upload Tests for TCP and UDP
-    logger.info("🔼 Starting Upload Tests...\n")
-    upload_tcp = upload_test(protocol="tcp")
-    upload_udp = upload_test(protocol="udp")
+def _run_tests(profile, budget, engine, state, phase, publish, rankings):
+    """The test sequence of run_full_test(); phase(name) wraps each measured phase and
+    publish(partial_results) receives each phase's results as soon as it finishes."""
+    # One adaptive share per transfer phase: download and upload, each over TCP and UDP
+    plan = TestPlan(profile, budget, phases=4)
+    transfers = {"download_tcp": [], "download_udp": [], "upload_tcp": [], "upload_udp": []}
+    # Without a daemon's pool, a run still keeps its download connections warm between transfers
+    pool = state.pool if state else ConnectionPool()
+    scheduler = Scheduler(_test_phases(engine, state, phase, publish, rankings, plan, transfers, pool),
+                          budget=budget if profile == "adaptive" else None)
+    try:
+        outputs = scheduler.run()
+    finally:
+        if not state:
+            pool.close()
+    latency_results = outputs.get("latency") or {}
+    download_ranking = outputs.get("download_ranking") or []
+    upload_ranking = outputs.get("upload_ranking") or []
+    download_tcp, download_udp = outputs.get("download_tcp"), outputs.get("download_udp")
+    upload_tcp, upload_udp = outputs.get("upload_tcp"), outputs.get("upload_udp")
+
+    sampler = outputs.get("sampler")
+    bufferbloat = sampler.stop() if sampler else None
+    # Stale cached rankings are re-probed only now, so the probes never overlap a measurement
+    if RANKING_CACHE:
+        default_cache().revalidate()
+    load_latency = {phase: stats["sketch"] for phase, stats in bufferbloat["phases"].items()} if bufferbloat else {}
+    latency_under_load = bufferbloat["loaded_median"] if bufferbloat else None
+    publish({"latency_under_load": latency_under_load, "bufferbloat": bufferbloat,
+             "sketches": {"load_latency": load_latency}})
 
     # Collect all results
     results = {
@@ -35,24 +135,139 @@ if __name__ == "__main__":
         "packet_loss_tcp": latency_results.get("packet_loss_tcp"),
         "packet_loss_udp": latency_results.get("packet_loss_udp"),
         "packet_loss_icmp": latency_results.get("packet_loss_icmp"),
-        "latency_under_load": latency_results.get("latency_under_load"),
+        "latency_under_load": latency_under_load,
+        "bufferbloat": bufferbloat,
+        "transfers": transfers,
+        # Mergeable distributions; unlike 'transfers' and 'bufferbloat' they survive compaction
+        "sketches": {
+            "latency": latency_results.get("sketches"),
+            "throughput": {name: merged.to_dict() for name, runs in transfers.items()
+                           if (merged := merge_sketches(t["throughput"]["sketch"] for t in runs
+                                                        if "throughput" in t)) is not None},
+            "load_latency": load_latency,
+        },
+        "download_server": next((s["host"] for s in reachable(download_ranking)), None),
+        "upload_server": next((s["host"] for s in reachable(upload_ranking)), None),
     }
+    return results
+
+def run_full_test(profile=TEST_PROFILE, budget=TEST_BUDGET, engine=TRANSFER_ENGINE, state=None,
+                  profile_overhead=PROFILE_OVERHEAD, publish=None, rankings=None):
+    """Runs the latency, download and upload tests once and returns the results.
+
+    With state (a core.daemon.WarmState), the server rankings, HTTP connections and
+    ICMP sockets of earlier runs are reused. With profile_overhead, the client's own
+    CPU, scheduling and GIL overhead is reported under 'profile', and results taken
+    while the client was saturated are listed under 'suspect'. With publish (such as
+    core.exporter.MetricsState.update), each phase's results are passed on as it finishes.
+    rankings ({'download': ranking, 'upload': ranking}) replaces server selection, as when
+    a coordinator assigns the servers.
+    """
+    publish = publish or (lambda partial: None)
+    if not profile_overhead:
+        return _run_tests(profile, budget, engine, state, lambda name: nullcontext(), publish, rankings)
+    profiler = OverheadProfiler().start()
+    try:
+        results = _run_tests(profile, budget, engine, state, profiler.phase, publish, rankings)
+    finally:
+        report = profiler.stop()
+    results["profile"] = report
+    results["suspect"] = suspect_results(report, results["transfers"])
+    print_profile(report)
+    if results["suspect"]:
+        logger.warning(f"⚠️ The client was saturated while measuring {', '.join(results['suspect'])}; "
+                       f"these results are marked suspect.")
+    return results
+
+def published_light_check(state, metrics):
+    """A daemon light check whose results also go to the exporter state."""
+    results = light_check(state)
+    metrics.update(results)
+    return results
 
-    # Log Results
-    logger.info(f"📡 Latency (TCP): {results['latency_tcp']:.2f} ms, "
-                f"(UDP): {results['latency_udp']:.2f} ms, "
-                f"(ICMP): {results['latency_icmp']:.2f} ms")
+def log_results(results):
+    """Logs the summary figures of a full test; figures that were not measured show as N/A."""
+    def figures(metric, suffix, protocols=("tcp", "udp", "icmp")):
+        return ", ".join(f"({protocol.upper()}): {safe_format(results.get(f'{metric}_{protocol}'), suffix=suffix)}"
+                         for protocol in protocols)
+
+    logger.info(f"📡 Latency {figures('latency', 'ms')}")
+    logger.info(f"📶 Jitter {figures('jitter', 'ms')}")
+    logger.info(f"❌ Packet Loss {figures('packet_loss', '%')}")
+    logger.info(f"🌐 Download Speeds: {figures('download', 'Mbps', ('tcp', 'udp'))}")
+    logger.info(f"🚀 Upload Speeds: {figures('upload', 'Mbps', ('tcp', 'udp'))}")
+    bufferbloat = results["bufferbloat"]
+    if bufferbloat and bufferbloat["delta"] is not None:
+        logger.info(f"📉 Bufferbloat Latency Under Load: {bufferbloat['loaded_median']:.2f} ms "
+                    f"(idle {bufferbloat['idle_median']:.2f} ms, grade {bufferbloat['grade']})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Robust Internet Speed Test")
+    parser.add_argument("--profile", choices=PROFILES, default=TEST_PROFILE,
+                        help="'adaptive' sizes transfers to fit the budget; 'fixed' runs the FILE_SIZES sweep")
+    parser.add_argument("--budget", type=parse_duration, default=TEST_BUDGET,
+                        help="total time budget for the adaptive profile, e.g. 30s or 2m")
+    parser.add_argument("--engine", choices=("threads", "processes"), default=TRANSFER_ENGINE,
+                        help="run HTTP transfer streams in threads or in worker processes")
+    parser.add_argument("--daemon", action="store_true",
+                        help="keep running: frequent latency checks and periodic full tests with warm state")
+    parser.add_argument("--light-interval", type=parse_duration, default=DAEMON_LIGHT_INTERVAL,
+                        help="daemon: time between latency-only checks, e.g. 5m")
+    parser.add_argument("--full-interval", type=parse_duration, default=DAEMON_FULL_INTERVAL,
+                        help="daemon: time between full throughput tests, e.g. 6h")
+    parser.add_argument("--profile-overhead", action="store_true", default=PROFILE_OVERHEAD,
+                        help="report the client's CPU, scheduling and GIL overhead per phase and mark "
+                             "results taken while it was saturated as suspect")
+    parser.add_argument("--charts", choices=("background", "inline", "off"), default=CHARTS,
+                        help="render the results chart in a background process, before exiting, or not at all")
+    parser.add_argument("--coordinator", metavar="URL",
+                        help="run as an agent of this coordinator (python -m core.coordinator): "
+                             "tests run in the assigned time slots against the assigned servers")
+    parser.add_argument("--agent-name", help="name to register with the coordinator (default: host name)")
+    parser.add_argument("--agent-interval", type=parse_duration, default=AGENT_INTERVAL,
+                        help="agent: time between tests, e.g. 1h")
+    parser.add_argument("--metrics-port", type=int, default=EXPORTER_PORT,
+                        help="serve the latest results in OpenMetrics format on this port (most useful with --daemon)")
+    parser.add_argument("--metrics-host", default=EXPORTER_HOST,
+                        help="address the OpenMetrics endpoint listens on")
+    args = parser.parse_args()
 
-    logger.info(f"📶 Jitter (TCP): {results['jitter_tcp']:.2f} ms, "
-                f"(UDP): {results['jitter_udp']:.2f} ms, "
-                f"(ICMP): {results['jitter_icmp']:.2f} ms")
+    metrics = start_exporter(args.metrics_port, args.metrics_host).state if args.metrics_port is not None else None
+    publish = metrics.update if metrics else None
 
-    logger.info(f"❌ Packet Loss (TCP): {results['packet_loss_tcp']:.2f}%, "
-                f"(UDP): {results['packet_loss_udp']:.2f}%, "
-                f"(ICMP): {results['packet_loss_icmp']:.2f}%")
+    if args.coordinator:
+        agent = Agent(lambda plan, state: run_full_test(args.profile, plan["budget"], args.engine, state,
+                                                        args.profile_overhead, publish,
+                                                        rankings=assigned_rankings(plan)),
+                      args.coordinator, name=args.agent_name, interval=args.agent_interval,
+                      preferences=lambda: ranked_preferences({"download": rank_download_servers(),
+                                                              "upload": rank_upload_servers()}))
+        signal.signal(signal.SIGTERM, lambda *_: agent.stop())
+        agent.run()
+    elif args.daemon:
+        if metrics:
+            daemon_options = {"light_test": lambda state: published_light_check(state, metrics),
+                              "save": lambda results: (save_results(results), metrics.run_finished(results["kind"]))}
+        else:
+            daemon_options = {}
+        daemon = Daemon(lambda state: run_full_test(args.profile, args.budget, args.engine, state,
+                                                    args.profile_overhead, publish),
+                        light_interval=args.light_interval, full_interval=args.full_interval, **daemon_options)
+        signal.signal(signal.SIGTERM, lambda *_: daemon.stop())
+        daemon.run()
+    else:
+        logger.info("⚡ Starting Robust Internet Speed Test with Protocol Diversity...\n")
+        results = run_full_test(args.profile, args.budget, args.engine, profile_overhead=args.profile_overhead,
+                                publish=publish)
+        if metrics:
+            metrics.run_finished("full")
+        log_results(results)
 
-    logger.info(f"🌐 Download Speeds: TCP: {download_tcp:.2f} Mbps, UDP: {download_udp:.2f} Mbps")
-    logger.info(f"🚀 Upload Speeds: TCP: {upload_tcp:.2f} Mbps, UDP: {upload_udp:.2f} Mbps")
+        # Save Results (including per-interval throughput series)
+        saved_to = save_results(results)
 
-    # Visualize Results
-    plot_results(results)
\ No newline at end of file
+        # Visualize Results into one chart file per format next to the results; never opens a window
+        if args.charts == "background":
+            plot_in_background(results, chart_path(saved_to))
+        elif args.charts == "inline":
+            plot_results(results, chart_path(saved_to))
@@ -0,0 +1,65 @@
+"""Stand-ins for the network-facing calls of main.run_full_test().
+
+stubbed_network() keeps the real test sequence (scheduler, test plan, download_test,
+upload_test, result assembly) and replaces only what would touch the internet:
+latency probes, the load sampler, DNS, server ranking and the transfers themselves.
+"""
+from contextlib import ExitStack, contextmanager
+from unittest import mock
+
+DOWNLOAD_SPEED = 100.0
+UPLOAD_SPEED = 20.0
+LATENCY = {f"{metric}_{protocol}": value for metric, value in (("latency", 10.0), ("jitter", 1.0),
+                                                                ("packet_loss", 0.0))
+           for protocol in ("tcp", "udp", "icmp")}
+
+def ranking_entry(server, host, port):
+    return {"server": server, "host": host, "port": port, "dns_ms": 0.0, "rtts": [1.0], "median_rtt": 1.0,
+            "success_rate": 1.0, "completed": True, "circuit_open": False}
+
+DOWNLOAD_RANKING = [ranking_entry("http://dl.example/1GB.bin", "dl.example", 80)]
+UPLOAD_RANKING = [ranking_entry({"host": "ul.example", "port": 5201}, "ul.example", 5201)]
+
+def _transfer(speed):
+    def run(server, file_size=None, protocol="tcp", transfers=None, duration=None, engine=None, pool=None):
+        if transfers is not None:
+            transfers.append({"host": server["host"], "file_size": file_size, "protocol": protocol})
+        return speed
+    return run
+
+class _Resolver:
+    def resolve_all(self, hosts):
+        return {}
+
+class NetworkCalls:
+    """Counts the calls that went to the stand-ins."""
+
+    def __init__(self):
+        self.rankings = {"download": 0, "upload": 0}
+
+    def rank(self, kind, ranking):
+        def run():
+            self.rankings[kind] += 1
+            return ranking
+        return run
+
+@contextmanager
+def stubbed_network():
+    """Patches the network calls for the duration of the block; yields a NetworkCalls."""
+    calls = NetworkCalls()
+    with ExitStack() as stack:
+        for target, stub in (
+                ("main.latency_test", lambda **options: dict(LATENCY)),
+                ("main.start_load_sampler", lambda *args, **options: None),
+                # Without the shared sampler each transfer test would start its own
+                ("core.download.start_load_sampler", lambda *args, **options: None),
+                ("core.upload.start_load_sampler", lambda *args, **options: None),
+                ("main.default_resolver", _Resolver),
+                ("main.rank_download_servers", calls.rank("download", DOWNLOAD_RANKING)),
+                ("main.rank_upload_servers", calls.rank("upload", UPLOAD_RANKING)),
+                ("core.download.run_http_download_test", _transfer(DOWNLOAD_SPEED)),
+                ("core.download.run_iperf_download_test", _transfer(DOWNLOAD_SPEED)),
+                ("core.upload.run_http_upload_test", _transfer(UPLOAD_SPEED)),
+                ("core.upload.run_iperf_upload_test", _transfer(UPLOAD_SPEED))):
+            stack.enter_context(mock.patch(target, stub))
+        yield calls
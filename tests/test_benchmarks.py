@@ -0,0 +1,54 @@
+import unittest
+from benchmarks.run import bench_logging, bench_main, bench_probes, compare, load_baseline, metric
+from benchmarks.servers import start_stand_ins
+
+class TestBenchmarks(unittest.TestCase):
+    def test_compare_flags_regressions_by_direction(self):
+        baseline = {"download_mbps": metric(1000, "Mbps", "higher"), "probe_us": metric(50, "us", "lower"),
+                    "main_wall_seconds": metric(20, "s", "lower")}
+        current = {"download_mbps": metric(800, "Mbps", "higher"), "probe_us": metric(52, "us", "lower"),
+                   "main_wall_seconds": metric(30, "s", "lower"), "new_metric": metric(1, "s", "lower")}
+        regressions = compare(current, baseline, tolerance=0.1)
+        self.assertEqual([r[0] for r in regressions], ["download_mbps", "main_wall_seconds"])
+        self.assertAlmostEqual(regressions[0][3], -0.2)
+
+    def test_improvements_are_not_regressions(self):
+        baseline = {"download_mbps": metric(1000, "Mbps", "higher"), "probe_us": metric(50, "us", "lower")}
+        current = {"download_mbps": metric(2000, "Mbps", "higher"), "probe_us": metric(10, "us", "lower")}
+        self.assertEqual(compare(current, baseline), [])
+
+    def test_probe_overhead_against_stand_ins(self):
+        """Tests that the probe benchmarks run hermetically against loopback stand-ins."""
+        endpoints, stop = start_stand_ins(object_size=1024, iperf=False)
+        try:
+            metrics = bench_probes(endpoints, count=20)
+        finally:
+            stop()
+        self.assertIn("probe_tcp_connect_us", metrics)
+        self.assertIn("probe_udp_us", metrics)
+        for m in metrics.values():
+            self.assertGreater(m["value"], 0)
+            self.assertEqual(m["better"], "lower")
+
+    def test_logging_overhead(self):
+        """Tests that a filtered debug call is cheaper than an emitted one."""
+        metrics = bench_logging(calls=200)
+        self.assertLess(metrics["log_debug_call_us"]["value"], metrics["log_call_us"]["value"])
+
+    def test_main_runs_against_stand_ins(self):
+        """Tests that a full main.py run completes against the stand-ins, with or without iperf3."""
+        endpoints, stop = start_stand_ins(iperf=False)
+        try:
+            metrics, reason = bench_main(endpoints, budget="4s")
+        finally:
+            stop()
+        self.assertIsNone(reason)
+        self.assertGreater(metrics["main_wall_seconds"]["value"], 0)
+
+    def test_baseline_is_committed(self):
+        baseline = load_baseline()
+        self.assertIsNotNone(baseline)
+        self.assertIn("main_wall_seconds", baseline["metrics"])
+
+if __name__ == "__main__":
+    unittest.main()
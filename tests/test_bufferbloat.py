@@ -0,0 +1,52 @@
+import socket
+import time
+import unittest
+from core.bufferbloat import LoadLatencySampler, bufferbloat_grade
+
+class TestBufferbloat(unittest.TestCase):
+    def setUp(self):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(1024)
+        self.port = self.listener.getsockname()[1]
+
+    def tearDown(self):
+        self.listener.close()
+
+    def test_phase_labelled_sampling(self):
+        """Tests 100 Hz sampling with every sample labelled by the active phase."""
+        sampler = LoadLatencySampler("127.0.0.1", self.port, rate=100).start()
+        time.sleep(0.3)
+        with sampler.phase("download"):
+            time.sleep(0.3)
+        report = sampler.stop()
+
+        for phase in ("idle", "download"):
+            stats = report["phases"][phase]
+            self.assertGreaterEqual(stats["count"], 20, f"Expected ~30 {phase} samples at 100 Hz")
+            self.assertEqual(stats["lost"], 0)
+            self.assertLessEqual(stats["median"], stats["p90"])
+            self.assertLessEqual(stats["p90"], stats["p99"])
+        self.assertIsNotNone(report["delta"])
+        self.assertIsNotNone(report["grade"])
+
+    def test_unreachable_samples_are_lost_not_infinite(self):
+        """Tests that failed probes count as loss instead of poisoning the median."""
+        closed = socket.socket()
+        closed.bind(("127.0.0.1", 0))
+        port = closed.getsockname()[1]
+        closed.close()
+        sampler = LoadLatencySampler("127.0.0.1", port, rate=50).start()
+        time.sleep(0.2)
+        report = sampler.stop()
+        self.assertEqual(report["phases"]["idle"]["median"], None)
+        self.assertGreater(report["phases"]["idle"]["lost"], 0)
+
+    def test_grades(self):
+        self.assertEqual(bufferbloat_grade(1), "A+")
+        self.assertEqual(bufferbloat_grade(100), "C")
+        self.assertEqual(bufferbloat_grade(1000), "F")
+        self.assertIsNone(bufferbloat_grade(None))
+
+if __name__ == "__main__":
+    unittest.main()
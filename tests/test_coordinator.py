@@ -0,0 +1,135 @@
+import multiprocessing
+import os
+import socket
+import tempfile
+import time
+import unittest
+from core.agent import Agent, assigned_rankings, compact_results
+from core.coordinator import Coordinator, CoordinatorError, CoordinatorServer, server_key
+from full_test_stubs import DOWNLOAD_SPEED, UPLOAD_SPEED, stubbed_network
+from main import run_full_test
+from utils.result_store import ResultStore
+
+DOWNLOAD_SERVERS = ["http://dl-a.example/1GB.bin", "http://dl-b.example/1GB.bin"]
+UPLOAD_SERVERS = [{"host": "ul-a.example", "port": 5201}, {"host": "ul-b.example", "port": 5201}]
+
+def _fake_test(plan, state):
+    """Stands in for run_full_test(): loads the assigned servers for a moment."""
+    started = time.time()
+    time.sleep(0.1)
+    return {"download_tcp": 100.0, "upload_tcp": 20.0, "latency_tcp": float(plan["id"]),
+            "download_server": server_key(plan["download_server"], 80),
+            "upload_server": server_key(plan["upload_server"], 5201),
+            "started": started, "ended": time.time(), "transfers": {"download_tcp": [{"intervals": [1] * 1000}]}}
+
+def _run_agent(url, name, runs):
+    Agent(_fake_test, url, name=name, interval=0, retry=0.1).run(max_runs=runs)
+
+class TestCoordinator(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = os.path.join(self.tmp.name, "coordinator.db")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_servers_are_never_shared_within_a_slot(self):
+        """Tests slot assignment: free servers first, preferences honoured, one agent per server and slot."""
+        coordinator = Coordinator(DOWNLOAD_SERVERS, UPLOAD_SERVERS[:1], slot=10, lead=0, db=self.db)
+        for name in ("a", "b", "c"):
+            coordinator.register(name, interval=0)
+        plans = [coordinator.plan("a", {"download": [DOWNLOAD_SERVERS[1]]}), coordinator.plan("b"),
+                 coordinator.plan("c")]
+        # One upload server: every agent gets its own slot
+        self.assertEqual(sorted(plan["slot"] for plan in plans), [plans[0]["slot"] + i for i in range(3)])
+        self.assertEqual(plans[0]["download_server"], DOWNLOAD_SERVERS[1])
+        self.assertEqual(plans[1]["download_server"], DOWNLOAD_SERVERS[0])  # The least used one
+        self.assertIs(coordinator.plan("a"), plans[0])  # Asking again returns the open plan
+        with self.assertRaises(CoordinatorError) as error:
+            coordinator.plan("stranger")
+        self.assertEqual(error.exception.status, 404)
+
+        coordinator.report("a", plans[0]["id"], {"download_tcp": 50.0})
+        with self.assertRaises(CoordinatorError) as error:
+            coordinator.report("a", plans[0]["id"], {"download_tcp": 50.0})
+        self.assertEqual(error.exception.status, 409)
+        with self.assertRaises(CoordinatorError):
+            coordinator.report("a", plans[1]["id"], {})  # Not a's plan
+        summary = coordinator.summary()
+        self.assertEqual(summary["metrics"]["download_tcp"]["median"], 50.0)
+        self.assertEqual(summary["servers"], {"dl-b.example:80": 1, "ul-a.example:5201": 1})
+
+    def test_compact_results(self):
+        """Tests that the per-run detail is left out of what agents send."""
+        compact = compact_results({"download_tcp": 1.0, "transfers": {}, "profile": {},
+                                   "bufferbloat": {"grade": "A", "delta": 4.0, "phases": {"idle": {}}}})
+        self.assertEqual(compact, {"download_tcp": 1.0, "bufferbloat": {"idle_median": None, "loaded_median": None,
+                                                                        "delta": 4.0, "grade": "A"}})
+
+    def test_agent_processes_over_loopback(self):
+        """Tests several agent processes: every plan runs in its slot and no server is loaded twice at once."""
+        agents, runs = 4, 2
+        server = CoordinatorServer(Coordinator(DOWNLOAD_SERVERS, UPLOAD_SERVERS, slot=0.4, lead=0.1, db=self.db),
+                                   port=0).start()
+        try:
+            context = multiprocessing.get_context("fork")
+            processes = [context.Process(target=_run_agent, args=(server.url, f"site-{i}", runs))
+                         for i in range(agents)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join(30)
+                self.assertEqual(process.exitcode, 0)
+            summary = server.coordinator.summary()
+            plans = server.coordinator.plans
+        finally:
+            server.stop()
+
+        self.assertEqual({name: agent["runs"] for name, agent in summary["agents"].items()},
+                         {f"site-{i}": runs for i in range(agents)})
+        with ResultStore(self.db) as store:
+            stored = store.query(full=True)
+        self.assertEqual(len(stored), agents * runs)
+        self.assertEqual({run["probe"] for run in stored}, {f"site-{i}" for i in range(agents)})
+        results = [run["results"] for run in stored]
+        for result in results:
+            self.assertNotIn("transfers", result)
+            plan = plans[result["plan"]]
+            self.assertGreaterEqual(result["started"], plan["start"] - 0.05)
+            self.assertLessEqual(result["ended"], plan["end"] + 0.05)
+        for i, first in enumerate(results):
+            for second in results[i + 1:]:
+                if first["started"] < second["ended"] and second["started"] < first["ended"]:
+                    self.assertNotEqual(first["download_server"], second["download_server"])
+                    self.assertNotEqual(first["upload_server"], second["upload_server"])
+
+    def test_agent_runs_the_real_sequence_on_assigned_servers(self):
+        """Tests run_full_test(rankings=assigned_rankings(plan)) under an agent, with only the transfers stubbed."""
+        listener = socket.create_server(("127.0.0.1", 0))  # Accepts the ranking connects in its backlog
+        port = listener.getsockname()[1]
+        download_servers = [f"http://127.0.0.1:{port}/1GB.bin"]
+        upload_servers = [{"host": "127.0.0.1", "port": port}]
+        server = CoordinatorServer(Coordinator(download_servers, upload_servers, slot=0.5, lead=0, db=self.db),
+                                   port=0).start()
+        try:
+            with stubbed_network() as calls:
+                agent = Agent(lambda plan, state: run_full_test(budget=2, state=state, profile_overhead=False,
+                                                                rankings=assigned_rankings(plan)),
+                              server.url, name="site-a", interval=0, retry=0.1)
+                agent.run(max_runs=1)
+        finally:
+            server.stop()
+            listener.close()
+
+        self.assertEqual(agent.runs, 1)
+        self.assertEqual(calls.rankings, {"download": 0, "upload": 0}, "The plan replaces server selection")
+        with ResultStore(self.db) as store:
+            (stored,) = store.query(full=True)
+        results = stored["results"]
+        self.assertEqual(stored["probe"], "site-a")
+        self.assertEqual((results["download_tcp"], results["download_udp"]), (DOWNLOAD_SPEED, DOWNLOAD_SPEED))
+        self.assertEqual((results["upload_tcp"], results["upload_udp"]), (UPLOAD_SPEED, UPLOAD_SPEED))
+        self.assertEqual((results["download_server"], results["upload_server"]), ("127.0.0.1", "127.0.0.1"))
+
+if __name__ == "__main__":
+    unittest.main()
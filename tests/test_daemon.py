@@ -0,0 +1,90 @@
+import random
+import threading
+import time
+import unittest
+from core.daemon import Daemon, WarmState, jittered, FULL, LIGHT
+from full_test_stubs import DOWNLOAD_SPEED, UPLOAD_SPEED, stubbed_network
+from main import run_full_test
+
+class TestDaemon(unittest.TestCase):
+    def make_daemon(self, full_test=None, light_interval=0.05, full_interval=0.3):
+        self.calls = []
+        self.saved = []
+
+        def light(state):
+            self.calls.append((LIGHT, state))
+            return {"latency_tcp": 1.0}
+
+        def full(state):
+            self.calls.append((FULL, state))
+            return {"download_tcp": 100.0}
+
+        return Daemon(full_test or full, light_interval=light_interval, full_interval=full_interval,
+                      jitter=0.1, light_test=light, save=self.saved.append)
+
+    def test_schedule(self):
+        """Tests a full run first, frequent light checks, rare full runs and one shared warm state."""
+        daemon = self.make_daemon()
+        daemon.run(max_runs=10)
+        kinds = [kind for kind, _ in self.calls]
+        self.assertEqual(kinds[0], FULL)
+        self.assertGreater(kinds.count(LIGHT), kinds.count(FULL))
+        self.assertEqual(len({id(state) for _, state in self.calls}), 1)
+        self.assertEqual([r["kind"] for r in self.saved], kinds)
+
+    def test_failures_do_not_stop_the_schedule(self):
+        def broken(state):
+            raise OSError("network down")
+        daemon = self.make_daemon(full_test=broken)
+        daemon.run(max_runs=3)
+        self.assertEqual(daemon.runs[FULL], 0)
+        self.assertEqual(daemon.runs[LIGHT], 2)
+
+    def test_stop_interrupts_wait(self):
+        daemon = self.make_daemon(light_interval=60, full_interval=60)
+        thread = threading.Thread(target=daemon.run)
+        thread.start()
+        time.sleep(0.1)
+        daemon.stop()
+        thread.join(2)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(daemon.runs[FULL], 1)
+
+    def test_jitter_bounds(self):
+        rng = random.Random(1)
+        values = [jittered(100, 0.1, rng) for _ in range(1000)]
+        self.assertTrue(all(90 <= v <= 110 for v in values))
+        self.assertGreater(max(values) - min(values), 10)
+
+    def test_ranking_reused_until_stale(self):
+        state = WarmState(ranking_ttl=0.2)
+        rankings = []
+
+        def rank():
+            rankings.append(1)
+            return [{"host": "a", "success_rate": 1.0}]
+        state.ranking("download", rank)
+        state.ranking("download", rank)
+        self.assertEqual(len(rankings), 1)
+        time.sleep(0.25)
+        state.ranking("download", rank)
+        self.assertEqual(len(rankings), 2)
+        state.close()
+
+    def test_scheduled_full_tests_run_the_real_sequence(self):
+        """Tests run_full_test() under the daemon, with only the network calls stubbed out."""
+        saved = []
+        with stubbed_network() as calls:
+            daemon = Daemon(lambda state: run_full_test(budget=2, state=state), light_interval=3600,
+                            full_interval=0.01, jitter=0, light_test=lambda state: {}, save=saved.append)
+            daemon.run(max_runs=2)
+        self.assertEqual(daemon.runs[FULL], 2)
+        self.assertEqual([results["kind"] for results in saved], [FULL, FULL])
+        for results in saved:
+            self.assertEqual((results["download_tcp"], results["download_udp"]), (DOWNLOAD_SPEED, DOWNLOAD_SPEED))
+            self.assertEqual((results["upload_tcp"], results["upload_udp"]), (UPLOAD_SPEED, UPLOAD_SPEED))
+            self.assertEqual({t["protocol"] for t in results["transfers"]["upload_udp"]}, {"udp"})
+        self.assertEqual(calls.rankings, {"download": 1, "upload": 1}, "The warm state reuses the rankings")
+
+if __name__ == "__main__":
+    unittest.main()
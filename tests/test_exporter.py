@@ -0,0 +1,96 @@
+import os
+import tempfile
+import unittest
+import urllib.error
+import urllib.request
+from core.exporter import MetricsExporter, CONTENT_TYPE, start_exporter
+from core.metrics import Sketch
+from utils.result_store import ResultStore
+
+def _results(**figures):
+    results = {key: None for key in ("download_tcp", "download_udp", "upload_tcp", "upload_udp",
+                                     "latency_tcp", "latency_udp", "latency_icmp",
+                                     "jitter_tcp", "jitter_udp", "jitter_icmp",
+                                     "packet_loss_tcp", "packet_loss_udp", "packet_loss_icmp")}
+    results.update(figures)
+    return results
+
+class TestMetricsExporter(unittest.TestCase):
+    def setUp(self):
+        self.exporter = MetricsExporter(port=0).start()
+        self.state = self.exporter.state
+
+    def tearDown(self):
+        self.exporter.stop()
+
+    def _scrape(self, path="/metrics"):
+        with urllib.request.urlopen(f"http://127.0.0.1:{self.exporter.port}{path}", timeout=5) as response:
+            self.assertEqual(response.headers["Content-Type"], CONTENT_TYPE)
+            return response.read().decode("utf-8")
+
+    def test_empty_state(self):
+        """Tests that a scrape before any result is a valid, empty exposition."""
+        self.assertEqual(self._scrape(), "# EOF\n")
+        with self.assertRaises(urllib.error.HTTPError) as error:
+            self._scrape("/")
+        self.assertEqual(error.exception.code, 404)
+
+    def test_phases_update_incrementally(self):
+        """Tests that each phase's figures show up in base units as soon as they are published."""
+        latency = Sketch().add_many([4.0, 12.0, 30.0, None])
+        self.state.update({"latency_tcp": 12.0, "jitter_tcp": 1.5, "packet_loss_tcp": 25.0, "latency_udp": None,
+                           "sketches": {"latency": {"tcp": latency.to_dict()}}})
+        text = self._scrape()
+        self.assertIn('speedtest_latency_seconds{protocol="tcp"} 0.012\n', text)
+        self.assertIn('speedtest_packet_loss_ratio{protocol="tcp"} 0.25\n', text)
+        self.assertNotIn('protocol="udp"', text)
+        self.assertNotIn("speedtest_download_bits_per_second", text)
+        self.assertIn('speedtest_probe_rtt_seconds_bucket{protocol="tcp",le="0.005"} 1\n', text)
+        self.assertIn('speedtest_probe_rtt_seconds_bucket{protocol="tcp",le="0.02"} 2\n', text)
+        self.assertIn('speedtest_probe_rtt_seconds_bucket{protocol="tcp",le="+Inf"} 3\n', text)
+        self.assertIn('speedtest_probe_rtt_seconds_count{protocol="tcp"} 3\n', text)
+        self.assertTrue(text.endswith("# EOF\n"))
+
+        self.state.update({"download_tcp": 93.5})
+        self.state.update({"latency_under_load": 80.0,
+                           "bufferbloat": {"delta": 68.0, "grade": "C"},
+                           "sketches": {"latency": {"tcp": latency.to_dict()},
+                                        "load_latency": {"download_tcp": Sketch().add_many([80.0]).to_dict()}}})
+        self.state.run_finished("full")
+        text = self._scrape()
+        self.assertIn('speedtest_download_bits_per_second{protocol="tcp"} 93500000.0\n', text)
+        self.assertIn("speedtest_bufferbloat_delta_seconds 0.068\n", text)
+        self.assertIn('speedtest_bufferbloat_grade{speedtest_bufferbloat_grade="C"} 1\n', text)
+        self.assertIn('speedtest_bufferbloat_grade{speedtest_bufferbloat_grade="A"} 0\n', text)
+        # Histograms accumulate across updates, like counters
+        self.assertIn('speedtest_probe_rtt_seconds_count{protocol="tcp"} 6\n', text)
+        self.assertIn('speedtest_load_rtt_seconds_count{phase="download_tcp"} 1\n', text)
+        self.assertIn("# TYPE speedtest_runs counter\n", text)
+        self.assertIn('speedtest_runs_total{kind="full"} 1\n', text)
+
+    def test_scrape_does_not_render(self):
+        """Tests that scrapes serve the text rendered at the last update."""
+        self.state.update({"latency_icmp": 9.0})
+        body = self.state.body
+        self._scrape()
+        self._scrape()
+        self.assertIs(self.state.body, body)
+
+    def test_seeded_from_the_result_store(self):
+        """Tests that a new exporter starts with the figures of the newest stored run."""
+        with tempfile.TemporaryDirectory() as tmp:
+            db = os.path.join(tmp, "speedtest.db")
+            with ResultStore(db) as store:
+                store.insert(_results(upload_tcp=10.0), ts=1000.0)
+                store.insert(_results(upload_tcp=20.0), ts=2000.0)
+            exporter = start_exporter(port=0, host="127.0.0.1", db=db)
+            try:
+                text = exporter.state.body.decode("utf-8")
+            finally:
+                exporter.stop()
+        self.assertIn('speedtest_upload_bits_per_second{protocol="tcp"} 20000000.0\n', text)
+        self.assertIn('speedtest_last_run_timestamp_seconds{kind="full"} 2000.0\n', text)
+        self.assertNotIn("speedtest_runs_total", text)
+
+if __name__ == "__main__":
+    unittest.main()
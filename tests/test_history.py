@@ -0,0 +1,88 @@
+import os
+import tempfile
+import time
+import unittest
+import numpy as np
+from core.history import (rolling_median, percentiles, hourly_baseline, change_points, regressions,
+                          summarize, load_history_arrays)
+from utils.json_handler import merge_results
+from utils.result_store import ResultStore
+
+class TestHistory(unittest.TestCase):
+    def test_rolling_median_ignores_missing(self):
+        values = np.array([1, 2, np.nan, 4, 100, 6], dtype=float)
+        out = rolling_median(values, window=3)
+        self.assertTrue(np.isnan(out[:2]).all())
+        np.testing.assert_allclose(out[2:], [1.5, 3, 52, 6])
+
+    def test_percentiles(self):
+        np.testing.assert_allclose(percentiles(np.arange(101, dtype=float), (5, 50, 95)), [5, 50, 95])
+        self.assertTrue(np.isnan(percentiles([np.nan, np.nan])).all())
+
+    def test_hourly_baseline(self):
+        """Tests per-hour medians on UTC hours with an evening slowdown."""
+        ts = np.arange(0, 10 * 86400, 300, dtype=float)
+        hours = (ts // 3600) % 24
+        values = np.where(hours >= 19, 400.0, 900.0)
+        values[::7] = np.nan
+        medians, counts = hourly_baseline(ts, values, utc_offset=0)
+        self.assertEqual(int(counts.sum()), int(np.count_nonzero(~np.isnan(values))))
+        np.testing.assert_allclose(medians[:19], 900)
+        np.testing.assert_allclose(medians[19:], 400)
+
+    def test_change_point_and_regression(self):
+        rng = np.random.default_rng(1)
+        values = np.concatenate([rng.normal(900, 20, 200), rng.normal(600, 20, 150)])
+        values[50] = np.nan
+        points = change_points(values)
+        self.assertEqual(len(points), 1)
+        self.assertAlmostEqual(points[0], 200, delta=3)
+        ts = np.arange(len(values), dtype=float)
+        (found,) = regressions(ts, values, "download_tcp", points)
+        self.assertAlmostEqual(found["change"], -1 / 3, delta=0.05)
+        # Latency falling by the same amount is an improvement, not a regression
+        self.assertEqual(regressions(ts, values, "latency_tcp", points), [])
+
+    def test_steady_series_has_no_change_points(self):
+        values = np.random.default_rng(2).normal(50, 2, 500)
+        self.assertEqual(change_points(values), [])
+
+    def test_summarize_from_store(self):
+        with tempfile.TemporaryDirectory() as tmp, ResultStore(os.path.join(tmp, "r.db")) as store:
+            now = time.time()
+            store.insert_many([(now - 300 * i, {"download_tcp": 500.0 + i % 5, "latency_icmp": None})
+                               for i in range(2000)])
+            start = time.perf_counter()
+            ts, columns = load_history_arrays(store, ["download_tcp", "latency_icmp"])
+            summary = summarize(ts, columns)
+            self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertEqual(summary["runs"], 2000)
+        self.assertNotIn("latency_icmp", summary["metrics"])
+        stats = summary["metrics"]["download_tcp"]
+        self.assertEqual(stats["median"], 502)
+        self.assertEqual(stats["regressions"], [])
+        self.assertEqual(len(stats["hourly_median"]), 24)
+
+class TestMergeResults(unittest.TestCase):
+    def test_runs_are_weighted_equally(self):
+        merged = merge_results(merge_results({"download_tcp": 90}, {"download_tcp": 60}), {"download_tcp": 30})
+        self.assertAlmostEqual(merged["download_tcp"], 60)
+        self.assertEqual(merged["runs"], 3)
+
+    def test_none_values_are_skipped(self):
+        merged = merge_results({"latency_icmp": None, "jitter_udp": 2.0, "transfers": {"a": 1}},
+                               {"latency_icmp": 10.0, "jitter_udp": None, "transfers": {"b": 2}})
+        self.assertEqual(merged["latency_icmp"], 10.0)
+        self.assertEqual(merged["jitter_udp"], 2.0)
+        self.assertEqual(merged["transfers"], {"b": 2})
+
+    def test_missing_values_do_not_weigh(self):
+        """Tests that runs which did not measure a figure do not count towards its average."""
+        merged = merge_results(merge_results({"download_tcp": None, "runs": 9}, {"download_tcp": 100.0}),
+                               {"download_tcp": 0.0})
+        self.assertAlmostEqual(merged["download_tcp"], 50.0)
+        self.assertEqual(merged["counts"]["download_tcp"], 2)
+        self.assertEqual(merged["runs"], 11)
+
+if __name__ == "__main__":
+    unittest.main()
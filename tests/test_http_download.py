@@ -0,0 +1,67 @@
+import unittest
+from core.http_download import http_download, probe_object_size, ConnectionPool
+from benchmarks.local_servers import start_http_range_server
+
+OBJECT_SIZE = 48 * 1024 * 1024 + 123  # Deliberately not a multiple of the range size
+
+class TestHTTPDownload(unittest.TestCase):
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_parallel_range_download(self):
+        """Tests that N keep-alive connections fetch exactly the object via byte ranges."""
+        self.server, url = start_http_range_server(OBJECT_SIZE)
+        self.assertEqual(probe_object_size(url), (OBJECT_SIZE, True))
+
+        result = http_download(url, connections=4, range_size=4 * 1024 * 1024, early_stop=False)
+        self.assertEqual(result["bytes"], OBJECT_SIZE)
+        self.assertEqual(len(result["connections"]), 4)
+        self.assertEqual(sum(c["bytes"] for c in result["connections"]), OBJECT_SIZE)
+        self.assertGreater(result["mbps"], 0)
+        for conn in result["connections"]:
+            self.assertNotIn("error", conn)
+            self.assertGreater(conn["requests"], 1, "Connections should be reused for several ranges")
+            self.assertGreater(conn["connect_ms"], 0)
+            self.assertGreater(conn["first_byte_ms"], 0)
+        self.assertIsNotNone(result["dns_ms"])
+
+    def test_max_bytes(self):
+        """Tests that a partial download stops at max_bytes."""
+        self.server, url = start_http_range_server(OBJECT_SIZE)
+        result = http_download(url, connections=2, max_bytes=5_000_000, range_size=1_000_000,
+                               early_stop=False)
+        self.assertEqual(result["bytes"], 5_000_000)
+
+    def test_duration_cuts_off_a_range(self):
+        """Tests that a range still in flight at the deadline is cut off, not drained to its end."""
+        self.server, url = start_http_range_server(OBJECT_SIZE, rate=8 * 1024 * 1024)  # 6s per object
+        result = http_download(url, connections=1, range_size=OBJECT_SIZE, duration=0.5, early_stop=False)
+        self.assertLess(result["elapsed"], 2)
+        self.assertLess(result["bytes"], OBJECT_SIZE / 2)
+
+    def test_server_without_ranges(self):
+        """Tests the single-connection fallback when the server ignores Range."""
+        self.server, url = start_http_range_server(3_000_000, ranges=False)
+        result = http_download(url, connections=4, max_bytes=1_000_000)
+        self.assertEqual(len(result["connections"]), 1)
+        self.assertEqual(result["bytes"], 1_000_000)
+
+    def test_connection_pool_reuse(self):
+        """Tests that a pool carries warm connections and the object size into the next download."""
+        self.server, url = start_http_range_server(OBJECT_SIZE)
+        pool = ConnectionPool()
+        first = http_download(url, connections=2, max_bytes=4_000_000, range_size=1_000_000,
+                              early_stop=False, pool=pool)
+        self.assertEqual(len(pool.idle), 2)
+        second = http_download(url, connections=2, max_bytes=4_000_000, range_size=1_000_000,
+                               early_stop=False, pool=pool)
+        self.assertEqual(pool.reused, 2)
+        self.assertTrue(all(c["connect_ms"] is None for c in second["connections"]))
+        self.assertEqual(first["bytes"], second["bytes"])
+        self.assertIn(url, pool.sizes)
+        pool.close()
+        self.assertEqual(pool.idle, [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,3 +1,4 @@
+import time
 import unittest
 from core.latency import latency_test, measure_latency_under_load
 from config.settings import LATENCY_TEST_HOSTS
@@ -36,5 +37,14 @@ class TestLatency(unittest.TestCase):
         _, latencies = measure_latency_under_load(invalid_host, protocol="tcp", duration=3)
         self.assertTrue(all(l is None for l in latencies), "Latency should be None for an invalid host")
 
+    def test_latency_deadline(self):
+        """Tests that concurrent probing returns every stream within the total deadline."""
+        start = time.perf_counter()
+        results = latency_test(hosts=["127.0.0.1", "192.0.2.1"], timeout=2, deadline=1)
+        self.assertLess(time.perf_counter() - start, 1.5, "Latency test should respect its deadline")
+        for host in ["127.0.0.1", "192.0.2.1"]:
+            for protocol in ["tcp", "udp", "icmp"]:
+                self.assertIn(f"{host}_{protocol}", results)
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
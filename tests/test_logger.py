@@ -0,0 +1,68 @@
+import os
+import tempfile
+import threading
+import unittest
+from utils.logger import setup_logger, stop_logger
+
+class TestLogger(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.log_file = os.path.join(self.tmp.name, "logs", "test.log")
+        self.console = open(os.devnull, "w")
+
+    def tearDown(self):
+        self.console.close()
+        self.tmp.cleanup()
+
+    def _logger(self, name, **kwargs):
+        logger = setup_logger(name, log_file=self.log_file, **kwargs)
+        logger.listener.handlers[1].setStream(self.console)  # Keep the console quiet
+        return logger
+
+    def _lines(self):
+        with open(self.log_file, encoding="utf-8") as f:
+            return f.read().splitlines()
+
+    def test_protocol_tag_and_level(self):
+        """Tests that records keep their protocol tag and that debug is filtered at INFO level."""
+        logger = self._logger("test_protocol_tag_and_level")
+        logger.info("probe sent", protocol="ICMP")
+        logger.debug("per-probe detail")
+        logger.warning("no tag given")
+        stop_logger(logger)
+        lines = self._lines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn("- INFO - [ICMP] - probe sent", lines[0])
+        self.assertIn("- WARNING - [TCP] - no tag given", lines[1])
+
+        verbose = self._logger("test_protocol_tag_and_level_debug", debug_mode=True)
+        verbose.debug("per-probe detail", protocol="UDP")
+        stop_logger(verbose)
+        self.assertIn("- DEBUG - [UDP] - per-probe detail", self._lines()[-1])
+
+    def test_logging_thread_is_off_the_caller(self):
+        """Tests that a stalled writer neither blocks callers nor loses records that fit the queue."""
+        logger = self._logger("test_logging_thread_is_off_the_caller", queue_size=5)
+        file_handler = logger.listener.handlers[0]
+        file_handler.acquire()  # The listener thread now blocks on its first record
+        try:
+            logged = threading.Event()
+
+            def burst():
+                for i in range(20):
+                    logger.info(f"record {i}")
+                logged.set()
+
+            threading.Thread(target=burst).start()
+            self.assertTrue(logged.wait(5), "Logging must not wait for the writer")
+        finally:
+            file_handler.release()
+        dropped = logger.queue_handler.dropped
+        stop_logger(logger)
+        lines = self._lines()
+        self.assertGreater(dropped, 0)
+        self.assertEqual(len(lines), 20 - dropped + 1)
+        self.assertIn(f"{dropped} log records were dropped", lines[-1])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import json
+import random
+import statistics
+import unittest
+from core.metrics import Sketch, merge_sketches, merge_sketch_trees
+
+def exact_quantile(values, q):
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(7)
+        self.values = [rng.lognormvariate(3, 1) for _ in range(20000)]
+
+    def test_quantiles_within_relative_accuracy(self):
+        """Tests p50/p90/p99 against exact quantiles of a heavy-tailed sample."""
+        sketch = Sketch().add_many(self.values)
+        for q in (0.5, 0.9, 0.99):
+            exact = exact_quantile(self.values, q)
+            self.assertAlmostEqual(sketch.quantile(q), exact, delta=exact * 0.011)
+        self.assertEqual(sketch.quantile(0), min(self.values))
+        self.assertEqual(sketch.quantile(1), max(self.values))
+
+    def test_moments_match_statistics(self):
+        sketch = Sketch().add_many(self.values)
+        self.assertAlmostEqual(sketch.mean, statistics.mean(self.values), places=6)
+        self.assertAlmostEqual(sketch.stdev, statistics.stdev(self.values), places=6)
+
+    def test_merge_equals_single_stream(self):
+        """Tests that sketches merged across streams equal one sketch over all values."""
+        whole = Sketch().add_many(self.values)
+        parts = [Sketch().add_many(self.values[i::4]) for i in range(4)]
+        merged = merge_sketches(parts)
+        self.assertEqual(merged.count, whole.count)
+        self.assertAlmostEqual(merged.mean, whole.mean, places=6)
+        self.assertAlmostEqual(merged.stdev, whole.stdev, places=6)
+        for q in (0.5, 0.9, 0.99):
+            self.assertEqual(merged.quantile(q), whole.quantile(q))
+
+    def test_serialization_round_trip(self):
+        sketch = Sketch().add_many(self.values[:500] + [None, None, 0.0])
+        data = json.loads(json.dumps(sketch.to_dict()))
+        restored = Sketch.from_dict(data)
+        self.assertEqual(restored.summary(), sketch.summary())
+        self.assertLess(len(data["histogram"]["buckets"]), len(sketch.histogram.counts))
+
+    def test_missing_values_and_empty_sketch(self):
+        """Tests that None samples count as loss and an empty sketch reports None."""
+        sketch = Sketch().add_many([None, 10.0, None, 20.0])
+        self.assertEqual(sketch.count, 2)
+        self.assertEqual(sketch.missing, 2)
+        self.assertEqual(sketch.loss, 50)
+        empty = Sketch().summary()
+        self.assertEqual(empty["count"], 0)
+        self.assertIsNone(empty["p50"])
+        self.assertIsNone(empty["mean"])
+        self.assertIsNone(empty["stdev"])
+
+    def test_merge_sketch_trees(self):
+        a = {"latency": {"tcp": Sketch().add_many([1, 2]).to_dict()}}
+        b = {"latency": {"tcp": Sketch().add_many([3]).to_dict(), "udp": Sketch().add_many([4]).to_dict()}}
+        merged = merge_sketch_trees(a, b)
+        self.assertEqual(Sketch.from_dict(merged["latency"]["tcp"]).count, 3)
+        self.assertEqual(Sketch.from_dict(merged["latency"]["udp"]).count, 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+import zlib
+from core.payload import Payload, payload_block
+
+class TestPayload(unittest.TestCase):
+    def test_exact_size(self):
+        """Tests that a payload yields exactly its size, across block boundaries."""
+        size = len(payload_block("random")) * 2 + 12345
+        payload = Payload(size, kind="random", chunk_size=1_000_000)
+        self.assertEqual(sum(len(chunk) for chunk in payload), size)
+        self.assertEqual(len(payload), size)
+
+    def test_block_is_cached(self):
+        """Tests that the source block is generated once and shared."""
+        self.assertIs(payload_block("text"), payload_block("text"))
+        chunk = next(iter(Payload(1024, kind="text")))
+        self.assertIsInstance(chunk, memoryview)
+
+    def test_compressibility(self):
+        """Tests that the payload kinds span incompressible to highly compressible."""
+        ratios = {}
+        for kind in ("random", "text", "zeros"):
+            sample = bytes(next(iter(Payload(1 << 20, kind=kind, chunk_size=1 << 20))))
+            ratios[kind] = len(zlib.compress(sample)) / len(sample)
+        self.assertGreater(ratios["random"], 0.99)
+        self.assertLess(ratios["text"], ratios["random"])
+        self.assertLess(ratios["zeros"], 0.01)
+
+    def test_unknown_kind(self):
+        with self.assertRaises(ValueError):
+            Payload(10, kind="jpeg")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+from core.process_engine import process_http_download, process_tcp_upload, process_http_upload, cpu_report
+from benchmarks.local_servers import start_http_range_server, start_tcp_sink, start_http_upload_sink
+
+OBJECT_SIZE = 40 * 1024 * 1024 + 321
+
+class TestProcessEngine(unittest.TestCase):
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_download_across_workers(self):
+        """Tests that worker processes share the range queue and fetch exactly the object."""
+        self.server, url = start_http_range_server(OBJECT_SIZE)
+        result = process_http_download(url, connections=4, workers=2, range_size=2 * 1024 * 1024,
+                                       early_stop=False)
+        self.assertEqual(result["bytes"], OBJECT_SIZE)
+        self.assertEqual(sum(c["bytes"] for c in result["connections"]), OBJECT_SIZE)
+        self.assertEqual(len(result["connections"]), 4)
+        self.assertEqual([w["streams"] for w in result["workers"]], [2, 2])
+        self.assertGreater(result["mbps"], 0)
+        self.assertIn(result["cpu"]["bottleneck"], ("client CPU", "network"))
+        self.assertEqual(len(result["cpu"]["worker_utilization"]), 2)
+
+    def test_duration_cuts_off_a_range(self):
+        """Tests that worker connections stop mid-range at the deadline."""
+        self.server, url = start_http_range_server(OBJECT_SIZE, rate=8 * 1024 * 1024)  # 5s per object
+        result = process_http_download(url, connections=2, workers=2, range_size=OBJECT_SIZE, duration=0.5,
+                                       early_stop=False)
+        self.assertLess(result["elapsed"], 2)
+        self.assertLess(result["bytes"], OBJECT_SIZE / 2)
+
+    def test_tcp_upload_across_workers(self):
+        self.server, port = start_tcp_sink()
+        result = process_tcp_upload("127.0.0.1", port, total_bytes=30_000_001, streams=3, workers=2,
+                                    early_stop=False)
+        self.assertEqual(result["bytes"], 30_000_001)
+        self.assertEqual(len(result["streams"]), 3)
+        self.assertTrue(all("error" not in s for s in result["streams"]))
+        self.assertGreater(result["cpu"]["cpu_seconds"], 0)
+
+    def test_http_upload_across_workers(self):
+        self.server, url = start_http_upload_sink()
+        result = process_http_upload(url, 8_000_000, streams=2, workers=2, early_stop=False)
+        self.assertEqual(result["bytes"], 8_000_000)
+        self.assertTrue(all(s.get("status") == 200 for s in result["streams"]))
+
+    def test_duration_bounded_upload(self):
+        self.server, port = start_tcp_sink()
+        result = process_tcp_upload("127.0.0.1", port, duration=0.5, streams=2, workers=2, early_stop=False)
+        self.assertGreater(result["bytes"], 0)
+        self.assertLess(result["elapsed"], 3)
+
+class TestCpuReport(unittest.TestCase):
+    def test_saturated_worker_is_client_bound(self):
+        report = cpu_report([0.97, 0.4], parent_cpu=0.05, elapsed=1.0, nbytes=2_000_000_000, cores=4)
+        self.assertTrue(report["client_cpu_bound"])
+        self.assertEqual(report["bottleneck"], "client CPU")
+        self.assertAlmostEqual(report["cpu_seconds_per_gb"], 0.71, places=2)
+
+    def test_idle_workers_are_network_bound(self):
+        report = cpu_report([0.2, 0.3], parent_cpu=0.05, elapsed=1.0, nbytes=10**9, cores=4)
+        self.assertFalse(report["client_cpu_bound"])
+        self.assertEqual(report["bottleneck"], "network")
+
+    def test_oversubscribed_cores_are_client_bound(self):
+        """Tests that workers sharing too few cores count as CPU-bound even below one core each."""
+        report = cpu_report([0.5, 0.5], parent_cpu=0.0, elapsed=1.0, nbytes=10**9, cores=1)
+        self.assertTrue(report["client_cpu_bound"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import threading
+import time
+import unittest
+from core.metrics import Sketch
+from core.profiler import OverheadProfiler, record_send_delay, suspect_results
+
+def _spin(cpu_seconds):
+    # Counts this thread's CPU time, not wall time, so other processes cannot shorten the spin
+    end = time.thread_time() + cpu_seconds
+    while time.thread_time() < end:
+        pass
+
+class TestOverheadProfiler(unittest.TestCase):
+    def setUp(self):
+        self.profiler = OverheadProfiler().start()
+
+    def tearDown(self):
+        self.profiler.stop()
+
+    def test_idle_phase_is_reported(self):
+        """Tests the figures of a phase spent sleeping; whether it is flagged depends on machine load."""
+        with self.profiler.phase("idle_wait"):
+            time.sleep(0.3)
+        phase = self.profiler.stop()["phases"]["idle_wait"]
+        self.assertGreaterEqual(phase["wall_s"], 0.3)
+        self.assertLess(phase["process_cpu_s"], phase["wall_s"])
+        self.assertGreater(phase["gil"]["wakeup_lateness_ms"]["count"], 0)
+        self.assertIsNone(phase["send_delay_ms"])
+
+    def test_thresholds_decide_suspect(self):
+        """Tests the saturation verdict on fixed snapshots, so machine load cannot change it."""
+        def snapshot(wall, cpu, thread_cpu):
+            return {"wall": wall, "cpu": cpu, "threads": {1: ("probe", thread_cpu)}, "syscalls": (0, 0),
+                    "voluntary": 0, "involuntary": 0}
+
+        profiler = OverheadProfiler(cpu_saturation=0.9, max_gil_wait=5.0)
+        profiler.cores = 2
+        quiet = Sketch().add_many([0.1] * 50)
+        idle = profiler._phase_report(snapshot(0, 0, 0), snapshot(1, 0.05, 0.05), Sketch(), quiet, 0.0)
+        self.assertFalse(idle["suspect"], idle["reasons"])
+        self.assertAlmostEqual(idle["process_utilization"], 0.025)
+
+        contended = Sketch().add_many([8.0] * 50)
+        busy = profiler._phase_report(snapshot(0, 0, 0), snapshot(1, 0.95, 0.95), Sketch(), contended, 50.0)
+        self.assertTrue(busy["suspect"])
+        self.assertEqual(len(busy["reasons"]), 3)  # Python threads, the busy thread and GIL waits
+        self.assertAlmostEqual(busy["gil"]["wait_ms"], 7.0)
+
+    def test_busy_thread_marks_phase_suspect(self):
+        """Tests that a busy thread is named and marks the phase suspect.
+
+        The threshold is low because a competing process can stretch the wall time, and
+        with it lower the thread's share of a core, arbitrarily.
+        """
+        self.profiler.stop()
+        self.profiler = OverheadProfiler(cpu_saturation=0.02).start()
+        spun, release = threading.Event(), threading.Event()
+
+        def busy():
+            _spin(0.3)
+            spun.set()
+            release.wait()  # Still alive when the phase ends, so its CPU time is read exactly
+
+        worker = threading.Thread(target=busy, name="busy-worker")
+        with self.profiler.phase("download_tcp"):
+            worker.start()
+            spun.wait()
+        release.set()
+        worker.join()
+        phase = self.profiler.stop()["phases"]["download_tcp"]
+        self.assertTrue(phase["suspect"])
+        self.assertEqual(phase["threads"][0]["name"], "busy-worker")
+        self.assertGreaterEqual(phase["threads"][0]["cpu_s"], 0.3)
+        self.assertTrue(any("busy-worker" in reason for reason in phase["reasons"]), phase["reasons"])
+
+    def test_late_probes_mark_phase_suspect(self):
+        """Tests that probes sent well after their planned time are reported per phase."""
+        record_send_delay(0, 1)  # Outside any phase: counted as idle
+        with self.profiler.phase("latency"):
+            now = time.perf_counter_ns()
+            for i in range(10):
+                record_send_delay(now - 20_000_000, now)
+        report = self.profiler.stop()
+        send_delay = report["phases"]["latency"]["send_delay_ms"]
+        self.assertEqual(send_delay["count"], 10)
+        self.assertAlmostEqual(send_delay["p50"], 20, delta=0.5)
+        self.assertIn("latency", report["suspect_phases"])
+        record_send_delay(0, 1)  # No profiler running: a no-op
+
+    def test_suspect_results(self):
+        """Tests the mapping from suspect phases and CPU-bound transfers to result keys."""
+        report = {"suspect_phases": ["download_tcp"]}
+        transfers = {"upload_tcp": [{"cpu": {"client_cpu_bound": True}}], "download_udp": [{}]}
+        self.assertEqual(suspect_results(report, transfers), ["download_tcp", "latency_under_load", "upload_tcp"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+from core.download import IPERF_PORT, download_test
+from core.ranking_cache import RankingCache, network_identity
+from core.test_plan import TestPlan
+from utils.retry import Breakers, breaker_key
+
+SERVERS = ["http://a.example/1GB.bin", "http://b.example/1GB.bin"]
+
+def entry(host, rtt, success_rate=1.0):
+    return {"server": f"http://{host}/1GB.bin", "host": host, "port": 80, "rtts": [rtt],
+            "median_rtt": rtt if success_rate else None, "success_rate": success_rate, "completed": True}
+
+class TestRankingCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "ranking.json")
+        self.network = "eth0/10.0.0.2/gw 10.0.0.1"
+        self.probes = 0
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def rank(self):
+        self.probes += 1
+        return [entry("b.example", 5.0), entry("a.example", 20.0)]
+
+    def cache(self, ttl=60, max_age=3600):
+        return RankingCache(self.path, ttl=ttl, max_age=max_age, identity=lambda: self.network)
+
+    def test_fresh_ranking_is_reused_across_processes(self):
+        """Tests that only the first lookup probes, and that the cache survives a restart."""
+        first = self.cache().rank("download", SERVERS, self.rank)
+        second = self.cache().rank("download", SERVERS, self.rank)
+        self.assertEqual(self.probes, 1)
+        self.assertEqual([e["host"] for e in second], ["b.example", "a.example"])
+        self.assertEqual(second[0]["server"], SERVERS[1])
+        self.assertEqual(first[0]["median_rtt"], second[0]["median_rtt"])
+
+    def test_stale_ranking_served_then_revalidated(self):
+        """Tests that a stale ranking is returned at once and only re-probed by revalidate()."""
+        cache = self.cache(ttl=0.05)
+        cache.rank("download", SERVERS, self.rank)
+        time.sleep(0.1)
+        ranking = cache.rank("download", SERVERS, self.rank)
+        self.assertEqual(ranking[0]["host"], "b.example")
+        time.sleep(0.05)
+        self.assertEqual(self.probes, 1, "Nothing probes while the transfers may be running")
+        self.assertEqual(cache.revalidate(), ["download"])
+        self.assertEqual(cache.revalidate(), [])
+        self.assertEqual(self.probes, 2)
+        _, age = cache.get(SERVERS, network=self.network)
+        self.assertLess(age, 0.05)
+
+    def test_network_change_and_failed_server_reprobe(self):
+        cache = self.cache()
+        cache.rank("download", SERVERS, self.rank)
+        self.network = "wlan0/192.168.1.5/gw 192.168.1.1"
+        cache.rank("download", SERVERS, self.rank)
+        self.assertEqual(self.probes, 2)
+        cache.server_failed(SERVERS[1])
+        cache.rank("download", SERVERS, self.rank)
+        self.assertEqual(self.probes, 3)
+
+    def test_every_failed_server_is_dropped(self):
+        """Tests that fallback servers that also fail a download are dropped from the cache."""
+        cache = self.cache()
+        ranking = cache.rank("download", SERVERS, self.rank)
+        with mock.patch("core.download.default_cache", lambda: cache), \
+                mock.patch("core.download.start_load_sampler", lambda *args: None), \
+                mock.patch("core.download.run_http_download_test", lambda *args, **options: 0):
+            self.assertEqual(download_test(ranking=ranking, plan=TestPlan("fixed")), 0)
+        self.assertEqual(cache.get(SERVERS, network=self.network), (None, None))
+        self.assertEqual(cache.networks, {})
+
+    def test_fallbacks_stay_within_the_budget(self):
+        """Tests that fallback downloads are bounded by the time left in the plan."""
+        durations = []
+        with mock.patch("core.server_selection.default_breakers", lambda breakers=Breakers(): breakers), \
+                mock.patch("core.download.RANKING_CACHE", False), \
+                mock.patch("core.download.start_load_sampler", lambda *args: None), \
+                mock.patch("core.download.run_http_download_test",
+                           lambda server, size, duration=None, **options: durations.append(duration) or 0):
+            self.assertEqual(download_test(ranking=self.rank(), plan=TestPlan("adaptive", budget=1)), 0)
+        self.assertEqual(len(durations), 2)  # The failed probe, then one fallback
+        self.assertTrue(all(duration is not None and 0 < duration <= 1 for duration in durations), durations)
+
+    def test_spent_budget_keeps_the_ranking(self):
+        """Tests that a download with no time left runs nothing and blames no server."""
+        cache = self.cache()
+        ranking = cache.rank("download", SERVERS, self.rank)
+        attempts = []
+        with mock.patch("core.download.default_cache", lambda: cache), \
+                mock.patch("core.server_selection.default_breakers", lambda breakers=Breakers(): breakers), \
+                mock.patch("core.download.start_load_sampler", lambda *args: None), \
+                mock.patch("core.download.run_http_download_test",
+                           lambda server, *args, **options: attempts.append(server["host"]) or 0):
+            self.assertEqual(download_test(ranking=ranking, plan=TestPlan("adaptive", budget=0)), 0)
+        self.assertEqual(attempts, [])
+        self.assertEqual(len(cache.networks[self.network]["servers"]), 2)
+
+    def test_failed_udp_download_keeps_the_ranking(self):
+        """Tests that an iPerf3 failure neither drops the mirror, tries the others nor opens its HTTP circuit."""
+        cache = self.cache()
+        ranking = cache.rank("download", SERVERS, self.rank)
+        attempts = []
+        breakers = Breakers()
+        with mock.patch("core.download.default_cache", lambda: cache), \
+                mock.patch("core.server_selection.default_breakers", lambda: breakers), \
+                mock.patch("core.download.start_load_sampler", lambda *args: None), \
+                mock.patch("core.download.run_iperf_download_test",
+                           lambda server, *args, **options: attempts.append(server["host"]) or 0):
+            self.assertEqual(download_test(protocol="udp", ranking=ranking, plan=TestPlan("fixed")), 0)
+        self.assertEqual(set(attempts), {"b.example"})
+        self.assertEqual(len(cache.networks[self.network]["servers"]), 2)
+        self.assertEqual(breakers.get(breaker_key("tcp", "b.example", IPERF_PORT)).consecutive_failures, 1)
+        self.assertEqual(breakers.get(breaker_key("tcp", "b.example", 80)).consecutive_failures, 0)
+
+    def test_eviction(self):
+        """Tests that unreachable entries expire after the TTL and everything after max_age."""
+        cache = self.cache(ttl=10, max_age=100)
+        cache.put([entry("a.example", 5.0), entry("b.example", 0, success_rate=0)], network=self.network)
+        now = time.time()
+        cache.evict(now + 20)
+        self.assertEqual(list(cache.networks[self.network]["servers"]), ["a.example:80"])
+        cache.evict(now + 200)
+        self.assertEqual(cache.networks, {})
+
+    def test_network_identity(self):
+        self.assertTrue(network_identity())
+
+if __name__ == "__main__":
+    unittest.main()
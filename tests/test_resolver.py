@@ -0,0 +1,126 @@
+import asyncio
+import socket
+import struct
+import time
+import unittest
+from core.resolver import Resolver, Resolution, connect, async_connect, _answer_ttl, _dns_query
+
+STALLED = "127.0.0.2"  # Serves a listener with a full accept queue: connects to it hang
+
+def _resolver_with(host, addresses):
+    """A Resolver whose cache already holds addresses for host."""
+    resolver = Resolver(nameservers=[])
+    resolver.cache[host] = Resolution(host, addresses, 60, 1.0)
+    return resolver
+
+class TestResolver(unittest.TestCase):
+    def setUp(self):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(16)
+        self.port = self.listener.getsockname()[1]
+
+        # A backlog of 0 holds one pending connection; once it is queued, SYNs are dropped.
+        self.stalled = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.stalled.bind((STALLED, self.port))
+        self.stalled.listen(0)
+        self.queued = socket.create_connection((STALLED, self.port))
+
+    def tearDown(self):
+        self.queued.close()
+        self.stalled.close()
+        self.listener.close()
+
+    def test_cached_until_ttl_expires(self):
+        """Tests that a host is looked up once per TTL and IP literals skip the lookup."""
+        resolver = Resolver(min_ttl=0, max_ttl=0.2, nameservers=[])
+        first = resolver.resolve("localhost")
+        self.assertIn((socket.AF_INET, "127.0.0.1"), first.addresses)
+        self.assertIs(resolver.resolve("localhost"), first)
+        time.sleep(0.25)
+        self.assertIsNot(resolver.resolve("localhost"), first)
+
+        literal = resolver.resolve("::1")
+        self.assertEqual(literal.addresses, [(socket.AF_INET6, "::1")])
+        self.assertEqual(literal.dns_ms, 0.0)
+
+    def test_resolve_all_and_failures(self):
+        """Tests concurrent resolution of several hosts, including one that does not exist."""
+        resolver = Resolver(nameservers=[])
+        resolutions = resolver.resolve_all(["localhost", "127.0.0.1", "localhost", "no-such-host.invalid"])
+        self.assertEqual(set(resolutions), {"localhost", "127.0.0.1", "no-such-host.invalid"})
+        self.assertEqual(resolutions["no-such-host.invalid"].addresses, [])
+        self.assertIsNotNone(resolutions["no-such-host.invalid"].error)
+        with self.assertRaises(OSError):
+            connect("no-such-host.invalid", self.port, timeout=1, resolver=resolver)
+
+    def test_happy_eyeballs_skips_hanging_address(self):
+        """Tests that a stalled first address loses the race to the next one after the delay."""
+        resolver = _resolver_with("race.test", [(socket.AF_INET, STALLED), (socket.AF_INET, "127.0.0.1")])
+        start = time.perf_counter()
+        sock, connect_ms = connect("race.test", self.port, timeout=3, delay=0.1, resolver=resolver)
+        elapsed = time.perf_counter() - start
+        self.assertEqual(sock.getpeername(), ("127.0.0.1", self.port))
+        sock.close()
+        self.assertLess(elapsed, 1.5)
+        self.assertLess(connect_ms, 100, "Only the winning handshake should be timed")
+
+    def test_async_connect_falls_through_refused_address(self):
+        """Tests that a refused address immediately hands over to the next one."""
+        closed = socket.socket()
+        closed.bind(("127.0.0.1", 0))
+        closed_port = closed.getsockname()[1]
+        closed.close()
+        resolver = _resolver_with("refused.test", [(socket.AF_INET, "127.0.0.1")])
+        with self.assertRaises(OSError):
+            asyncio.run(async_connect("refused.test", closed_port, timeout=2, resolver=resolver))
+
+        resolver = _resolver_with("race.test", [(socket.AF_INET, STALLED), (socket.AF_INET, "127.0.0.1")])
+        sock, connect_ms = asyncio.run(async_connect("race.test", self.port, timeout=3, delay=0.1,
+                                                     resolver=resolver))
+        self.assertEqual(sock.getpeername(), ("127.0.0.1", self.port))
+        sock.close()
+        self.assertGreater(connect_ms, 0)
+
+    def test_async_lookup_does_not_block_the_loop(self):
+        """Tests that a cache miss is looked up off the event loop, so other probes keep running."""
+        class SlowResolver(Resolver):
+            def _lookup(self, host):
+                time.sleep(0.3)
+                return Resolution(host, [(socket.AF_INET, "127.0.0.1")], 60, 300.0)
+
+        async def run():
+            gaps = []
+
+            async def tick():
+                last = time.perf_counter()
+                for _ in range(30):
+                    await asyncio.sleep(0.01)
+                    gaps.append(time.perf_counter() - last)
+                    last = time.perf_counter()
+
+            ticker = asyncio.ensure_future(tick())
+            await asyncio.sleep(0.02)
+            sock, _ = await async_connect("slow.example", self.port, timeout=2,
+                                          resolver=SlowResolver(nameservers=[]))
+            sock.close()
+            await ticker
+            return max(gaps)
+
+        self.assertLess(asyncio.run(run()), 0.15)
+
+    def test_answer_ttl(self):
+        """Tests TTL parsing of a DNS answer with a CNAME and compressed names."""
+        query = _dns_query(0x1234, "www.example.com", 1)
+        answer = bytearray(query)
+        struct.pack_into("!HHHH", answer, 2, 0x8180, 1, 2, 0)
+        answer += b"\xc0\x0c" + struct.pack("!HHIH", 5, 1, 300, 4) + b"\x01a\xc0\x10"
+        answer += b"\xc0\x2d" + struct.pack("!HHIH", 1, 1, 60, 4) + socket.inet_aton("192.0.2.7")
+        self.assertEqual(_answer_ttl(bytes(answer)), 60)
+
+        nxdomain = bytearray(query)
+        struct.pack_into("!H", nxdomain, 2, 0x8183)
+        self.assertIsNone(_answer_ttl(bytes(nxdomain)))
+
+if __name__ == "__main__":
+    unittest.main()
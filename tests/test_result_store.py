@@ -0,0 +1,78 @@
+import gzip
+import json
+import os
+import tempfile
+import time
+import unittest
+from utils.result_store import ResultStore, import_json_files
+
+def make_results(download, server="den.example.net", **extra):
+    results = {key: 1.0 for key in ("download_udp", "upload_tcp", "upload_udp", "latency_tcp", "latency_udp",
+                                    "jitter_tcp", "jitter_udp", "jitter_icmp", "packet_loss_tcp",
+                                    "packet_loss_udp", "packet_loss_icmp")}
+    results.update(download_tcp=download, latency_icmp=None, download_server=server,
+                   transfers={"download_tcp": [{"intervals": list(range(100))}]})
+    results.update(extra)
+    return results
+
+class TestResultStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = ResultStore(os.path.join(self.tmp.name, "results.db"))
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def test_time_range_and_server_queries(self):
+        now = time.time()
+        self.store.insert_many([(now - 3600 * i, make_results(100 + i, "a" if i % 2 else "b"))
+                                for i in range(10)])
+        recent = self.store.query(start=now - 3 * 3600 - 1)
+        self.assertEqual([row["download_tcp"] for row in recent], [103, 102, 101, 100])
+        self.assertEqual(self.store.count(server="a"), 5)
+        rows = self.store.query(server="a", start=now - 5 * 3600 - 1, end=now)
+        self.assertEqual([row["download_tcp"] for row in rows], [105, 103, 101])
+        self.assertIsNone(rows[0]["latency_icmp"])
+        self.assertEqual([row["download_tcp"] for row in self.store.query(limit=2)], [101, 100])
+
+    def test_full_results_round_trip(self):
+        self.store.insert(make_results(250.5), ts=1000.0, probe="probe-1")
+        (row,) = self.store.query(full=True)
+        self.assertEqual(row["probe"], "probe-1")
+        self.assertEqual(row["results"]["transfers"]["download_tcp"][0]["intervals"][-1], 99)
+
+    def test_columns(self):
+        self.store.insert_many([(1.0, make_results(10)), (2.0, make_results(20))])
+        self.assertEqual(self.store.columns(["download_tcp", "latency_icmp"]),
+                         {"ts": [1.0, 2.0], "download_tcp": [10.0, 20.0], "latency_icmp": [None, None]})
+        with self.assertRaises(ValueError):
+            self.store.columns(["data"])
+
+    def test_compaction_keeps_summary(self):
+        now = time.time()
+        self.store.insert_many([(now - 90 * 86400, make_results(10)), (now, make_results(20))])
+        self.assertEqual(self.store.compact(older_than_days=30), 1)
+        old, new = self.store.query(full=True)
+        self.assertNotIn("transfers", old["results"])
+        self.assertEqual(old["download_tcp"], 10)
+        self.assertIn("transfers", new["results"])
+        self.assertEqual(self.store.compact(older_than_days=30), 0)
+
+    def test_import_json_files(self):
+        plain = os.path.join(self.tmp.name, "speedtest_results_2025-01-14_14-32-01.json")
+        with open(plain, "w") as f:
+            json.dump(make_results(300), f)
+        packed = os.path.join(self.tmp.name, "speedtest_results_2025-01-15_08-00-00.json.gz")
+        with gzip.open(packed, "wt", encoding="utf-8") as f:
+            json.dump(make_results(400), f)
+        broken = os.path.join(self.tmp.name, "broken.json")
+        with open(broken, "w") as f:
+            f.write("{")
+        self.assertEqual(import_json_files([packed, plain, broken], self.store), (2, 1))
+        rows = self.store.query()
+        self.assertEqual([row["download_tcp"] for row in rows], [300, 400])
+        self.assertEqual(time.strftime("%Y-%m-%d %H:%M", time.localtime(rows[0]["ts"])), "2025-01-14 14:32")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+import asyncio
+import random
+import time
+import unittest
+from unittest import mock
+from config.settings import BREAKER_FAILURES
+from core.http_download import ConnectionPool, RangeConnection
+from core.latency import latency_test
+from utils.retry import (Breakers, CircuitBreaker, CircuitOpen, backoff_delays, retry, retry_async, retry_call,
+                         CLOSED, OPEN, HALF_OPEN)
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class Flaky:
+    """Fails the first failures calls with ConnectionRefusedError, then returns 'ok'."""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def __call__(self, remaining=None):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionRefusedError("refused")
+        return "ok"
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_open_half_open_closed(self):
+        """Tests opening after repeated failures, one half-open trial per cool-down and closing on success."""
+        clock = FakeClock()
+        breaker = CircuitBreaker("tcp://dead:80", failures=3, cooldown=60, clock=clock)
+        for _ in range(2):
+            self.assertTrue(breaker.allow())
+            breaker.record(False)
+        self.assertEqual(breaker.state, CLOSED)
+        breaker.record(False)
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.allow())
+
+        clock.now = 60
+        self.assertTrue(breaker.available())
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertFalse(breaker.allow(), "Only one trial at a time")
+        breaker.record(False)
+        self.assertFalse(breaker.allow(), "A failed trial starts a new cool-down")
+
+        clock.now = 120
+        self.assertTrue(breaker.allow())
+        breaker.record(None)  # Trial cancelled: no verdict
+        self.assertTrue(breaker.allow())
+        breaker.record(True)
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertEqual(breaker.consecutive_failures, 0)
+
+class TestRetry(unittest.TestCase):
+    def test_backoff_is_jittered_and_capped(self):
+        rng = random.Random(3)
+        runs = [backoff_delays(5, delay=1, backoff=2, max_delay=4, jitter=1, rng=rng) for _ in range(200)]
+        for waits in runs:
+            self.assertEqual(len(waits), 4)
+            self.assertTrue(all(0 <= wait <= limit for wait, limit in zip(waits, (1, 2, 4, 4))))
+        self.assertGreater(len({round(waits[0], 3) for waits in runs}), 100)
+        self.assertEqual(backoff_delays(3, delay=1, backoff=2, jitter=0), [1, 2])
+
+    def test_retry_call(self):
+        """Tests retries until success, the give-up error and the deadline budget."""
+        flaky = Flaky(2)
+        self.assertEqual(retry_call(flaky, exceptions=(ConnectionError,), tries=3, delay=0.01), "ok")
+        self.assertEqual(flaky.calls, 3)
+
+        with self.assertRaises(ConnectionRefusedError):
+            retry_call(Flaky(5), exceptions=(ConnectionError,), tries=3, delay=0.01)
+
+        # No wait may run past the deadline, so a long backoff ends the call at once
+        dead = Flaky(10)
+        start = time.perf_counter()
+        with self.assertRaises(ConnectionRefusedError):
+            retry_call(dead, exceptions=(ConnectionError,), tries=10, delay=5, jitter=0,
+                       deadline=time.perf_counter() + 1)
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual(dead.calls, 1)
+
+    def test_retry_call_with_breaker(self):
+        """Tests that failures feed the breaker and an open breaker stops calls without trying."""
+        breaker = CircuitBreaker("tcp://dead:80", failures=2, cooldown=60)
+        dead = Flaky(10)
+        with self.assertRaises(CircuitOpen):
+            retry_call(dead, exceptions=(ConnectionError,), tries=5, delay=0.001, breaker=breaker)
+        self.assertEqual(dead.calls, 2)
+        with self.assertRaises(CircuitOpen):
+            retry_call(dead, exceptions=(ConnectionError,), breaker=breaker)
+        self.assertEqual(dead.calls, 2)
+
+    def test_retry_async(self):
+        """Tests coroutine retries and that an attempt is cut off at the deadline."""
+        flaky = Flaky(1)
+
+        async def call(remaining):
+            return flaky()
+
+        self.assertEqual(asyncio.run(retry_async(call, tries=2, delay=0.01)), "ok")
+
+        async def hang(remaining):
+            await asyncio.sleep(10)
+
+        start = time.perf_counter()
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(retry_async(hang, tries=3, delay=0.01, deadline=time.perf_counter() + 0.2))
+        self.assertLess(time.perf_counter() - start, 1)
+
+    def test_decorator_wraps_coroutines(self):
+        failures = []
+
+        @retry(ConnectionError, tries=2, delay=0.01, on_failure=failures.append)
+        async def refuse():
+            raise ConnectionRefusedError("refused")
+
+        @retry(ConnectionError, tries=2, delay=0.01)
+        def succeed():
+            return 42
+
+        self.assertIsNone(asyncio.run(refuse()))
+        self.assertEqual(len(failures), 1)
+        self.assertEqual(succeed(), 42)
+
+    def test_download_connects_stop_at_the_transfer_deadline(self):
+        """Tests that a refused download connect is not retried once the transfer deadline has passed."""
+        refused = Flaky(10)
+        with mock.patch("core.http_download.connect", lambda host, port, timeout: refused()):
+            with self.assertRaises(ConnectionRefusedError):
+                RangeConnection("http://127.0.0.1:9/", deadline=time.perf_counter()).connect()
+            self.assertEqual(refused.calls, 1)
+            with self.assertRaises(ConnectionRefusedError):
+                ConnectionPool().get("http://127.0.0.1:9/", deadline=time.perf_counter()).connect()
+            self.assertEqual(refused.calls, 2)
+
+    def test_failing_latency_stream_stays_in_the_figures(self):
+        """Tests that a host/protocol that keeps failing is still probed and reported as lost."""
+        for _ in range(BREAKER_FAILURES + 1):
+            results = latency_test(hosts=["127.0.0.1"], attempts=2, interval=0.01, timeout=0.5, deadline=2,
+                                   udp_reflector=None)
+            self.assertEqual(results["127.0.0.1_tcp"]["packet_loss"], 100.0)  # Port 80 refuses
+            self.assertEqual(results["packet_loss_tcp"], 100.0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import threading
+import time
+import unittest
+from contextlib import nullcontext
+from unittest import mock
+from core.scheduler import LINK, Phase, Scheduler, host_resource
+from core.test_plan import TestPlan
+from core.upload import upload_test
+from benchmarks.local_servers import start_http_upload_sink
+from main import _test_phases
+
+class Recorder:
+    """Phase bodies that sleep and note when they ran."""
+
+    def __init__(self):
+        self.spans = {}
+        self.lock = threading.Lock()
+
+    def sleep(self, name, seconds=0.1, result=None):
+        def run(outputs):
+            start = time.perf_counter()
+            time.sleep(seconds)
+            with self.lock:
+                self.spans[name] = (start, time.perf_counter())
+            return result if result is not None else name
+        return run
+
+    def overlap(self, first, second):
+        (a_start, a_end), (b_start, b_end) = self.spans[first], self.spans[second]
+        return a_start < b_end and b_start < a_end
+
+class TestScheduler(unittest.TestCase):
+    def test_probes_overlap_and_transfers_run_alone(self):
+        """Tests that idle probes of different hosts overlap while probes of one host and transfers do not."""
+        recorder = Recorder()
+        scheduler = Scheduler([
+            Phase("latency", recorder.sleep("latency"), shared=[LINK], exclusive=[host_resource("8.8.8.8")]),
+            Phase("ranking", recorder.sleep("ranking"), shared=[LINK], exclusive=[host_resource("dl.example")]),
+            Phase("recheck", recorder.sleep("recheck"), shared=[LINK], exclusive=[host_resource("8.8.8.8")]),
+            Phase("download", recorder.sleep("download"), after=["ranking"], exclusive=[LINK]),
+            Phase("upload", recorder.sleep("upload"), after=["ranking"], exclusive=[LINK]),
+        ])
+        start = time.perf_counter()
+        outputs = scheduler.run()
+        elapsed = time.perf_counter() - start
+        self.assertEqual(outputs, {name: name for name in ("latency", "ranking", "recheck", "download", "upload")})
+        self.assertTrue(recorder.overlap("latency", "ranking"))
+        self.assertFalse(recorder.overlap("latency", "recheck"))
+        for transfer in ("download", "upload"):
+            for other in set(outputs) - {transfer}:
+                self.assertFalse(recorder.overlap(transfer, other), f"{transfer} overlapped {other}")
+        self.assertLess(elapsed, 0.45)  # 0.5s of phases in sequence
+
+    def test_waiting_transfer_holds_back_later_probes(self):
+        """Tests that a ready transfer is not starved by probes declared after it."""
+        recorder = Recorder()
+        Scheduler([
+            Phase("probe", recorder.sleep("probe"), shared=[LINK]),
+            Phase("transfer", recorder.sleep("transfer"), exclusive=[LINK]),
+            Phase("late_probe", recorder.sleep("late_probe"), shared=[LINK]),
+        ]).run()
+        self.assertLess(recorder.spans["transfer"][0], recorder.spans["late_probe"][0])
+
+    def test_failures_and_budget_skip_phases(self):
+        """Tests that a failed phase skips its dependents and that no phase starts after the budget."""
+        def broken(outputs):
+            raise OSError("no route to host")
+
+        recorder = Recorder()
+        scheduler = Scheduler([
+            Phase("ranking", broken),
+            Phase("download", recorder.sleep("download"), after=["ranking"], exclusive=[LINK]),
+            Phase("latency", recorder.sleep("latency", 0.2), exclusive=[LINK]),
+            Phase("upload", recorder.sleep("upload"), exclusive=[LINK]),
+        ], budget=0.1)
+        outputs = scheduler.run()
+        self.assertEqual(outputs, {"latency": "latency"})
+        self.assertIsInstance(scheduler.failed["ranking"], OSError)
+        self.assertEqual(scheduler.skipped, {"download": "needs ranking", "upload": "time budget spent"})
+
+    def test_outputs_are_shared_and_the_plan_is_checked(self):
+        seen = []
+        Scheduler([
+            Phase("ranking", lambda outputs: ["best"]),
+            Phase("download", lambda outputs: seen.append(outputs["ranking"]), after=["ranking"]),
+        ]).run()
+        self.assertEqual(seen, [["best"]])
+        with self.assertRaises(ValueError):
+            Scheduler([Phase("download", lambda outputs: None, after=["ranking"]), Phase("ranking", None)])
+
+    def test_idle_baseline_avoids_the_selection_bursts(self):
+        """Tests that the sampler's idle window never overlaps server selection or latency probes."""
+        # Latency hosts apart from the bufferbloat target, so the conflict cannot come from the config
+        with mock.patch("main.LATENCY_TEST_HOSTS", ["192.0.2.1"]):
+            phases = _test_phases("thread", None, lambda name: nullcontext(), lambda partial: None, None,
+                                  TestPlan("adaptive", budget=2, phases=4), {}, None)
+        names = [phase.name for phase in phases]
+        sampler = phases[names.index("sampler")]
+        for other in ("latency", "download_ranking", "upload_ranking"):
+            self.assertTrue(sampler.conflicts(phases[names.index(other)]), other)
+            self.assertLess(names.index(other), names.index("sampler"), f"{other} should start first")
+
+    def test_upload_test_runs_one_protocol(self):
+        """Tests that upload_test(protocol='tcp') runs only the TCP transfers."""
+        server, url = start_http_upload_sink()
+        ranking = [{"server": {"host": "127.0.0.1", "port": server.server_address[1], "upload_url": url},
+                    "host": "127.0.0.1", "port": server.server_address[1], "median_rtt": 0.1, "success_rate": 1.0}]
+        transfers = []
+        try:
+            speed = upload_test(protocol="tcp", ranking=ranking, sampler=None, transfers=transfers,
+                                plan=TestPlan("adaptive", budget=4, phases=1))  # After a 2s idle baseline
+        finally:
+            server.shutdown()
+        self.assertGreater(speed, 0)
+        self.assertTrue(transfers)
+        self.assertEqual({t["protocol"] for t in transfers}, {"tcp"})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import socket
+import time
+import unittest
+from core.server_selection import rank_servers, reachable
+from utils.retry import Breakers
+
+def _stalled_listener():
+    """A listener whose accept queue is full, so further connects hang like a blackholed server.
+
+    Returns:
+        (listener, queued client sockets); close all of them when done
+    """
+    listener = socket.create_server(("127.0.0.1", 0), backlog=0)
+    queued = []
+    for _ in range(4):
+        client = socket.socket()
+        client.setblocking(False)
+        client.connect_ex(listener.getsockname())
+        queued.append(client)
+    return listener, queued
+
+class TestServerSelection(unittest.TestCase):
+    def setUp(self):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(64)
+        self.port = self.listener.getsockname()[1]
+
+    def tearDown(self):
+        self.listener.close()
+
+    def test_ranking_orders_reachable_first(self):
+        """Tests that a listening server ranks ahead of a refused one."""
+        closed = socket.socket()
+        closed.bind(("127.0.0.1", 0))
+        closed_port = closed.getsockname()[1]
+        closed.close()
+
+        ranking = rank_servers([{"host": "127.0.0.1", "port": closed_port},
+                                f"http://127.0.0.1:{self.port}/1GB.bin"], deadline=3)
+        self.assertEqual(len(ranking), 2, "Every candidate should appear in the ranking")
+        self.assertEqual(ranking[0]["port"], self.port)
+        self.assertEqual(ranking[0]["success_rate"], 1.0)
+        self.assertEqual(ranking[1]["success_rate"], 0.0)
+        self.assertEqual(len(reachable(ranking)), 1)
+
+    def test_global_deadline(self):
+        """Tests that a blackholed server cannot hold selection past the deadline."""
+        stalled, queued = _stalled_listener()
+        self.addCleanup(lambda: [sock.close() for sock in queued + [stalled]])
+        start = time.perf_counter()
+        ranking = rank_servers([{"host": "127.0.0.1", "port": self.port},
+                                {"host": "127.0.0.1", "port": stalled.getsockname()[1]}],
+                               timeout=2, deadline=1, early_stop_factor=0)
+        self.assertLess(time.perf_counter() - start, 1.5, "Selection should respect its global deadline")
+        self.assertEqual(ranking[0]["port"], self.port)
+        self.assertEqual(ranking[1]["success_rate"], 0.0)
+
+    def test_failing_server_skipped_until_cooldown(self):
+        """Tests that a server failing every round is skipped, then tried once when its breaker is half-open."""
+        closed = socket.socket()
+        closed.bind(("127.0.0.1", 0))
+        closed_port = closed.getsockname()[1]
+        closed.close()
+        now = [0.0]
+        breakers = Breakers(failures=2, cooldown=60, clock=lambda: now[0])
+        servers = [{"host": "127.0.0.1", "port": self.port}, {"host": "127.0.0.1", "port": closed_port}]
+
+        for _ in range(2):
+            ranking = rank_servers(servers, early_stop_factor=0, breakers=breakers)
+            self.assertEqual(len(ranking[1]["rtts"]), 3)
+        ranking = rank_servers(servers, early_stop_factor=0, breakers=breakers)
+        self.assertTrue(ranking[1]["circuit_open"])
+        self.assertEqual(ranking[1]["rtts"], [])
+        self.assertEqual(len(reachable(ranking)), 1)
+
+        now[0] = 60
+        ranking = rank_servers(servers, early_stop_factor=0, breakers=breakers)
+        self.assertFalse(ranking[1]["circuit_open"])
+        self.assertEqual(ranking[1]["rtts"], [None], "The half-open trial is a single connect")
+
+if __name__ == "__main__":
+    unittest.main()
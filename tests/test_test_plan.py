@@ -0,0 +1,63 @@
+import time
+import unittest
+from config.settings import FILE_SIZES, ADAPTIVE_PROBE_MB, ADAPTIVE_MAX_MB
+from core.test_plan import TestPlan, parse_duration
+
+class TestTestPlan(unittest.TestCase):
+    def test_parse_duration(self):
+        self.assertEqual(parse_duration("30s"), 30)
+        self.assertEqual(parse_duration("2m"), 120)
+        self.assertEqual(parse_duration("45"), 45)
+        self.assertAlmostEqual(parse_duration("500ms"), 0.5)
+        with self.assertRaises(ValueError):
+            parse_duration("soon")
+
+    def test_fixed_profile_runs_sweep(self):
+        calls = []
+        results = TestPlan("fixed").run_transfers(lambda size, duration: calls.append((size, duration)) or 1.0)
+        self.assertEqual(calls, [(size, None) for size in FILE_SIZES])
+        self.assertEqual(results, [1.0] * len(FILE_SIZES))
+
+    def test_adaptive_profile_sizes_from_probe(self):
+        """Tests that the probe rate and phase budget decide the single sized transfer."""
+        calls = []
+
+        def run(size, duration):
+            calls.append((size, duration))
+            return 80.0 if size == ADAPTIVE_PROBE_MB else 95.0
+
+        plan = TestPlan("adaptive", budget=8, phases=2)
+        self.assertEqual(plan.run_transfers(run), [95.0])
+        (probe_size, probe_time), (size, duration) = calls
+        self.assertEqual(probe_size, ADAPTIVE_PROBE_MB)
+        self.assertLessEqual(probe_time, 1)   # A quarter of the 4 s phase share
+        self.assertAlmostEqual(duration, 4, delta=0.5)
+        self.assertAlmostEqual(size, 80 * duration / 8 * 1.25, delta=2)
+        self.assertLessEqual(size, ADAPTIVE_MAX_MB)
+
+    def test_adaptive_budget_shrinks_with_elapsed_time(self):
+        plan = TestPlan("adaptive", budget=1, phases=2)
+        time.sleep(0.5)
+        self.assertLess(plan.claim_phase(), 0.3)
+        self.assertLess(plan.claim_phase(), 0.6)
+
+    def test_failed_probe_skips_transfer(self):
+        calls = []
+        results = TestPlan("adaptive", budget=10).run_transfers(lambda size, duration: calls.append(size) or 0)
+        self.assertEqual(results, [0])
+        self.assertEqual(len(calls), 1)
+
+    def test_spent_budget_runs_nothing(self):
+        """Tests that no transfer starts once the budget is spent, even a probe."""
+        calls = []
+        plan = TestPlan("adaptive", budget=0.1)
+        time.sleep(0.15)
+        self.assertEqual(plan.run_transfers(lambda size, duration: calls.append(duration) or 1.0), [])
+        self.assertEqual(calls, [])
+
+    def test_unknown_profile(self):
+        with self.assertRaises(ValueError):
+            TestPlan("exhaustive")
+
+if __name__ == "__main__":
+    unittest.main()
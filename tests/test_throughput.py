@@ -0,0 +1,53 @@
+import threading
+import time
+import unittest
+from core.throughput import IntervalSampler, ramp_up_end, is_stable, iperf_transfer
+
+class TestThroughput(unittest.TestCase):
+    def test_ramp_up_trimmed(self):
+        """Tests that slow-start intervals are dropped from the steady-state figure."""
+        rates = [10, 40, 80, 95, 100, 101, 99, 100, 100, 98, 100, 101]
+        self.assertEqual(ramp_up_end(rates, window=3), 3)
+
+    def test_stability(self):
+        self.assertTrue(is_stable([100.0] * 20, window=10, tolerance=0.05))
+        self.assertFalse(is_stable(list(range(1, 21)), window=10, tolerance=0.05))
+        self.assertFalse(is_stable([100.0] * 5, window=10, tolerance=0.05))
+
+    def test_early_stop_on_stable_counter(self):
+        """Tests that a steady byte counter trips the stop event well before a long transfer ends."""
+        start = time.perf_counter()
+        stop_event = threading.Event()
+        sampler = IntervalSampler(interval=0.05, window=5, min_duration=0.3)
+        sampler.start(lambda: int((time.perf_counter() - start) * 125_000_000), stop_event)
+        self.assertTrue(stop_event.wait(5), "A constant 1 Gbps counter should be detected as stable")
+        summary = sampler.stop()
+        self.assertTrue(summary["stopped_early"])
+        self.assertAlmostEqual(summary["steady_mbps"], 1000, delta=100)
+        self.assertGreaterEqual(len(summary["intervals_mbps"]), 10)
+
+    def test_ring_buffer_is_bounded(self):
+        sampler = IntervalSampler(capacity=4)
+        for i in range(10):
+            sampler.ring[sampler.count % 4] = i
+            sampler.count += 1
+        self.assertEqual(sampler.rates(), [6, 7, 8, 9])
+
+    def test_iperf_intervals(self):
+        """Tests that iperf3's interval reports get the same ramp trimming as sampled transfers."""
+        def interval(mbps, omitted=False):
+            return {"sum": {"seconds": 1.0, "bytes": int(mbps * 125_000), "bits_per_second": mbps * 1e6,
+                            "omitted": omitted}}
+
+        report = {"intervals": [interval(500, omitted=True), interval(20), interval(60)] +
+                               [interval(100)] * 8}
+        transfer = iperf_transfer(report)
+        self.assertEqual(transfer["throughput"]["intervals_mbps"], [20, 60] + [100] * 8)
+        self.assertEqual(transfer["throughput"]["ramp_up_intervals"], 2)
+        self.assertAlmostEqual(transfer["mbps"], 100, delta=1)
+        self.assertLess(transfer["average_mbps"], transfer["mbps"])
+        self.assertFalse(transfer["throughput"]["stopped_early"])
+        self.assertIsNone(iperf_transfer({"intervals": []}))
+
+if __name__ == "__main__":
+    unittest.main()
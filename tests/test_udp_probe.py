@@ -0,0 +1,34 @@
+import unittest
+from core.udp_probe import UdpReflector, udp_probe_stream, rfc3550_jitter
+
+class TestUdpProbe(unittest.TestCase):
+    def setUp(self):
+        self.reflector = UdpReflector("127.0.0.1", 0).start()
+        self.port = self.reflector.address[1]
+
+    def tearDown(self):
+        self.reflector.stop()
+
+    def test_stream_against_reflector(self):
+        """Tests a paced stream of several hundred packets per second on loopback."""
+        result = udp_probe_stream("127.0.0.1", self.port, count=300, rate=600, timeout=0.5)
+        self.assertEqual(result["sent"], 300)
+        self.assertGreaterEqual(result["received"], 295)
+        self.assertLess(result["packet_loss"], 2)
+        self.assertEqual(result["duplicates"], 0)
+        self.assertIsNotNone(result["jitter"])
+        self.assertGreaterEqual(result["forward_jitter"], 0)
+
+    def test_reflector_counts_per_session(self):
+        """Tests that a second client gets its own reflector packet count."""
+        udp_probe_stream("127.0.0.1", self.port, count=20, rate=1000, timeout=0.2)
+        result = udp_probe_stream("127.0.0.1", self.port, count=20, rate=1000, timeout=0.2)
+        self.assertEqual(result["forward_loss"], 0.0)
+
+    def test_rfc3550_jitter(self):
+        """Tests the RFC 3550 estimator: constant transit has no jitter."""
+        self.assertEqual(rfc3550_jitter([5.0] * 10), 0.0)
+        self.assertAlmostEqual(rfc3550_jitter([0.0, 16.0]), 1.0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import time
+import unittest
+from core.upload_engine import tcp_upload, http_upload
+from benchmarks.local_servers import start_tcp_sink, start_http_upload_sink
+
+TOTAL = 96 * 1024 * 1024 + 7
+
+class TestUploadEngine(unittest.TestCase):
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _wait_for(self, expected):
+        end = time.time() + 5
+        while self.server.received < expected and time.time() < end:
+            time.sleep(0.01)
+        return self.server.received
+
+    def test_tcp_sendfile(self):
+        """Tests parallel zero-copy TCP streams against a loopback sink."""
+        self.server, port = start_tcp_sink()
+        result = tcp_upload("127.0.0.1", port, total_bytes=TOTAL, streams=3, early_stop=False)
+        self.assertEqual(result["bytes"], TOTAL)
+        self.assertEqual(self._wait_for(TOTAL), TOTAL)
+        self.assertEqual(len(result["streams"]), 3)
+        for stream in result["streams"]:
+            self.assertNotIn("error", stream)
+            self.assertEqual(stream["method"], "sendfile")
+            self.assertGreater(stream["bytes_per_second"], 0)
+
+    def test_tcp_sendall_fallback(self):
+        """Tests the memoryview/sendall transmit path."""
+        self.server, port = start_tcp_sink()
+        result = tcp_upload("127.0.0.1", port, total_bytes=10_000_000, streams=2, zero_copy=False,
+                            early_stop=False)
+        self.assertEqual(result["bytes"], 10_000_000)
+        self.assertTrue(all(s["method"] == "sendall" for s in result["streams"]))
+
+    def test_tcp_duration(self):
+        """Tests a duration-bounded upload that wraps around the payload file."""
+        self.server, port = start_tcp_sink()
+        start = time.perf_counter()
+        result = tcp_upload("127.0.0.1", port, duration=0.5, streams=2)
+        self.assertLess(time.perf_counter() - start, 2)
+        self.assertGreater(result["bytes"], 0)
+
+    def test_http_put(self):
+        """Tests HTTP PUT uploads, one request body per stream."""
+        self.server, url = start_http_upload_sink()
+        result = http_upload(url, TOTAL, method="PUT", streams=4, early_stop=False)
+        self.assertEqual(result["bytes"], TOTAL)
+        self.assertEqual(self.server.received, TOTAL)
+        self.assertTrue(all(s["status"] == 200 for s in result["streams"]))
+
+    def test_http_rejected_upload_fails(self):
+        """Tests that a sink answering with an error status does not count as an upload."""
+        self.server, url = start_http_upload_sink(status=413)
+        with self.assertRaises(ConnectionError):
+            http_upload(url, 10_000_000, streams=2, early_stop=False)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import importlib.util
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from core.visualization import chart_path, plot_results, plot_in_background
+
+HAS_MATPLOTLIB = importlib.util.find_spec("matplotlib") is not None
+RESULTS = {"download_tcp": 92.5, "download_udp": None, "upload_tcp": 21.0, "upload_udp": 0,
+           "latency_tcp": 12.1, "latency_udp": None, "latency_icmp": 11.4, "latency_under_load": 40.2,
+           "jitter_tcp": 1.2, "jitter_udp": None, "jitter_icmp": 0.8,
+           "packet_loss_tcp": 0.0, "packet_loss_udp": None, "packet_loss_icmp": 0.0}
+
+class TestVisualization(unittest.TestCase):
+    def test_chart_path(self):
+        """Tests that charts are named after the result file they belong to."""
+        self.assertEqual(chart_path("results/run.json"), os.path.join("results", "run_chart"))
+        self.assertEqual(chart_path("results/run.json.gz"), os.path.join("results", "run_chart"))
+        self.assertEqual(chart_path("data/speedtest.db", "2024-01-01_00-00-00"),
+                         os.path.join("data", "speedtest_chart_2024-01-01_00-00-00"))
+
+    def test_headless_import(self):
+        """Tests that importing the entry point loads neither matplotlib nor iperf3."""
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        check = ("import sys, main; "
+                 "print(sorted(m for m in ('matplotlib', 'iperf3') if m in sys.modules))")
+        output = subprocess.run([sys.executable, "-c", check], cwd=root, capture_output=True, text=True,
+                                timeout=60)
+        if output.returncode:
+            self.skipTest(f"main.py cannot be imported here: {output.stderr.strip().splitlines()[-1]}")
+        self.assertEqual(output.stdout.strip(), "[]")
+
+    @unittest.skipUnless(HAS_MATPLOTLIB, "matplotlib is not installed")
+    def test_plot_results_writes_one_file_per_format(self):
+        """Tests that one multi-panel chart is written per format, with missing values."""
+        with tempfile.TemporaryDirectory() as tmp:
+            written = plot_results(RESULTS, os.path.join(tmp, "charts", "run_chart"), ["png", "svg"])
+            self.assertEqual([os.path.basename(path) for path in written], ["run_chart.png", "run_chart.svg"])
+            with open(written[0], "rb") as f:
+                self.assertEqual(f.read(8), b"\x89PNG\r\n\x1a\n")
+            with open(written[1]) as f:
+                self.assertIn("<svg", f.read())
+
+    @unittest.skipUnless(HAS_MATPLOTLIB, "matplotlib is not installed")
+    def test_plot_in_background(self):
+        """Tests that the background renderer writes the chart after the caller moves on."""
+        with tempfile.TemporaryDirectory() as tmp:
+            child = plot_in_background(RESULTS, os.path.join(tmp, "run_chart"), ["png"])
+            self.assertEqual(child.wait(timeout=60), 0)
+            self.assertTrue(os.path.exists(os.path.join(tmp, "run_chart.png")))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,12 @@
 import json
 import os
 import gzip
+import sqlite3
 from datetime import datetime
+from config.settings import RESULTS_BACKEND, RESULTS_DB
+from core.metrics import merge_sketch_trees
 from utils.logger import logger
+from utils.result_store import ResultStore
 
 def validate_results(results):
     """Validates the structure of the results dictionary."""
@@ -17,14 +21,31 @@ def validate_results(results):
             return False
     return True
 
-def save_results(results, filename=None, compress=False):
-    """Saves the results to a JSON file with protocol tagging and optional compression.
+def save_results(results, filename=None, compress=False, backend=RESULTS_BACKEND):
+    """Saves the results to the result store, or to a JSON file with optional compression.
 
     Args:
         results: Dictionary of speed test results
-        filename: Custom filename (auto-generated if None)
+        filename: Custom filename (auto-generated if None); always writes a file
         compress: Whether to compress the results file (gzip)
+        backend: 'sqlite' appends the run to RESULTS_DB, 'json' writes a results file
+
+    Returns:
+        Path of the database or file the results went to, or None if they were not saved
     """
+    if not filename and backend == "sqlite":
+        if not validate_results(results):
+            logger.error("❌ Results failed validation. Not saving.")
+            return
+        try:
+            with ResultStore(RESULTS_DB) as store:
+                store.insert(results)
+            logger.info(f"✅ Results saved to {RESULTS_DB}")
+            return RESULTS_DB
+        except (OSError, sqlite3.Error) as e:
+            logger.error(f"❌ Failed to save results: {e}")
+        return
+
     if not filename:
         timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
         filename = f"results/speedtest_results_{timestamp}.json"
@@ -50,9 +71,30 @@ def save_results(results, filename=None, compress=False):
             with open(filename, 'w') as f:
                 json.dump(results, f, indent=4)
         logger.info(f"✅ Results saved to {filename}")
+        return filename
     except (PermissionError, TypeError, Exception) as e:
         logger.error(f"❌ Failed to save results: {e}")
 
+def load_history(start=None, end=None, server=None, db=RESULTS_DB):
+    """Loads the runs recorded in the result store between start and end (Unix seconds).
+
+    Args:
+        start: Earliest run time, or None
+        end: Latest run time (exclusive), or None
+        server: Only runs against this download or upload server
+        db: SQLite result store
+
+    Returns:
+        List of results dictionaries (oldest first) with their run time under 'timestamp'
+    """
+    try:
+        with ResultStore(db) as store:
+            runs = store.query(start, end, server, full=True)
+    except (OSError, sqlite3.Error) as e:
+        logger.error(f"❌ Failed to load results from {db}: {e}")
+        return []
+    return [dict(run["results"], timestamp=run["ts"]) for run in runs]
+
 def load_results(filename):
     """Loads results from a JSON or compressed JSON file with validation.
 
@@ -80,17 +122,40 @@ def load_results(filename):
         logger.error(f"❌ Failed to load results from {filename}: {e}")
         return None
 
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
 def merge_results(existing_results, new_results):
-    """Merges two results dictionaries by averaging values where possible."""
+    """Merges two results dictionaries into a running average.
+
+    Each numeric value is weighted by the number of runs that measured it: its entry in
+    the side's 'counts' dict, or the side's 'runs' (1 if absent) when it has none. A run
+    that did not measure a figure (None) does not count towards it, so merging runs
+    one at a time weights every measurement equally. Non-numeric values (nested details)
+    are taken from the newer results, except 'sketches', whose distributions are merged
+    so percentiles cover both sides.
+    """
     merged = {}
+    counts = {}
+    old_runs = existing_results.get("runs", 1)
+    new_runs = new_results.get("runs", 1)
+    old_counts = existing_results.get("counts") or {}
+    new_counts = new_results.get("counts") or {}
 
-    for key in set(existing_results) | set(new_results):
-        if key in existing_results and key in new_results:
-            merged[key] = (existing_results[key] + new_results[key]) / 2
-        elif key in existing_results:
-            merged[key] = existing_results[key]
+    for key in (set(existing_results) | set(new_results)) - {"runs", "counts"}:
+        old, new = existing_results.get(key), new_results.get(key)
+        old_weight = old_counts.get(key, old_runs) if _is_number(old) else 0
+        new_weight = new_counts.get(key, new_runs) if _is_number(new) else 0
+        if old_weight + new_weight:
+            weighted = [(value, weight) for value, weight in ((old, old_weight), (new, new_weight)) if weight]
+            counts[key] = old_weight + new_weight
+            merged[key] = sum(value * weight for value, weight in weighted) / counts[key]
+        elif key == "sketches":
+            merged[key] = merge_sketch_trees(old, new)
         else:
-            merged[key] = new_results[key]
+            merged[key] = new if new is not None else old
+    merged["runs"] = old_runs + new_runs
+    merged["counts"] = counts
 
     logger.info("🔄 Results merged successfully.")
-    return merged
\ No newline at end of file
+    return merged
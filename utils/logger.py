@@ -1,6 +1,10 @@
+import atexit
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+import threading
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+from config.settings import LOG_QUEUE_SIZE
 
 class ColorFormatter(logging.Formatter):
     """Custom log formatter with color-coded output for console."""
@@ -21,10 +25,43 @@ class ColorFormatter(logging.Formatter):
         color = self.COLORS.get(record.levelno, self.RESET)
         return f"{color}{super().format(record)}{self.RESET}"
 
-def setup_logger(name="speedtest_logger", log_file="logs/speedtest.log", level=logging.INFO, debug_mode=False):
-    """Sets up the logger with log rotation, color-coded console output, and protocol tagging."""
-    
-    os.makedirs("logs", exist_ok=True)
+class DroppingQueueHandler(QueueHandler):
+    """Hands records to a bounded queue without blocking; counts the ones that do not fit.
+
+    Records are enqueued as built: formatting happens on the listener thread. Messages
+    are already formatted strings and carry no args, so nothing is lost by deferring.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # Wait for room rather than fail when stopping with a full queue
+        self.queue.put(self._sentinel)
+
+def setup_logger(name="speedtest_logger", log_file="logs/speedtest.log", level=logging.INFO, debug_mode=False,
+                 queue_size=LOG_QUEUE_SIZE):
+    """Sets up the logger with log rotation, color-coded console output, and protocol tagging.
+
+    Logging threads only put records on a bounded queue; a QueueListener thread formats
+    them and writes the rotating file and the console. When the queue is full, records
+    are dropped and counted (logger.queue_handler.dropped) instead of stalling a probe.
+    """
+
+    os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
 
     # Formatter with protocol context
     formatter = logging.Formatter('%(asctime)s - %(levelname)s - [%(protocol)s] - %(message)s')
@@ -38,24 +75,38 @@ def setup_logger(name="speedtest_logger", log_file="logs/speedtest.log", level=l
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(color_formatter)
 
+    # Both handlers run on the listener thread, fed by a bounded queue
+    queue_handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+    listener = _Listener(queue_handler.queue, file_handler, console_handler)
+    listener.start()
+
     # Configure the logger
     logger = logging.getLogger(name)
     logger.setLevel(logging.DEBUG if debug_mode else level)
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    logger.addHandler(queue_handler)
+    logger.propagate = False
+    logger.queue_handler = queue_handler
+    logger.listener = listener
+
+    # Proper logging functions to include 'protocol'. The level check comes first, so
+    # disabled levels (debug by default) cost one comparison, and the record is built
+    # without a caller lookup, which the log format does not use.
+    def log(level, msg, protocol):
+        if logger.isEnabledFor(level):
+            logger.handle(logger.makeRecord(name, level, "(unknown file)", 0, msg, (), None,
+                                            extra={"protocol": protocol}))
 
-    # Proper logging functions to include 'protocol'
     def info(msg, protocol="TCP"):
-        logger._log(logging.INFO, msg, args=(), extra={"protocol": protocol})
+        log(logging.INFO, msg, protocol)
 
     def warning(msg, protocol="TCP"):
-        logger._log(logging.WARNING, msg, args=(), extra={"protocol": protocol})
+        log(logging.WARNING, msg, protocol)
 
     def error(msg, protocol="TCP"):
-        logger._log(logging.ERROR, msg, args=(), extra={"protocol": protocol})
+        log(logging.ERROR, msg, protocol)
 
     def debug(msg, protocol="TCP"):
-        logger._log(logging.DEBUG, msg, args=(), extra={"protocol": protocol})
+        log(logging.DEBUG, msg, protocol)
 
     # Replace original logging methods with protocol-aware versions
     logger.info = info
@@ -63,7 +114,23 @@ def setup_logger(name="speedtest_logger", log_file="logs/speedtest.log", level=l
     logger.error = error
     logger.debug = debug
 
+    atexit.register(stop_logger, logger)
     return logger
 
+def stop_logger(logger):
+    """Writes out the queued records and stops the listener thread; reports dropped records."""
+    listener = getattr(logger, "listener", None)
+    if listener is None:
+        return
+    logger.listener = None
+    listener.stop()
+    dropped = logger.queue_handler.dropped
+    if dropped:
+        record = logger.makeRecord(logger.name, logging.WARNING, __file__, 0,
+                                   f"⚠️ {dropped} log records were dropped because the log queue was full.",
+                                   (), None, extra={"protocol": "N/A"})
+        for handler in listener.handlers:
+            handler.handle(record)
+
 # Initialize the logger
-logger = setup_logger(debug_mode=False)
\ No newline at end of file
+logger = setup_logger(debug_mode=False)
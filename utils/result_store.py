@@ -0,0 +1,257 @@
+import argparse
+import glob
+import gzip
+import json
+import os
+import socket
+import sqlite3
+import time
+import zlib
+from datetime import datetime
+from urllib.parse import urlsplit
+from config.settings import RESULTS_DB, RESULTS_COMPACT_DAYS
+from utils.logger import logger
+
+# Summary figures kept in their own columns so range scans never decode the full results
+METRICS = ("download_tcp", "download_udp", "upload_tcp", "upload_udp",
+           "latency_tcp", "latency_udp", "latency_icmp",
+           "jitter_tcp", "jitter_udp", "jitter_icmp",
+           "packet_loss_tcp", "packet_loss_udp", "packet_loss_icmp",
+           "latency_under_load")
+DETAIL_KEYS = ("transfers", "bufferbloat", "profile")  # Bulky per-run detail dropped by compaction
+FILENAME_TIME_FORMAT = "speedtest_results_%Y-%m-%d_%H-%M-%S"
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    probe TEXT,
+    download_server TEXT,
+    upload_server TEXT,
+    {", ".join(f"{name} REAL" for name in METRICS)},
+    compacted INTEGER NOT NULL DEFAULT 0,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_ts ON runs (ts);
+CREATE INDEX IF NOT EXISTS runs_download_server_ts ON runs (download_server, ts);
+CREATE INDEX IF NOT EXISTS runs_upload_server_ts ON runs (upload_server, ts);
+"""
+_INSERT = (f"INSERT INTO runs (ts, probe, download_server, upload_server, {', '.join(METRICS)}, data) "
+           f"VALUES ({', '.join('?' * (len(METRICS) + 5))})")
+
+def _server_host(results, direction):
+    """The server a run measured against, from its results or its transfer records."""
+    server = results.get(f"{direction}_server")
+    if server:
+        return server
+    for protocol in ("tcp", "udp"):
+        for transfer in (results.get("transfers") or {}).get(f"{direction}_{protocol}", []):
+            if transfer.get("url"):
+                return urlsplit(transfer["url"]).hostname
+    return None
+
+def _number(value):
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+def _check_metrics(metrics):
+    unknown = set(metrics) - set(METRICS)
+    if unknown:
+        raise ValueError(f"Unknown metrics: {', '.join(sorted(unknown))}")
+
+def _encode(results):
+    return zlib.compress(json.dumps(results, separators=(",", ":")).encode("utf-8"))
+
+def _decode(blob):
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+class ResultStore:
+    """Append-only SQLite store of speed test runs, indexed by time and server.
+
+    Each run is one row: the summary metrics in their own columns for fast range
+    queries, plus the full results as compressed JSON.
+
+    Usage:
+        with ResultStore() as store:
+            store.insert(results)
+            last_week = store.query(start=time.time() - 7 * 86400)
+    """
+
+    def __init__(self, path=RESULTS_DB):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")  # Readers do not block a probe appending runs
+        self.db.executescript(_SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _row(self, results, ts, probe):
+        return ((ts if ts is not None else time.time()), probe or socket.gethostname(),
+                _server_host(results, "download"), _server_host(results, "upload"),
+                *(_number(results.get(name)) for name in METRICS), _encode(results))
+
+    def insert(self, results, ts=None, probe=None):
+        """Appends one run (ts defaults to now, probe to this host's name); returns its row id."""
+        with self.db:
+            cursor = self.db.execute(_INSERT, self._row(results, ts, probe))
+        return cursor.lastrowid
+
+    def insert_many(self, runs, probe=None):
+        """Appends (ts, results) pairs in a single transaction; returns the number inserted."""
+        rows = [self._row(results, ts, probe) for ts, results in runs]
+        with self.db:
+            self.db.executemany(_INSERT, rows)
+        return len(rows)
+
+    def _where(self, start, end, server, probe):
+        clauses, params = [], []
+        if start is not None:
+            clauses.append("ts >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("ts < ?")
+            params.append(end)
+        if server is not None:
+            clauses.append("(download_server = ? OR upload_server = ?)")
+            params += [server, server]
+        if probe is not None:
+            clauses.append("probe = ?")
+            params.append(probe)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def query(self, start=None, end=None, server=None, probe=None, metrics=METRICS, full=False, limit=None):
+        """Runs in [start, end) (Unix seconds), oldest first.
+
+        Args:
+            start: Earliest run time (inclusive), or None
+            end: Latest run time (exclusive), or None
+            server: Only runs against this download or upload server
+            probe: Only runs recorded by this probe
+            metrics: Summary columns to return
+            full: Also decode each run's full results under 'results'
+            limit: Return at most this many of the newest matching runs
+
+        Returns:
+            List of dicts with 'ts', 'probe', the servers and the requested metrics
+        """
+        _check_metrics(metrics)
+        columns = ["ts", "probe", "download_server", "upload_server", *metrics] + (["data"] if full else [])
+        where, params = self._where(start, end, server, probe)
+        sql = f"SELECT {', '.join(columns)} FROM runs{where} ORDER BY ts"
+        if limit is not None:
+            sql = f"SELECT * FROM ({sql} DESC LIMIT ?) ORDER BY ts"
+            params.append(limit)
+        rows = []
+        for row in self.db.execute(sql, params):
+            entry = dict(zip(columns, row))
+            if full:
+                entry["results"] = _decode(entry.pop("data"))
+            rows.append(entry)
+        return rows
+
+    def columns(self, metrics=METRICS, start=None, end=None, server=None, probe=None):
+        """Time stamps and metric values as parallel lists, for columnar analysis.
+
+        Returns:
+            Dictionary mapping 'ts' and each metric to a list (None where missing)
+        """
+        _check_metrics(metrics)
+        where, params = self._where(start, end, server, probe)
+        rows = self.db.execute(f"SELECT ts, {', '.join(metrics)} FROM runs{where} ORDER BY ts", params).fetchall()
+        values = list(zip(*rows)) if rows else [()] * (len(metrics) + 1)
+        return {name: list(column) for name, column in zip(("ts", *metrics), values)}
+
+    def count(self, start=None, end=None, server=None, probe=None):
+        where, params = self._where(start, end, server, probe)
+        return self.db.execute(f"SELECT COUNT(*) FROM runs{where}", params).fetchone()[0]
+
+    def compact(self, older_than_days=RESULTS_COMPACT_DAYS, vacuum=True):
+        """Drops the bulky per-run detail (interval series, bufferbloat phases) from old runs.
+
+        Summary metrics stay queryable; the space is reclaimed with VACUUM.
+
+        Returns:
+            Number of runs compacted
+        """
+        cutoff = time.time() - older_than_days * 86400
+        compacted = 0
+        with self.db:
+            rows = self.db.execute("SELECT id, data FROM runs WHERE ts < ? AND compacted = 0", (cutoff,)).fetchall()
+            for run_id, blob in rows:
+                results = _decode(blob)
+                for key in DETAIL_KEYS:
+                    results.pop(key, None)
+                self.db.execute("UPDATE runs SET data = ?, compacted = 1 WHERE id = ?", (_encode(results), run_id))
+                compacted += 1
+        if vacuum and compacted:
+            self.db.execute("VACUUM")
+        logger.info(f"🗜️ Compacted {compacted} runs older than {older_than_days} days in {self.path}")
+        return compacted
+
+def _file_timestamp(path, results):
+    """Run time of a legacy results file: its 'timestamp', else its name, else its mtime."""
+    stamp = results.get("timestamp")
+    if isinstance(stamp, str):
+        for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S"):
+            try:
+                return datetime.strptime(stamp, fmt).timestamp()
+            except ValueError:
+                pass
+    name = os.path.basename(path).split(".")[0]
+    try:
+        return datetime.strptime(name, FILENAME_TIME_FORMAT).timestamp()
+    except ValueError:
+        return os.path.getmtime(path)
+
+def import_json_files(paths, store, probe=None):
+    """One-time import of results files (.json or .json.gz) written by the file backend.
+
+    Returns:
+        (imported, skipped) counts
+    """
+    runs, skipped = [], 0
+    for path in paths:
+        try:
+            opener = gzip.open if path.endswith(".gz") else open
+            with opener(path, "rt", encoding="utf-8") as f:
+                results = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ Skipping {path}: {e}")
+            skipped += 1
+            continue
+        runs.append((_file_timestamp(path, results), results))
+    imported = store.insert_many(sorted(runs, key=lambda run: run[0]), probe=probe)
+    logger.info(f"✅ Imported {imported} results files into {store.path} ({skipped} skipped)")
+    return imported, skipped
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Speed test result store")
+    parser.add_argument("--db", default=RESULTS_DB, help="SQLite database file")
+    commands = parser.add_subparsers(dest="command", required=True)
+    importer = commands.add_parser("import", help="import .json/.json.gz results files")
+    importer.add_argument("paths", nargs="*", default=["results"], help="files or directories")
+    importer.add_argument("--probe", help="probe name to record (default: this host)")
+    compactor = commands.add_parser("compact", help="drop per-run detail from old runs")
+    compactor.add_argument("--older-than", type=float, default=RESULTS_COMPACT_DAYS, help="age in days")
+    args = parser.parse_args()
+
+    with ResultStore(args.db) as store:
+        if args.command == "import":
+            files = []
+            for path in args.paths:
+                if os.path.isdir(path):
+                    files += glob.glob(os.path.join(path, "*.json")) + glob.glob(os.path.join(path, "*.json.gz"))
+                else:
+                    files.append(path)
+            import_json_files(files, store, probe=args.probe)
+        else:
+            store.compact(args.older_than)
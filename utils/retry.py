@@ -1,49 +1,231 @@
+import asyncio
+import random
+import threading
 import time
 from functools import wraps
+from config.settings import (RETRY_TRIES, RETRY_DELAY, RETRY_MAX_DELAY, RETRY_JITTER, BREAKER_FAILURES,
+                             BREAKER_COOLDOWN)
 from utils.logger import logger
 
-def retry(exceptions, tries=3, delay=2, backoff=2, timeout=None, on_failure=None, protocol="TCP"):
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpen(ConnectionError):
+    """Raised instead of calling a server whose circuit breaker is open."""
+
+def breaker_key(protocol, host, port=None):
+    """Names one endpoint, e.g. 'tcp://iperf.he.net:5201' or 'icmp://8.8.8.8'."""
+    return f"{protocol}://{host}:{port}" if port is not None else f"{protocol}://{host}"
+
+class CircuitBreaker:
+    """Stops calling a server after repeated failures, until a trial call succeeds.
+
+    After failures consecutive failures the breaker opens and allow() refuses calls
+    for cooldown seconds. Then it turns half-open and lets exactly one trial through:
+    success closes it, failure opens it for another cooldown. A trial that ends
+    without a verdict (record(None), e.g. cancelled) leaves the next allow() free to
+    try again.
+    """
+
+    def __init__(self, name, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN, clock=time.monotonic):
+        self.name = name
+        self.failures = failures
+        self.cooldown = cooldown
+        self.clock = clock
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def available(self):
+        """Whether allow() would let a call through; does not take the half-open trial."""
+        with self._lock:
+            return self.state == CLOSED or (self.state == OPEN and self.clock() - self.opened_at >= self.cooldown)
+
+    def allow(self):
+        """Whether to call the server now; the first call after the cool-down is the half-open trial."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and self.clock() - self.opened_at >= self.cooldown:
+                self.state = HALF_OPEN
+                return True
+            return False
+
+    def record(self, success):
+        """Records a call's outcome: True, False, or None when it ended without a verdict."""
+        with self._lock:
+            if success:
+                if self.state != CLOSED:
+                    logger.info(f"✅ {self.name} answered again; circuit closed.")
+                self.state, self.consecutive_failures = CLOSED, 0
+            elif success is None:
+                if self.state == HALF_OPEN:
+                    self.state = OPEN  # Cool-down already over: the next allow() is a new trial
+            else:
+                self.consecutive_failures += 1
+                if self.state == HALF_OPEN or self.consecutive_failures >= self.failures:
+                    if self.state != OPEN:
+                        logger.warning(f"⚠️ {self.name} failed {self.consecutive_failures} times; "
+                                       f"skipping it for {self.cooldown:.0f}s.")
+                    self.state, self.opened_at = OPEN, self.clock()
+
+class Breakers:
+    """One CircuitBreaker per endpoint key, created on first use."""
+
+    def __init__(self, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN, clock=time.monotonic):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.clock = clock
+        self.breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            breaker = self.breakers.get(key)
+            if breaker is None:
+                breaker = self.breakers[key] = CircuitBreaker(key, self.failures, self.cooldown, self.clock)
+            return breaker
+
+_default_breakers = None
+_default_lock = threading.Lock()
+
+def default_breakers():
+    """The process-wide breakers shared by server selection and transfers."""
+    global _default_breakers
+    with _default_lock:
+        if _default_breakers is None:
+            _default_breakers = Breakers()
+        return _default_breakers
+
+def backoff_delays(tries=RETRY_TRIES, delay=RETRY_DELAY, backoff=2, max_delay=RETRY_MAX_DELAY, jitter=RETRY_JITTER,
+                   rng=random):
+    """The waits between tries attempts: exponential, capped at max_delay, each shortened
+    by a random share of up to jitter (1 is "full jitter") so clients do not retry in step."""
+    return [min(max_delay, delay * backoff ** i) * (1 - jitter * rng.random()) for i in range(tries - 1)]
+
+def _remaining(deadline):
+    return None if deadline is None else deadline - time.perf_counter()
+
+def retry_call(func, exceptions=(OSError,), tries=RETRY_TRIES, delay=RETRY_DELAY, backoff=2,
+               max_delay=RETRY_MAX_DELAY, jitter=RETRY_JITTER, deadline=None, breaker=None, rng=random):
+    """Calls func(remaining) until it returns, with jittered exponential backoff.
+
+    Args:
+        func: Called with the seconds left before deadline (None without one), so it can
+            bound its own timeout
+        exceptions: Exception types that cause a retry
+        tries: Total number of attempts
+        delay, backoff, max_delay, jitter: See backoff_delays()
+        deadline: time.perf_counter() value after which no attempt or wait starts
+        breaker: CircuitBreaker consulted before and told about every attempt
+
+    Raises:
+        CircuitOpen: The breaker refused the call
+        The last exception once the attempts, the deadline or the breaker run out
+    """
+    waits = backoff_delays(tries, delay, backoff, max_delay, jitter, rng) + [None]
+    for wait in waits:
+        if breaker and not breaker.allow():
+            raise CircuitOpen(f"{breaker.name} is skipped after repeated failures")
+        try:
+            result = func(_remaining(deadline))
+        except exceptions as e:
+            if breaker:
+                breaker.record(False)
+            remaining = _remaining(deadline)
+            if wait is None or (remaining is not None and remaining <= wait):
+                raise
+            logger.debug(f"Retrying in {wait:.2f}s after: {e}")
+            time.sleep(wait)
+            continue
+        if breaker:
+            breaker.record(True)
+        return result
+
+async def retry_async(func, exceptions=(OSError, asyncio.TimeoutError), tries=RETRY_TRIES, delay=RETRY_DELAY,
+                      backoff=2, max_delay=RETRY_MAX_DELAY, jitter=RETRY_JITTER, deadline=None, breaker=None,
+                      rng=random):
+    """retry_call() for coroutines: func(remaining) returns an awaitable, and each attempt
+    is also cancelled when the deadline passes."""
+    waits = backoff_delays(tries, delay, backoff, max_delay, jitter, rng) + [None]
+    for wait in waits:
+        if breaker and not breaker.allow():
+            raise CircuitOpen(f"{breaker.name} is skipped after repeated failures")
+        remaining = _remaining(deadline)
+        try:
+            if remaining is None:
+                result = await func(None)
+            else:
+                result = await asyncio.wait_for(func(remaining), max(remaining, 0))
+        except asyncio.CancelledError:
+            if breaker:
+                breaker.record(None)
+            raise
+        except exceptions as e:
+            if breaker:
+                breaker.record(False)
+            remaining = _remaining(deadline)
+            if wait is None or (remaining is not None and remaining <= wait):
+                raise
+            logger.debug(f"Retrying in {wait:.2f}s after: {e}")
+            await asyncio.sleep(wait)
+            continue
+        if breaker:
+            breaker.record(True)
+        return result
+
+def retry(exceptions, tries=3, delay=2, backoff=2, timeout=None, on_failure=None, protocol="TCP",
+          jitter=RETRY_JITTER, max_delay=RETRY_MAX_DELAY, breaker=None):
     """Retry decorator for handling transient errors with protocol awareness and timeout.
 
+    Works on plain functions and on coroutine functions.
+
     Args:
         exceptions: Exception types to catch.
         tries: Total number of retry attempts.
         delay: Initial delay between retries (in seconds).
         backoff: Factor to multiply delay after each failure.
-        timeout: Maximum total time to keep retrying (in seconds). Optional.
+        timeout: Overall budget for all attempts and waits (in seconds). Optional.
         on_failure: Optional callback function to execute after all retries fail.
         protocol: Protocol used in the operation (TCP/UDP/HTTP3).
+        jitter: Share of each wait that is randomized (1 is full jitter).
+        max_delay: Longest wait between retries (in seconds).
+        breaker: Optional CircuitBreaker for the server the function talks to.
 
     Usage:
         @retry((ConnectionError, TimeoutError), tries=3, protocol="UDP")
     """
+    exceptions = exceptions if isinstance(exceptions, tuple) else (exceptions,)
+    options = {"tries": tries, "delay": delay, "backoff": backoff, "max_delay": max_delay, "jitter": jitter,
+               "breaker": breaker}
+
+    def failed(func, e):
+        logger.error(f"{func.__name__} [{protocol}] failed after {tries} attempts: {e}")
+        if on_failure:
+            on_failure(e)
+
     def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                deadline = time.perf_counter() + timeout if timeout else None
+                try:
+                    return await retry_async(lambda remaining: func(*args, **kwargs), exceptions, deadline=deadline,
+                                             **options)
+                except exceptions + (CircuitOpen, asyncio.TimeoutError) as e:
+                    failed(func, e)
+                    return None
+            return async_wrapper
+
         @wraps(func)
         def wrapper(*args, **kwargs):
-            _tries, _delay = tries, delay
-            start_time = time.time()
-
-            while _tries > 1:
-                try:
-                    return func(*args, **kwargs)
-                except exceptions as e:
-                    elapsed_time = time.time() - start_time
-                    if timeout and elapsed_time > timeout:
-                        logger.error(f"{func.__name__} [{protocol}] timed out after {elapsed_time:.2f}s.")
-                        break
-
-                    logger.warning(f"{func.__name__} [{protocol}] failed: {e}. Retrying in {_delay}s...")
-                    time.sleep(_delay)
-                    _tries -= 1
-                    _delay *= backoff
-
-            # Final attempt
+            deadline = time.perf_counter() + timeout if timeout else None
             try:
-                return func(*args, **kwargs)
-            except exceptions as e:
-                logger.error(f"{func.__name__} [{protocol}] failed after {tries} attempts: {e}")
-                if on_failure:
-                    on_failure(e)
+                return retry_call(lambda remaining: func(*args, **kwargs), exceptions, deadline=deadline, **options)
+            except exceptions + (CircuitOpen,) as e:
+                failed(func, e)
                 return None
         return wrapper
-    return decorator
\ No newline at end of file
+    return decorator